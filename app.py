@@ -1,24 +1,157 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from excel_handler import ExcelHandler
+from workbook_registry import WorkbookRegistry
+from ingest_jobs import IngestJobs
+from workbook_watcher import WorkbookWatcher
+from result_cache import MISSING, RESULT_CACHE
+from static_assets import StaticAssets
+import http_cache
+import json
+import metrics
+import quote_export
 import os
+import tempfile
+import threading
+from time import perf_counter
 from werkzeug.utils import secure_filename
 
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider recording serialization time as the request's 'json' phase."""
+
+    def dumps(self, obj, **kwargs):
+        with metrics.timed('json'):
+            return super().dumps(obj, **kwargs)
+
+
 app = Flask(__name__, static_folder='frontend/dist')
+app.json = TimedJSONProvider(app)
 CORS(app)
+static_assets = StaticAssets(app.static_folder)
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_FOLDER = os.environ.get('SHP_UPLOAD_FOLDER') or os.path.join(BASE_DIR, 'uploads')
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 DEFAULT_EXCEL = '5.shipping cost based on summary.xlsx'
-current_handler = ExcelHandler(os.path.join(BASE_DIR, DEFAULT_EXCEL))
+# Parsed workbooks are immutable ExcelHandler snapshots registered by content
+# hash. Requests pick theirs with ?workbook=<id>; without one they get the
+# active workbook (the built-in one, or the latest upload/load-builtin);
+# /api/routes reports the id it served (X-Workbook-Id) for the UI to pin.
+# Workbooks and the active id are shared through WORKBOOK_DIR, so every
+# gunicorn worker serves the same workbook whichever one took the upload.
+WORKBOOK_DIR = os.path.join(UPLOAD_FOLDER, '.workbooks')
+registry = WorkbookRegistry(shared_dir=WORKBOOK_DIR)
+ingest_jobs = IngestJobs(registry, os.path.join(UPLOAD_FOLDER, '.jobs'))
+registry.load(os.path.join(BASE_DIR, DEFAULT_EXCEL), activate=True)
+# Workbooks overwritten on disk (the built-in one, files in uploads/) are
+# re-ingested in the background, recompiling only their changed sheets.
+# Started by the first request, so each gunicorn worker starts its own;
+# the lock file lets only one of them watch at a time.
+watcher = WorkbookWatcher(registry, ingest_jobs, [os.path.join(BASE_DIR, DEFAULT_EXCEL)], [UPLOAD_FOLDER],
+                          lock_path=os.path.join(WORKBOOK_DIR, 'WATCH.lock'))
+WATCH_WORKBOOKS = os.environ.get('SHP_WATCH', '1') != '0'
+# NDJSON file every JSON API request is appended to, for loadtest.py to replay
+RECORD_TRAFFIC = os.environ.get('SHP_RECORD_TRAFFIC')
+_record_lock = threading.Lock()
+
+
+def _scoped_handler():
+    """Handler for the request's ?workbook=<id>, the active one when no id is given."""
+    return registry.get(request.args.get('workbook') or None)
+
+
+def _unknown_workbook():
+    return jsonify({"error": f"Unknown workbook: {request.args.get('workbook')}"}), 404
+
+
+def _cached_json(kind, version, key, build, cache_body=True):
+    """
+    JSON response of build() tagged with an ETag of the workbook version it
+    depends on and the request key: 304 Not Modified when the client holds
+    that version already. The compressed body is kept in the result cache
+    under the same version, so a repeat is neither rebuilt nor recompressed.
+    """
+    if version is None:
+        return jsonify(build())
+    etag = http_cache.make_etag(kind, version, key)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        encoding = http_cache.choose_encoding(request.accept_encodings)
+        body_key = json.dumps([kind, key, encoding], default=str)
+        body = RESULT_CACHE.get('body', version, body_key) if cache_body else MISSING
+        if body is MISSING:
+            data = app.json.response(build()).get_data()
+            if encoding is not None and len(data) >= http_cache.MIN_COMPRESS_SIZE:
+                body = (http_cache.compress(data, encoding), encoding)
+            else:
+                body = (data, None)
+            if cache_body:
+                RESULT_CACHE.put('body', version, body_key, body)
+        response = Response(body[0], mimetype='application/json')
+        if body[1]:
+            response.headers['Content-Encoding'] = body[1]
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.before_request
+def _start_request():
+    if WATCH_WORKBOOKS:
+        watcher.start()
+    g.request_start = perf_counter()
+    g.timings, g.timings_token = metrics.start_timings()
+    metrics.IN_FLIGHT.inc()
+
+
+@app.after_request
+def _record_request(response):
+    """Record the request latency and phases, and report them in a Server-Timing header."""
+    elapsed = perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint, request.method, str(response.status_code))
+    entries = []
+    for phase, seconds in g.timings.phases.items():
+        metrics.PHASE_SECONDS.observe(seconds, phase)
+        entries.append(f"{phase};dur={seconds * 1000:.3f}")
+    entries.append(f"total;dur={elapsed * 1000:.3f}")
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+@app.after_request
+def _record_traffic(response):
+    if RECORD_TRAFFIC and request.path.startswith('/api/') and not request.files:
+        line = json.dumps({
+            "session": f"{request.remote_addr} {request.user_agent.string}",
+            "method": request.method,
+            "path": request.full_path.rstrip('?'),
+            "body": request.get_json(silent=True),
+        }, ensure_ascii=False, default=str)
+        with _record_lock, open(RECORD_TRAFFIC, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+    return response
+
+
+@app.after_request
+def _compress_response(response):
+    return http_cache.compress_response(response, request.accept_encodings)
+
+
+@app.teardown_request
+def _end_request(exc):
+    if 'timings_token' in g:
+        metrics.IN_FLIGHT.dec()
+        metrics.stop_timings(g.pop('timings_token'))
 
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    global current_handler
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
@@ -27,15 +160,48 @@ def upload_file():
     if file:
         filename = secure_filename(file.filename)
         filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
-        current_handler = ExcelHandler(filepath)
-        return jsonify({"message": f"Successfully loaded {filename}", "filename": filename})
+        # Publish a private temp copy, then move it into place atomically so a
+        # concurrent upload of the same name cannot change it under the parser
+        # (hidden, so the workbook watcher skips it)
+        fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_FOLDER, prefix='.upload-', suffix=os.path.splitext(filename)[1])
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                file.save(out)
+            job = ingest_jobs.submit(tmp_path, filename, upload_path=filepath)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # Parsing runs in the background; the current workbook serves until it is done
+        return jsonify(dict(job, message=f"Uploaded {filename}, compiling", status_url=f"/api/jobs/{job['id']}")), 202
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job)
 
 @app.route('/api/load-builtin', methods=['POST'])
 def load_builtin():
-    global current_handler
-    current_handler = ExcelHandler(os.path.join(BASE_DIR, DEFAULT_EXCEL))
-    return jsonify({"message": "Successfully loaded built-in workbook"})
+    workbook_id, _ = registry.load(os.path.join(BASE_DIR, DEFAULT_EXCEL), activate=True)
+    return jsonify({"message": "Successfully loaded built-in workbook", "workbook_id": workbook_id})
+
+@app.route('/api/workbooks', methods=['GET'])
+def list_workbooks():
+    return jsonify(registry.list())
+
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(RESULT_CACHE.stats())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format; counters live in this worker process only
+    workbooks = metrics.Gauge('shp_workbooks_loaded', 'Workbooks held by the registry.')
+    workbooks.set(len(registry.list()))
+    body = metrics.render(metrics.cache_metrics(RESULT_CACHE.stats()) + [workbooks])
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/download-builtin', methods=['GET'])
 def download_builtin():
@@ -48,22 +214,38 @@ def download_builtin():
 @app.route('/api/routes', methods=['GET'])
 def get_routes():
     try:
-        options = current_handler.get_route_options()
-        return jsonify(options)
+        # The id served is sent back so a page can pin it: later uploads by
+        # others then do not switch the workbook under it mid-session
+        wb_id = request.args.get('workbook') or registry.active()
+        handler = registry.get(wb_id)
+        if handler is None:
+            return _unknown_workbook()
+        response = _cached_json('routes', handler.content_hash, None, handler.get_route_options)
+        response.headers['X-Workbook-Id'] = wb_id
+        return response
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/fields', methods=['POST'])
+@app.route('/api/fields', methods=['GET', 'POST'])
 def get_fields():
     try:
-        data = request.json
+        # GET ?node=&location= is the cacheable form (ETag, 304)
+        data = request.args if request.method == 'GET' else request.json
         node = data.get('node')
         location = data.get('location')
         if not node or not location:
             return jsonify({"error": "Missing node or location"}), 400
+        # Optional choices made so far: only options still reachable are listed
+        inputs = (data.get('inputs') or None) if request.method == 'POST' else None
+        if inputs is not None and not isinstance(inputs, dict):
+            return jsonify({"error": "inputs must be an object"}), 400
         
-        fields = current_handler.get_node_fields(node, location)
-        return jsonify(fields)
+        handler = _scoped_handler()
+        if handler is None:
+            return _unknown_workbook()
+        # With inputs the facet lookup is cheaper than keeping its body
+        return _cached_json('fields', handler.cache_version(node), [node, location, inputs],
+                            lambda: handler.get_node_fields(node, location, inputs), cache_body=inputs is None)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -74,8 +256,147 @@ def calculate():
         if not isinstance(data, list):
             return jsonify({"error": "Expected a list of selections"}), 400
         
-        result = current_handler.calculate(data)
+        handler = _scoped_handler()
+        if handler is None:
+            return _unknown_workbook()
+        debug = request.args.get('debug', '').lower() in ('1', 'true', 'yes')
+        result = handler.calculate(data, debug=debug)
+        return jsonify(result)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/calculate-batch', methods=['POST'])
+def calculate_batch():
+    try:
+        data = request.json
+        scenarios = data.get('scenarios') if isinstance(data, dict) else data
+        if not isinstance(scenarios, list) or not all(isinstance(s, list) for s in scenarios):
+            return jsonify({"error": "Expected a list of selection lists"}), 400
+        
+        handler = _scoped_handler()
+        if handler is None:
+            return _unknown_workbook()
+        result = handler.calculate_batch(scenarios)
+        return jsonify(result)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/export', methods=['POST'])
+def export_quotes():
+    """
+    Price scenarios and stream the results as ?format=csv|ndjson|xlsx.
+
+    Send the scenarios as NDJSON (Content-Type: application/x-ndjson, one
+    list of selections per line) to keep memory flat however many there
+    are: lines are read and priced as the response is written. A JSON
+    list (or {"scenarios": [...]}) is also accepted, at the cost of
+    parsing it whole.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in quote_export.FORMATS:
+        return jsonify({"error": f"Unknown format: {fmt}"}), 400
+    handler = _scoped_handler()
+    if handler is None:
+        return _unknown_workbook()
+    if request.mimetype == 'application/x-ndjson':
+        items = quote_export.read_ndjson(request.stream)
+    else:
+        data = request.get_json(silent=True)
+        scenarios = data.get('scenarios') if isinstance(data, dict) else data
+        if not isinstance(scenarios, list):
+            return jsonify({"error": "Expected a list of selection lists"}), 400
+        items = ((scenario, None) for scenario in scenarios)
+    records = quote_export.quote_records(handler, items)
+
+    if fmt == 'xlsx':
+        # The zip is only complete once every row is written, so spool it to disk first
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            quote_export.write_xlsx(records, path)
+        except Exception:
+            os.remove(path)
+            raise
+        body = quote_export.file_chunks(path)
+    elif fmt == 'csv':
+        body = stream_with_context(quote_export.csv_chunks(records))
+    else:
+        body = stream_with_context(quote_export.ndjson_chunks(records))
+    return Response(body, mimetype=quote_export.FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename=quotes.{fmt}"})
+
+@app.route('/api/route-search', methods=['POST'])
+def route_search():
+    try:
+        data = request.json or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a search object"}), 400
+        origin = data.get('origin')
+        destination = data.get('destination')
+        if not origin or not destination:
+            return jsonify({"error": "Missing origin or destination"}), 400
+        if not isinstance(origin, str) or not isinstance(destination, str):
+            return jsonify({"error": "origin and destination must be location names"}), 400
+        inputs = data.get('inputs') or {}
+        if not isinstance(inputs, dict):
+            return jsonify({"error": "inputs must be an object"}), 400
+        max_legs = data.get('max_legs', 6)
+        if isinstance(max_legs, str) and max_legs.strip().isdigit():
+            max_legs = int(max_legs)
+        if isinstance(max_legs, bool) or not isinstance(max_legs, int) or max_legs < 1:
+            return jsonify({"error": "max_legs must be a positive integer"}), 400
+        handler = _scoped_handler()
+        if handler is None:
+            return _unknown_workbook()
+        result = handler.find_routes(origin, destination, inputs, max_legs)
         return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/lanes', methods=['POST'])
+def query_lanes():
+    try:
+        data = request.json or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a query object"}), 400
+        handler = _scoped_handler()
+        if handler is None:
+            return _unknown_workbook()
+        result = handler.query_lanes(data)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/sweep', methods=['POST'])
+def sweep():
+    try:
+        data = request.json or {}
+        if not isinstance(data, dict):
+            return jsonify({"error": "Expected a sweep object"}), 400
+        ranges = data.get('ranges')
+        if not isinstance(ranges, dict) or not ranges:
+            return jsonify({"error": "Expected ranges for PALLET QTY, CBM and/or G/W"}), 400
+        if not isinstance(data.get('inputs') or {}, dict):
+            return jsonify({"error": "inputs must be an object"}), 400
+        handler = _scoped_handler()
+        if handler is None:
+            return _unknown_workbook()
+        result = handler.sweep(data, ranges)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -85,10 +406,7 @@ def calculate():
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    return static_assets.send(path or 'index.html', request.accept_encodings)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
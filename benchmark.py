@@ -0,0 +1,182 @@
+"""
+Benchmarks of ExcelHandler on synthetic rate cards (see synthetic_workbook).
+
+    python benchmark.py                          # all scales, JSON to stdout
+    python benchmark.py --scale small -o new.json
+    python benchmark.py --compare old.json       # run and compare with a saved run
+
+Timings are the median of --repeat runs. Memoized results are disabled
+while timing, so get_node_fields and calculate measure the work rather
+than a cache lookup; 'calculate_cached' measures the cache hit path.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from excel_handler import ExcelHandler
+from result_cache import RESULT_CACHE
+from synthetic_workbook import generate_workbook
+
+# nodes x lanes x records two-row records over `columns` breakdown columns
+SCALES = {
+    'small': dict(nodes=6, lanes=3, records=4, columns=21),
+    'medium': dict(nodes=12, lanes=8, records=6, columns=30),
+    'large': dict(nodes=26, lanes=12, records=10, columns=60),
+}
+
+
+def _median_us(fn, repeat, calls=1):
+    """Median wall time of fn() in microseconds per call, over `repeat` runs of fn doing `calls` calls."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6 / calls)
+    return {"median_us": round(statistics.median(samples), 2), "min_us": round(min(samples), 2), "runs": repeat}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_scale(params, repeat, seed=0):
+    """Generate one synthetic workbook and time ExcelHandler on it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'rates.xlsx')
+        manifest = generate_workbook(path, seed=seed, **params)
+
+        def load():
+            return ExcelHandler(path, log_stdout=False, use_snapshot=False)
+
+        metrics = {"load": _median_us(load, repeat)}
+
+        tracemalloc.start()
+        handler = load()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Write the snapshot once, then time loading it
+        ExcelHandler(path, log_stdout=False, use_snapshot=True)
+        metrics["load_snapshot"] = _median_us(lambda: ExcelHandler(path, log_stdout=False, use_snapshot=True), repeat)
+
+        lanes = [(node, loc) for node, opts in handler.get_route_options().items() for loc in opts['locations']]
+        exact = [[sel] for sel in manifest['exact']]
+        partial = [[sel] for sel in manifest['partial']]
+
+        maxsize = RESULT_CACHE.maxsize
+        RESULT_CACHE.maxsize = 0
+        try:
+            metrics["get_route_options"] = _median_us(handler.get_route_options, repeat)
+            metrics["get_node_fields"] = _median_us(
+                lambda: [handler.get_node_fields(node, loc) for node, loc in lanes], repeat, len(lanes))
+            metrics["calculate_exact"] = _median_us(
+                lambda: [handler.calculate(sel) for sel in exact], repeat, len(exact))
+            metrics["calculate_partial"] = _median_us(
+                lambda: [handler.calculate(sel) for sel in partial], repeat, len(partial))
+        finally:
+            RESULT_CACHE.maxsize = maxsize
+        RESULT_CACHE.clear()
+        for sel in exact:
+            handler.calculate(sel)
+        metrics["calculate_cached"] = _median_us(
+            lambda: [handler.calculate(sel) for sel in exact], repeat, len(exact))
+        RESULT_CACHE.clear()
+
+        unmatched = sum(1 for sel in exact + partial if handler.calculate(sel)['node_results'][0].get('error'))
+        return {
+            "params": params,
+            "workbook": {
+                "bytes": os.path.getsize(path),
+                "records": sum(len(rows) for lanes in handler.lane_index.values() for rows in lanes.match_rows.values()),
+                "cells": sum(len(ws.values) for ws in handler.sheets.values()),
+                "lanes": len(lanes),
+                "unmatched": unmatched,
+            },
+            "metrics": metrics,
+            "memory": {"load_peak_bytes": peak, "retained_bytes": retained},
+        }
+
+
+def compare(old, new, threshold):
+    """Print metric ratios new/old per scale; returns the regressions beyond threshold."""
+    regressions = []
+    for scale, result in new['results'].items():
+        before = old.get('results', {}).get(scale)
+        if not before:
+            continue
+        print(f"{scale} ({old.get('commit')} -> {new.get('commit')})", file=sys.stderr)
+        rows = [(name, before['metrics'].get(name, {}).get('median_us'), m['median_us'])
+                for name, m in result['metrics'].items()]
+        rows += [(name, before['memory'].get(name), value) for name, value in result['memory'].items()]
+        for name, was, now in rows:
+            if not was:
+                continue
+            ratio = now / was
+            flag = ''
+            if ratio > threshold:
+                flag = '  REGRESSION'
+                regressions.append((scale, name, ratio))
+            print(f"  {name:<20} {was:>14,.1f} {now:>14,.1f} {ratio:>7.2f}x{flag}", file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ExcelHandler on synthetic rate cards")
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                        help="scale to run (repeatable), default all")
+    parser.add_argument('--nodes', type=int, help="custom scale: MAP nodes")
+    parser.add_argument('--lanes', type=int, default=3, help="custom scale: lanes per node")
+    parser.add_argument('--records', type=int, default=4, help="custom scale: records per lane")
+    parser.add_argument('--columns', type=int, default=21, help="custom scale: breakdown columns")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help="write the JSON results here instead of stdout")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help="new/old ratio reported as a regression (exit status 1)")
+    args = parser.parse_args(argv)
+
+    scales = {name: SCALES[name] for name in (args.scale or SCALES)}
+    if args.nodes:
+        scales = {'custom': dict(nodes=args.nodes, lanes=args.lanes, records=args.records, columns=args.columns)}
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    for name, params in scales.items():
+        print(f"benchmarking {name}: {params}", file=sys.stderr)
+        report['results'][name] = run_scale(params, args.repeat, args.seed)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
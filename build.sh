@@ -10,3 +10,6 @@ cd frontend
 npm install
 npm run build
 cd ..
+
+# Write .gz/.br variants of the bundle for static_assets to serve
+python static_assets.py frontend/dist
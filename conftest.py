@@ -0,0 +1,52 @@
+import os
+import zipfile
+
+import pytest
+from openpyxl.reader.workbook import WorkbookParser
+
+from excel_handler import ExcelHandler
+
+
+@pytest.fixture(scope='session')
+def builtin_xlsx():
+    """Path of the bundled rate-card workbook."""
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), '5.shipping cost based on summary.xlsx')
+
+
+@pytest.fixture(scope='module')
+def handler(builtin_xlsx):
+    return ExcelHandler(builtin_xlsx, log_stdout=False, use_snapshot=False)
+
+
+@pytest.fixture(scope='module')
+def selections(handler):
+    """One section per node: its first location with the first option of every field."""
+    selections = []
+    for node, opts in sorted(handler.get_route_options().items()):
+        location = opts['locations'][0]
+        fields = handler.get_node_fields(node, location)
+        inputs = {f['name']: f['options'][0] for f in fields}
+        selections.append({"node": node, "location": location, "inputs": inputs})
+    return selections
+
+
+@pytest.fixture
+def edited_copy(tmp_path):
+    """
+    edited_copy(path, sheet, old, new): copy of the workbook at path with the
+    first `old` in sheet's XML replaced by `new`; every other part is unchanged.
+    """
+    def edit(path, sheet, old, new, name='edited.xlsx'):
+        target = str(tmp_path / name)
+        with zipfile.ZipFile(path) as src, zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as dst:
+            parser = WorkbookParser(src, 'xl/workbook.xml')
+            parser.parse()
+            part = next(rel.target for ws, rel in parser.find_sheets() if ws.name == sheet)
+            for info in src.infolist():
+                data = src.read(info)
+                if info.filename == part:
+                    assert old.encode() in data, (sheet, old)
+                    data = data.replace(old.encode(), new.encode(), 1)
+                dst.writestr(info, data)
+        return target
+    return edit
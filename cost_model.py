@@ -0,0 +1,220 @@
+import re
+from openpyxl.utils import column_index_from_string
+
+from formula_engine import FormulaError, FormulaGraph, run_program
+
+PALLET, CBM, GW = 0, 1, 2
+QUANTITY_NAMES = ('PALLET QTY', 'CBM', 'G/W')
+
+SUM_RE = re.compile(r'SUM\(([A-Z]+)(\d+):([A-Z]+)(\d+)\)')
+MIN_RE = re.compile(r'MIN\s*(\d+(?:\.\d+)?)')
+BASE_RATE_RE = re.compile(r'(\d+(?:\.\d+)?)')
+
+
+def read_quantities(inputs):
+    """(pallet_qty, cbm, gw) from user inputs; raises ValueError for non-numeric values."""
+    pallet_qty = float(inputs.get('PALLET QTY', 0) or 0)
+    cbm = float(inputs.get('CBM', 0) or 0)
+    gw = float(inputs.get('G/W', 0) or inputs.get('GW', 0) or 0)
+    return pallet_qty, cbm, gw
+
+
+def parse_lead_time(lt):
+    """'18-21Days' -> (18, 21), '1Day' -> (1, 1); None when the text has no numbers."""
+    nums = re.findall(r'\d+', str(lt).strip())
+    if len(nums) == 1:
+        return int(nums[0]), int(nums[0])
+    elif len(nums) >= 2:
+        return int(nums[0]), int(nums[1])
+    return None
+
+
+class CompiledFormula:
+    """
+    A cell formula compiled into a function of the quantities by the
+    formula engine (see formula_engine.FormulaGraph): the input dependent
+    cells it reads are recomputed, everything else is folded to constants.
+    Formulas the engine does not support compile to a constant 0 with an
+    error.
+    """
+
+    __slots__ = ('text', 'fn', 'error', 'inputs', 'programs', 'key')
+
+    def __init__(self, text, programs=None, key=None, error=None, inputs=()):
+        self.text = text
+        self.programs = programs
+        self.key = key
+        self.fn = run_program(programs, key) if programs is not None else None
+        self.error = error
+        self.inputs = inputs
+
+    def __getstate__(self):
+        # Closures cannot be pickled: snapshots keep the sheet's programs and rebuild fn
+        return self.text, self.error, self.inputs, self.programs, self.key
+
+    def __setstate__(self, state):
+        self.text, self.error, self.inputs, self.programs, self.key = state
+        self.fn = run_program(self.programs, self.key) if self.programs is not None else None
+
+    def __call__(self, quantities):
+        if self.fn is None:
+            return 0
+        return float(self.fn(quantities))
+
+
+def input_columns(schema):
+    """Column -> quantity index of the PALLET QTY, CBM and G/W columns of a sheet."""
+    cols = {schema.pallet_col: PALLET, schema.cbm_col: CBM, schema.gw_col: GW}
+    cols.pop(None, None)
+    return cols
+
+
+def compile_formula(graph, key):
+    """Compile the formula of cell `key` of a FormulaGraph into a CompiledFormula."""
+    text = graph.ws.formulas[key]
+    try:
+        inputs = graph.compile(key)
+    except FormulaError as e:
+        return CompiledFormula(text, error=f"不支持的公式: {e}")
+    except Exception as e:
+        # Whatever the engine trips on stays an error of this cell, not of the workbook load
+        return CompiledFormula(text, error=f"公式编译失败: {e!r}")
+    return CompiledFormula(text, graph.programs, key, inputs=inputs)
+
+
+class MinRule:
+    """
+    'rate ... MIN minimum' text rule: max(rate * basis, minimum).
+
+    VENDOR-WAHL charges per CBM (rate * 7.8 * CBM) or per KG (rate * G/W);
+    everything else is charged per pallet (rate * PALLET QTY).
+    """
+
+    __slots__ = ('text', 'base_rate', 'minimum', 'basis', 'factor', 'label')
+
+    def __init__(self, cell_text, sheet_name):
+        self.text = cell_text
+        text = str(cell_text).upper()
+        min_match = MIN_RE.search(text)
+        base_match = BASE_RATE_RE.search(text)
+        self.minimum = float(min_match.group(1)) if min_match else None
+        self.base_rate = float(base_match.group(1)) if base_match else None
+        self.factor = 1
+        self.basis = PALLET
+        self.label = 'WAHL-Customer'
+        if sheet_name == 'VENDOR-WAHL':
+            self.label = 'VENDOR-WAHL'
+            if 'CBM' in text:
+                self.basis, self.factor, self.label = CBM, 7.8, 'VENDOR-WAHL CBM'
+            elif 'KG' in text:
+                self.basis, self.label = GW, 'VENDOR-WAHL KG'
+
+    def calculated(self, quantities):
+        if self.factor == 1:
+            return self.base_rate * quantities[self.basis]
+        return self.base_rate * self.factor * quantities[self.basis]
+
+    def describe(self, quantities):
+        if self.factor == 1:
+            return f"{self.label}: {self.base_rate} * {quantities[self.basis]} = {self.calculated(quantities)}"
+        return f"{self.label}: {self.base_rate} * {self.factor} * {quantities[self.basis]} = {self.calculated(quantities)}"
+
+    def __call__(self, quantities):
+        """Charged amount, or None when the text has no usable rate/MIN."""
+        if self.minimum is None or self.base_rate is None:
+            return None
+        return max(self.calculated(quantities), self.minimum)
+
+
+def has_min(val):
+    return bool(val) and 'MIN' in str(val).upper()
+
+
+class RowCostModel:
+    """E2E Cost of one record for partial matches, as ordered per-column terms."""
+
+    __slots__ = ('formula', 'terms', 'fallback', 'lead_time')
+
+    def __init__(self, formula, terms, fallback, lead_time):
+        self.formula = formula
+        self.terms = terms          # [(col, header, kind, payload)] or None when not a SUM
+        self.fallback = fallback    # cached cost used when the E2E formula is not a SUM
+        self.lead_time = lead_time
+
+
+class SheetCostModel:
+    """
+    Everything partial-match pricing needs from one sheet, compiled at load.
+
+    `formulas` and `min_rules` are keyed by (row, col); `rows` maps each
+    lane record row to its RowCostModel; `lead_times` maps lead-time text
+    to its parsed (min, max) days.
+    """
+
+    def __init__(self, ws, schema, spans, record_rows):
+        graph = FormulaGraph(ws, input_columns(schema))
+        self.formulas = {}
+        for key, formula in ws.formulas.items():
+            if isinstance(formula, str) and formula.startswith('='):
+                self.formulas[key] = compile_formula(graph, key)
+
+        self.min_rules = {}
+        for key, val in ws.values.items():
+            if isinstance(val, str) and has_min(val):
+                self.min_rules[key] = MinRule(val, schema.sheet_name)
+
+        self.lead_times = {}
+        if schema.e2e_lt_col:
+            for r in range(1, ws.max_row + 2):
+                lt = ws.value(r, schema.e2e_lt_col)
+                if lt:
+                    self.lead_times[str(lt).strip()] = parse_lead_time(lt)
+
+        self.rows = {}
+        if schema.e2e_cost_col and schema.e2e_lt_col:
+            for row in record_rows:
+                self.rows[row] = self._compile_row(ws, schema, spans.get(row))
+
+    def _compile_row(self, ws, schema, span):
+        row, value_row = span.first, span.value_row
+        e2e_cost_col = schema.e2e_cost_col
+        formula = ws.formula(row, e2e_cost_col)
+        terms = None
+        fallback = 0
+        range_match = None
+        if formula and isinstance(formula, str) and formula.startswith('='):
+            range_match = SUM_RE.fullmatch(formula[1:].replace('$', '').replace(' ', ''))
+        if range_match:
+            terms = []
+            start_col_idx = column_index_from_string(range_match.group(1))
+            end_col_idx = column_index_from_string(range_match.group(3))
+            for c in range(start_col_idx, end_col_idx + 1):
+                header_val = schema.titles.get(c)
+                if (row, c) in self.min_rules:
+                    terms.append((c, header_val, 'min', self.min_rules[(row, c)]))
+                elif (value_row, c) in self.formulas:
+                    terms.append((c, header_val, 'formula', self.formulas[(value_row, c)]))
+                else:
+                    row2_val = ws.value(value_row, c)
+                    if row2_val is None:
+                        continue
+                    try:
+                        terms.append((c, header_val, 'value', float(row2_val)))
+                    except (ValueError, TypeError):
+                        pass
+        elif self.formulas.get((row, e2e_cost_col)) is not None and self.formulas[(row, e2e_cost_col)].inputs:
+            # Any other formula over the quantities is priced by the formula engine as a whole
+            terms = [(e2e_cost_col, schema.titles.get(e2e_cost_col), 'formula', self.formulas[(row, e2e_cost_col)])]
+        else:
+            fallback = span.cost
+        return RowCostModel(formula, terms, fallback, span.lead_time)
+
+
+def is_date_format(val):
+    """Check if value looks like a date/days format"""
+    if not val:
+        return False
+    s = str(val).lower().strip()
+    has_numbers = bool(re.search(r'\d', s))
+    has_day = 'day' in s or 'days' in s
+    return has_numbers and has_day
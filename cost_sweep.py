@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+
+from cost_model import QUANTITY_NAMES
+
+MAX_SWEEP_POINTS = int(os.environ.get('SHP_SWEEP_MAX_POINTS', 100000))
+
+
+def axis_values(spec):
+    """
+    Values of one swept quantity: a list of numbers, or {start, stop, step}
+    (stop included when it falls on a step) or {start, stop, num}.
+    """
+    if isinstance(spec, list):
+        try:
+            values = np.asarray(spec, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("Sweep values must be numbers")
+    elif isinstance(spec, dict):
+        try:
+            start = float(spec['start'])
+            stop = float(spec['stop'])
+            num = int(spec['num']) if 'num' in spec else None
+            step = float(spec.get('step', 1))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("A sweep range needs numeric start and stop, and step or num")
+        if num is not None:
+            if num > MAX_SWEEP_POINTS:
+                raise ValueError(f"Sweep is limited to {MAX_SWEEP_POINTS} points")
+            values = np.linspace(start, stop, num)
+        else:
+            if step <= 0:
+                raise ValueError("step must be positive")
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            if count > MAX_SWEEP_POINTS:
+                raise ValueError(f"Sweep is limited to {MAX_SWEEP_POINTS} points")
+            values = start + step * np.arange(max(count, 0))
+    else:
+        raise ValueError("A sweep range is a list of values or {start, stop, step|num}")
+    if values.ndim != 1 or not len(values):
+        raise ValueError("A sweep range needs at least one value")
+    return values
+
+
+def build_grid(ranges, fixed):
+    """
+    The input grid: axes {name: values} for the swept quantities, in
+    PALLET QTY, CBM, G/W order, and the (pallet, cbm, gw) arrays of every
+    grid point, flattened in C order. Quantities not swept keep `fixed`.
+    """
+    unknown = set(ranges) - set(QUANTITY_NAMES)
+    if unknown:
+        raise ValueError(f"Only {', '.join(QUANTITY_NAMES)} can be swept, got: {', '.join(sorted(unknown))}")
+    axes = {name: axis_values(ranges[name]) for name in QUANTITY_NAMES if name in ranges}
+    points = int(np.prod([len(v) for v in axes.values()])) if axes else 1
+    if points > MAX_SWEEP_POINTS:
+        raise ValueError(f"Sweep is limited to {MAX_SWEEP_POINTS} points, got {points}")
+    mesh = dict(zip(axes, (m.ravel() for m in np.meshgrid(*axes.values(), indexing='ij')))) if axes else {}
+    quantities = tuple(mesh.get(name, np.full(points, fixed[i], dtype=float)) for i, name in enumerate(QUANTITY_NAMES))
+    return axes, quantities
+
+
+def sweep_cost(model, quantities):
+    """
+    E2E Cost of a RowCostModel at every grid point in one vectorized pass.
+
+    Terms are added in column order like _calculate_with_formula, so each
+    point equals the scalar result; formulas failing at a point (division
+    by zero) contribute 0 there, as they do in the scalar path.
+    """
+    points = len(quantities[0])
+    if model.terms is None:
+        return np.full(points, float(model.fallback or 0))
+    total = np.zeros(points)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for _, _, kind, payload in model.terms:
+            if kind == 'min':
+                if payload.minimum is None or payload.base_rate is None:
+                    continue
+                contribution = np.maximum(payload.calculated(quantities), payload.minimum)
+            elif kind == 'formula':
+                if payload.fn is None:
+                    continue
+                contribution = np.asarray(payload.fn(quantities), dtype=float)
+                contribution = np.where(np.isfinite(contribution), contribution, 0.0)
+            else:
+                contribution = payload
+            total = total + contribution
+    return total
+
+
+def min_breakpoints(model, axes):
+    """
+    Where each MIN rule of the record switches: the rule charges its
+    minimum while rate * factor * quantity < minimum, so it switches off at
+    quantity = minimum / (rate * factor).
+    """
+    breakpoints = []
+    for c, header, kind, rule in model.terms or ():
+        if kind != 'min' or rule.minimum is None or rule.base_rate is None:
+            continue
+        name = QUANTITY_NAMES[rule.basis]
+        per_unit = rule.base_rate * rule.factor
+        threshold = rule.minimum / per_unit if per_unit > 0 else None
+        in_range = False
+        if name in axes and threshold is not None:
+            in_range = axes[name].min() <= threshold <= axes[name].max()
+        breakpoints.append({
+            "column": header,
+            "rule": rule.text,
+            "quantity": name,
+            "threshold": threshold,
+            "minimum": rule.minimum,
+            "in_range": bool(in_range),
+        })
+    return breakpoints
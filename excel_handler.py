@@ -1,63 +1,213 @@
-import pandas as pd
-import openpyxl
-from openpyxl.utils import get_column_letter
-import re
 import traceback
+import json
 import os
 from datetime import datetime
+from time import perf_counter
+from lane_index import LaneIndex, PARTIAL_SKIP_FIELDS, summary_name
+from lane_table import LaneTable
+from record_spans import RecordSpans
+from sheet_schema import SheetSchema
+from workbook_loader import load_sheets
+from cost_model import QUANTITY_NAMES, SheetCostModel, parse_lead_time, read_quantities
+from cost_sweep import build_grid, min_breakpoints, sweep_cost
+from snapshot_cache import file_digest, load_snapshot, save_snapshot
+from result_cache import MISSING, RESULT_CACHE
+from route_search import RouteGraph, search_routes
+from metrics import LOAD_SECONDS, timed
+
+ERROR, INFO, TRACE = 40, 20, 10
+LOG_LEVELS = {'ERROR': ERROR, 'INFO': INFO, 'TRACE': TRACE}
+# Nearest records returned with a no-match result
+SUGGESTION_LIMIT = int(os.environ.get('SHP_SUGGESTIONS', 3))
+
+class CalcContext:
+    """
+    Per-request state of one calculation: the collected log lines and the
+    log settings. Kept off ExcelHandler so concurrent requests sharing a
+    handler never see each other's logs.
+    """
+
+    def __init__(self, log_level=INFO, log_stdout=True, collect=False):
+        self.log_level = log_level
+        self.log_stdout = log_stdout
+        self.collect = collect
+        self.logs = []
+
+    def enabled(self, level):
+        return self.collect or (self.log_stdout and level >= self.log_level)
+
+    def log(self, msg, *args, level=INFO):
+        """
+        Record a log line. Formatting of msg % args is deferred until the
+        line is actually wanted: collected for a debug response (all levels)
+        or printed to stdout (levels at or above log_level).
+        """
+        echo = self.log_stdout and level >= self.log_level
+        if not (self.collect or echo):
+            return
+        if args:
+            msg = msg % args
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"[{timestamp}] {msg}"
+        if self.collect:
+            self.logs.append(log_entry)
+        if echo:
+            print(log_entry)
 
 class ExcelHandler:
-    def __init__(self, file_path):
+    SHEETS = ['WAHL-Customer', 'VENDOR-WAHL', 'WAHL-DGWA']
+    # Compiled attributes persisted by snapshot_cache
+    SNAPSHOT_STATE = ('sheets', 'schemas', 'record_spans', 'cost_models', 'lt_ranges', 'lane_index',
+                      'route_options_cache', 'lane_table')
+
+    def __init__(self, file_path, log_level=None, log_stdout=None, use_snapshot=None, previous=None):
+        """
+        log_level: minimum level ('ERROR', 'INFO', 'TRACE') printed to stdout,
+            defaults to $SHP_LOG_LEVEL or INFO.
+        log_stdout: print log lines to stdout, defaults to $SHP_LOG_STDOUT != '0'.
+        use_snapshot: load/save the compiled workbook in the on-disk snapshot
+            cache (see snapshot_cache), defaults to $SHP_SNAPSHOT_CACHE != '0'.
+        previous: handler of an earlier version of the workbook. Sheets whose
+            content is unchanged reuse its parsed and compiled state; only
+            the others are parsed and compiled (listed in self.recompiled).
+        """
         self.file_path = file_path
         self.target_green_rgb = '92D050'
-        self.logs = []
+        self.log_level = LOG_LEVELS[(log_level or os.environ.get('SHP_LOG_LEVEL', 'INFO')).upper()]
+        if log_stdout is None:
+            log_stdout = os.environ.get('SHP_LOG_STDOUT', '1') != '0'
+        self.log_stdout = log_stdout
+        if use_snapshot is None:
+            use_snapshot = os.environ.get('SHP_SNAPSHOT_CACHE', '1') != '0'
+        self.load_error = None
+        self.recompiled = []
+        ctx = self.new_context()
         try:
-            self.wb = openpyxl.load_workbook(self.file_path, data_only=True)
-            self.wb_formula = openpyxl.load_workbook(self.file_path, data_only=False)
-            self._log(f"Loaded workbook: {file_path}")
+            self.content_hash = file_digest(file_path)
+        except OSError:
+            self.content_hash = None    # reported by _build
+
+        state = None
+        if use_snapshot and self.content_hash:
+            start = perf_counter()
+            state = load_snapshot(file_path, self.content_hash)
+            if state is not None:
+                LOAD_SECONDS.observe(perf_counter() - start, 'snapshot')
+                ctx.log("Loaded workbook snapshot: %s", file_path)
+        if state is None:
+            state = self._build(ctx, previous)
+            if use_snapshot and self.content_hash and state['sheets']:
+                save_snapshot(file_path, self.content_hash, state)
+        # After __init__ the handler is never mutated, so one instance can be
+        # shared by concurrent requests as a snapshot.
+        self.__dict__.update(state)
+        self.route_graph = RouteGraph(self.lane_index)
+
+    def _build(self, ctx, previous=None):
+        """Parse the xlsx and compile it; returns the state a snapshot stores."""
+        start = perf_counter()
+        try:
+            self.sheets = load_sheets(self.file_path, self.SHEETS, previous.sheets if previous else None)
+            ctx.log("Loaded workbook: %s", self.file_path)
         except Exception as e:
-            self._log(f"Error loading workbook {file_path}: {e}")
-            self.wb = None
-            self.wb_formula = None
-        self.route_options_cache = None
+            ctx.log("Error loading workbook %s: %s", self.file_path, e, level=ERROR)
+            self.sheets = {}
+            self.load_error = str(e)
+        LOAD_SECONDS.observe(perf_counter() - start, 'read')
+        self.schemas = {}
+        self.record_spans = {}
+        self.cost_models = {}
+        self.lt_ranges = {}
+        self.lane_index = self._compile_sheets(previous)
+        if previous is not None:
+            ctx.log("Recompiled sheets: %s", ', '.join(self.recompiled) or 'none')
+        for record in self.unclassified_records():
+            ctx.log("Unclassified record: %s row %s: %s", record['sheet'], record['row'], record['reason'])
+        self.route_options_cache = self._build_route_options()
+        self.lane_table = LaneTable(self.sheets, self.schemas, self.lane_index, self.record_spans, self.lt_ranges)
+        return {name: getattr(self, name) for name in self.SNAPSHOT_STATE}
 
-    def _log(self, msg):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_entry = f"[{timestamp}] {msg}"
-        self.logs.append(log_entry)
-        print(log_entry)
+    def new_context(self, debug=False):
+        """Request-local log state for one calculate/calculate_batch call."""
+        return CalcContext(self.log_level, self.log_stdout, collect=debug)
+
+    def _compile_sheets(self, previous=None):
+        """
+        Compile every priced sheet into a SheetSchema, RecordSpans, LaneIndex
+        and cost model once, at load time. Sheets load_sheets returned unchanged from
+        `previous` take its compiled state as is.
+        """
+        index = {}
+        seconds = {'headers': 0, 'index': 0, 'compile': 0}
+        for sheet_name in self.SHEETS:
+            if sheet_name not in self.sheets: continue
+            ws = self.sheets[sheet_name]
+            if previous is not None and previous.sheets.get(sheet_name) is ws:
+                self.schemas[sheet_name] = previous.schemas[sheet_name]
+                if sheet_name in previous.lane_index:
+                    self.record_spans[sheet_name] = previous.record_spans[sheet_name]
+                    index[sheet_name] = previous.lane_index[sheet_name]
+                    self.cost_models[sheet_name] = previous.cost_models[sheet_name]
+                    self.lt_ranges.update(self.cost_models[sheet_name].lead_times)
+                continue
+            self.recompiled.append(sheet_name)
+            start = perf_counter()
+            schema = SheetSchema(ws)
+            self.schemas[sheet_name] = schema
+            seconds['headers'] += perf_counter() - start
+            if not schema.map_col: continue
+            start = perf_counter()
+            spans = RecordSpans(ws, schema)
+            self.record_spans[sheet_name] = spans
+            lanes = LaneIndex(ws, schema, spans)
+            index[sheet_name] = lanes
+            seconds['index'] += perf_counter() - start
+            start = perf_counter()
+            records = [r for rows in lanes.match_rows.values() for r in rows]
+            self.cost_models[sheet_name] = SheetCostModel(ws, schema, spans, records)
+            self.lt_ranges.update(self.cost_models[sheet_name].lead_times)
+            seconds['compile'] += perf_counter() - start
+        for phase, value in seconds.items():
+            LOAD_SECONDS.observe(value, phase)
+        return index
 
     def get_route_options(self):
-        if self.route_options_cache:
-            return self.route_options_cache
-        
-        if not self.wb: return {}
+        return self.route_options_cache
+
+    def unclassified_records(self):
+        """Records whose rows RecordSpans could not classify, with the reading used, per sheet."""
+        return [dict(record, sheet=sheet_name)
+                for sheet_name, spans in self.record_spans.items() for record in spans.unclassified]
+
+    def cache_versions(self):
+        """Every version this handler's results are cached under, see cache_version."""
+        return {self.content_hash} | {ws.digest for ws in self.sheets.values()}
+
+    def cache_version(self, node):
+        """
+        Result cache version of a node's results: the content digest of the
+        sheet pricing it, so they stay cached across a reload that left that
+        sheet unchanged. Nodes no sheet prices use the workbook hash.
+        """
+        sheet_name = self._get_sheet_for_node(node)
+        if sheet_name:
+            return self.sheets[sheet_name].digest
+        return self.content_hash
+
+    def _build_route_options(self):
+        if not self.sheets: return {}
             
-        sheets = ['WAHL-Customer', 'VENDOR-WAHL', 'WAHL-DGWA']
         options = {}
         
-        for sheet_name in sheets:
-            if sheet_name not in self.wb.sheetnames: continue
-            ws = self.wb[sheet_name]
-            header_row, map_col, from_col, to_col = self._find_header_info(ws)
-            if not map_col: continue
-            
-            for r in range(header_row + 1, ws.max_row + 1):
-                node_val = ws.cell(r, map_col).value
-                if node_val is None: continue
-                
-                node = str(node_val).strip()
-                frm = str(ws.cell(r, from_col).value).strip() if from_col and ws.cell(r, from_col).value else ""
-                to = str(ws.cell(r, to_col).value).strip() if to_col and ws.cell(r, to_col).value else ""
+        for sheet_name, lanes in self.lane_index.items():
+            for node, frm, to in lanes.rows:
+                if node not in options:
+                    options[node] = {'locations': [], 'details': [], 'sheet': sheet_name}
                 
-                if node:
-                    if node not in options:
-                        options[node] = {'locations': [], 'details': [], 'sheet': sheet_name}
-                    
-                    loc_str = f"{frm} -> {to}"
-                    if loc_str not in options[node]['locations']:
-                        options[node]['locations'].append(loc_str)
-                        options[node]['details'].append({"from": frm, "to": to})
+                loc_str = f"{frm} -> {to}"
+                if loc_str not in options[node]['locations']:
+                    options[node]['locations'].append(loc_str)
+                    options[node]['details'].append({"from": frm, "to": to})
         
         for node in options:
             options[node]['locations'].sort()
@@ -77,182 +227,396 @@ class ExcelHandler:
                     options['E']['details'].append({"from": "WADG", "to": "WAHL"})
                 options['E']['locations'].sort()
             
-        self.route_options_cache = options
         return options
 
-    def get_node_fields(self, node, location_str):
+    def get_node_fields(self, node, location_str, inputs=None):
+        """
+        Field options of a lane. With inputs (the choices made so far), only
+        options that still lead to an existing record are listed.
+        """
+        if inputs:
+            # A facet lookup costs less than building a cache key for it
+            return self._node_fields(node, location_str, inputs)
+        key = json.dumps([node, location_str], default=str)
+        version = self.cache_version(node)
+        fields = RESULT_CACHE.get('fields', version, key)
+        if fields is MISSING:
+            fields = self._node_fields(node, location_str)
+            RESULT_CACHE.put('fields', version, key, fields)
+        return fields
+
+    def _node_fields(self, node, location_str, inputs=None):
         sheet_name = self._get_sheet_for_node(node)
         if not sheet_name: return []
         
-        ws = self.wb[sheet_name]
-        header_row, _, _, to_col = self._find_header_info(ws)
-        summary_col = self._get_col_by_header(ws, header_row, 'SUMMARY')
-        if not summary_col or not to_col: return []
+        schema = self.schemas[sheet_name]
+        if not schema.summary_col or not schema.to_col: return []
 
-        matching_rows = []
         loc_parts = [s.strip() for s in location_str.split('->')]
         if len(loc_parts) != 2: return []
         frm_target, to_target = loc_parts
         
-        _, map_col_idx, from_col_idx, to_col_idx = self._find_header_info(ws)
-        
-        for r in range(header_row + 1, ws.max_row + 1):
-            row_node = str(ws.cell(r, map_col_idx).value).strip() if ws.cell(r, map_col_idx).value else ""
-            row_frm = str(ws.cell(r, from_col_idx).value).strip() if ws.cell(r, from_col_idx).value else ""
-            row_to = str(ws.cell(r, to_col_idx).value).strip() if ws.cell(r, to_col_idx).value else ""
-            
-            if row_node == node and row_frm == frm_target and row_to == to_target:
-                matching_rows.append(r)
+        return self.lane_index[sheet_name].facet_options(node, frm_target, to_target, inputs)
 
-        if not matching_rows: return []
-
-        fields = []
-        for c in range(to_col + 1, summary_col + 1):
-            title = ws.cell(header_row, c).value
-            if not title: continue
-            
-            display_title = "Shipping method" if title == "SUMMARY" else title
-            unique_values = set()
-            for r in matching_rows:
-                val = ws.cell(r, c).value
-                if val is not None and str(val).strip().upper() != "N/A" and str(val).strip() != "":
-                    if title == "SUMMARY":
-                        if val == 'A': val = 'Ocean'
-                        elif val == 'B': val = 'Air'
-                        elif val == 'C': val = 'Land'
-                    unique_values.add(val)
-            
-            if unique_values:
-                fields.append({
-                    "name": title,
-                    "display_name": display_title,
-                    "options": sorted(list(unique_values))
-                })
-        
-        return fields
+    def calculate(self, selections, debug=False):
+        """
+        Price a list of selections and sum their cost and lead time.
 
-    def calculate(self, selections):
-        self.logs = []
+        With debug=True the full trace is collected and returned as "logs".
+        """
+        ctx = self.new_context(debug)
         results = []
         total_cost = 0
         all_lt_strings = []
         
-        self._log("=" * 60)
-        self._log("CALCULATION START")
-        self._log("=" * 60)
+        ctx.log("=" * 60)
+        ctx.log("CALCULATION START")
+        ctx.log("=" * 60)
         
         try:
             for idx, sel in enumerate(selections):
-                node = sel.get('node')
-                location = sel.get('location')
-                inputs = sel.get('inputs', {})
-                
-                self._log(f"\n--- SECTION {idx+1} ---")
-                self._log(f"User Selection: Node={node}, Location={location}")
-                self._log(f"User Inputs: {inputs}")
-                
-                if not node or not location: 
-                    self._log("ERROR: Missing node or location")
+                result = self._price_section(ctx, idx, sel)
+                if result is None:
                     continue
-                
-                sheet_name = self._get_sheet_for_node(node)
-                if not sheet_name: 
-                    self._log(f"ERROR: No sheet found for node {node}")
-                    continue
-                
-                self._log(f"Using sheet: {sheet_name}")
-                    
-                ws = self.wb[sheet_name]
-                ws_formula = self.wb_formula[sheet_name]
-                header_row, map_col, from_col, to_col = self._find_header_info(ws)
-                self._log(f"Header row: {header_row}, MAP col: {map_col}, From col: {from_col}, To col: {to_col}")
-                
-                frm_target, to_target = [s.strip() for s in location.split('->')]
-                self._log(f"Looking for: From='{frm_target}', To='{to_target}'")
-                
-                target_row = None
-                # Try exact match first
-                for r in range(header_row + 1, ws.max_row + 1):
-                    if self._row_matches_exact(ws, r, header_row, map_col, from_col, to_col, node, frm_target, to_target, inputs):
-                        target_row = r
-                        self._log(f"EXACT MATCH found at row {r}")
-                        break
-                
-                if target_row:
-                    cost, lt_str, breakdown, log_details = self._extract_data_from_row(ws, ws_formula, sheet_name, target_row, header_row, inputs)
-                    results.append({"node": node, "cost": cost, "lt": lt_str, "breakdown": breakdown})
-                    total_cost += cost
-                    if lt_str:
-                        all_lt_strings.append(str(lt_str))
-                    self._log(f"Extracted: Cost={cost}, LT='{lt_str}'")
-                else:
-                    # Try partial match (ignore PALLET QTY, CBM, G/W)
-                    self._log("No exact match, trying partial match (ignoring PALLET QTY, CBM, G/W)...")
-                    for r in range(header_row + 1, ws.max_row + 1):
-                        match_result = self._row_matches_partial(ws, r, header_row, map_col, from_col, to_col, node, frm_target, to_target, inputs)
-                        if match_result:
-                            target_row = r
-                            self._log(f"PARTIAL MATCH found at row {r}")
-                            break
-                    
-                    if target_row:
-                        # Calculate cost using formula with user inputs
-                        cost, lt_str, breakdown, log_details = self._calculate_with_formula(ws, ws_formula, sheet_name, target_row, header_row, inputs)
-                        results.append({"node": node, "cost": cost, "lt": lt_str, "breakdown": breakdown})
-                        total_cost += cost
-                        if lt_str:
-                            all_lt_strings.append(str(lt_str))
-                        self._log(f"Calculated (formula): Cost={cost}, LT='{lt_str}'")
-                    else:
-                        self._log(f"ERROR: No match found")
-                        results.append({"node": node, "cost": 0, "lt": "", "breakdown": None, "error": f"未找到匹配: {frm_target} -> {to_target}"})
-                        
+                results.append(result)
+                total_cost += result["cost"]
+                if result["lt"]:
+                    all_lt_strings.append(str(result["lt"]))
+
         except Exception as e:
-            self._log(f"EXCEPTION: {str(e)}")
-            self._log(traceback.format_exc())
+            ctx.log("EXCEPTION: %s", e, level=ERROR)
+            ctx.log("%s", traceback.format_exc(), level=ERROR)
 
-        total_lt = self._aggregate_lt(all_lt_strings)
+        total_lt = self._aggregate_lt(ctx, all_lt_strings)
         
-        self._log("\n" + "=" * 60)
-        self._log(f"TOTAL COST: {total_cost}")
-        self._log(f"TOTAL LT: {total_lt}")
-        self._log(f"LT Components: {all_lt_strings}")
-        self._log("=" * 60)
+        ctx.log("\n" + "=" * 60)
+        ctx.log("TOTAL COST: %s", total_cost)
+        ctx.log("TOTAL LT: %s", total_lt)
+        ctx.log("LT Components: %s", all_lt_strings, level=TRACE)
+        ctx.log("=" * 60)
 
-        return {
+        result = {
             "node_results": results,
             "total_cost": total_cost,
-            "total_lt": total_lt,
-            "logs": self.logs
+            "total_lt": total_lt
         }
+        if debug:
+            result["logs"] = ctx.logs
+        return result
+
+    def _price_section(self, ctx, idx, sel):
+        """Match and price one selection; None when the selection is skipped."""
+        node = sel.get('node')
+        location = sel.get('location')
+        inputs = sel.get('inputs', {})
+        
+        ctx.log("\n--- SECTION %s ---", idx + 1)
+        ctx.log("User Selection: Node=%s, Location=%s", node, location)
+        ctx.log("User Inputs: %s", inputs)
+
+        key = self._section_key(sel)
+        version = self.cache_version(node)
+        if ctx.collect:
+            # A debug response carries the full matching trace, so it is always
+            # recomputed; the result still serves later plain requests
+            result = self._match_section(ctx, node, location, inputs)
+            RESULT_CACHE.put('section', version, key, result)
+            return result
+        result = RESULT_CACHE.get('section', version, key)
+        if result is MISSING:
+            result = self._match_section(ctx, node, location, inputs)
+            RESULT_CACHE.put('section', version, key, result)
+        elif result is not None:
+            ctx.log("Cached result: Cost=%s, LT='%s'", result["cost"], result["lt"])
+        return result
+
+    def _match_section(self, ctx, node, location, inputs):
+        if not node or not location: 
+            ctx.log("ERROR: Missing node or location", level=ERROR)
+            return None
+        
+        sheet_name = self._get_sheet_for_node(node)
+        if not sheet_name: 
+            ctx.log("ERROR: No sheet found for node %s", node, level=ERROR)
+            return None
+        
+        ctx.log("Using sheet: %s", sheet_name)
+            
+        ws = self.sheets[sheet_name]
+        schema = self.schemas[sheet_name]
+        ctx.log("Header row: %s, MAP col: %s, From col: %s, To col: %s",
+                  schema.header_row, schema.map_col, schema.from_col, schema.to_col, level=TRACE)
+        
+        frm_target, to_target = [s.strip() for s in location.split('->')]
+        ctx.log("Looking for: From='%s', To='%s'", frm_target, to_target, level=TRACE)
+        
+        lanes = self.lane_index[sheet_name]
+        # Try exact match first
+        with timed('match'):
+            target_row = lanes.find_exact(node, frm_target, to_target, inputs)
+        if target_row:
+            ctx.log("EXACT MATCH found at row %s", target_row)
+            cost, lt_str, breakdown, log_details = self._extract_data_from_row(ctx, ws, schema, target_row, inputs)
+            ctx.log("Extracted: Cost=%s, LT='%s'", cost, lt_str)
+            return {"node": node, "cost": cost, "lt": lt_str, "breakdown": breakdown}
+        
+        # Try partial match (ignore PALLET QTY, CBM, G/W)
+        ctx.log("No exact match, trying partial match (ignoring PALLET QTY, CBM, G/W)...", level=TRACE)
+        with timed('match'):
+            target_row = lanes.find_partial(node, frm_target, to_target, inputs)
+        if target_row:
+            ctx.log("PARTIAL MATCH found at row %s", target_row)
+            # Calculate cost using formula with user inputs
+            cost, lt_str, breakdown, log_details = self._calculate_with_formula(ctx, ws, schema, target_row, inputs)
+            ctx.log("Calculated (formula): Cost=%s, LT='%s'", cost, lt_str)
+            return {"node": node, "cost": cost, "lt": lt_str, "breakdown": breakdown}
+        
+        ctx.log("ERROR: No match found", level=ERROR)
+        with timed('suggest'):
+            suggestions = lanes.nearest(node, frm_target, to_target, inputs, SUGGESTION_LIMIT)
+        for suggestion in suggestions:
+            ctx.log("Nearest row %s differs in: %s", suggestion["row"],
+                    [m["field"] for m in suggestion["mismatches"]], level=TRACE)
+        return {"node": node, "cost": 0, "lt": "", "breakdown": None, "error": f"未找到匹配: {frm_target} -> {to_target}",
+                "suggestions": suggestions}
+
+    def calculate_batch(self, scenarios):
+        """
+        Price many selection lists (scenarios) in one call.
+
+        Identical (node, location, inputs) sections are priced once and
+        shared between scenarios. Each scenario returns the ids of its
+        sections with its total cost and aggregated lead time; breakdowns
+        are returned once per unique section.
+        """
+        ctx = self.new_context()
+        sections = []
+        section_ids = {}
+        lt_ranges = []
+        scenario_results = []
+        
+        for selections in scenarios:
+            ids = []
+            total_cost = 0
+            total_min = total_max = 0
+            for sel in selections:
+                key = self._section_key(sel)
+                sid = section_ids.get(key)
+                if sid is None:
+                    sid = len(sections)
+                    section_ids[key] = sid
+                    result = self._price_batch_section(ctx, sel)
+                    sections.append(result)
+                    lt = str(result["lt"]).strip() if result and result["lt"] else ""
+                    lt_ranges.append(self.lt_ranges.get(lt) or parse_lead_time(lt) if lt else None)
+                result = sections[sid]
+                if result is None:
+                    continue
+                ids.append(sid)
+                total_cost += result["cost"]
+                if lt_ranges[sid]:
+                    total_min += lt_ranges[sid][0]
+                    total_max += lt_ranges[sid][1]
+            scenario_results.append({
+                "sections": ids,
+                "total_cost": total_cost,
+                "total_lt": self._format_lt(total_min, total_max)
+            })
+        
+        return {
+            "scenarios": scenario_results,
+            "sections": [dict(result, id=sid) for sid, result in enumerate(sections) if result is not None],
+            "unique_sections": len(sections)
+        }
+
+    def quote_scenario(self, selections, ctx=None):
+        """
+        Price one scenario for streaming exports. Unlike calculate, every
+        selection keeps its place: sections is [(selection, result or None)].
+        Holds nothing between calls; repeated sections across scenarios are
+        served from the result cache.
+        """
+        ctx = ctx or self.new_context()
+        sections = []
+        total_cost = total_min = total_max = 0
+        for sel in selections:
+            result = self._price_batch_section(ctx, sel)
+            sections.append((sel, result))
+            if result is None:
+                continue
+            total_cost += result["cost"]
+            lt = str(result["lt"]).strip() if result["lt"] else ""
+            lt_range = self.lt_ranges.get(lt) or parse_lead_time(lt) if lt else None
+            if lt_range:
+                total_min += lt_range[0]
+                total_max += lt_range[1]
+        return {"sections": sections, "total_cost": total_cost, "total_lt": self._format_lt(total_min, total_max)}
+
+    def _section_key(self, sel):
+        if not isinstance(sel, dict):
+            return ("", "", json.dumps(sel, sort_keys=True, default=str))
+        return (sel.get('node'), sel.get('location'), json.dumps(sel.get('inputs', {}), sort_keys=True, default=str))
+
+    def _price_batch_section(self, ctx, sel):
+        try:
+            if not isinstance(sel, dict):
+                raise ValueError("Expected a selection object")
+            result = self._price_section(ctx, 0, sel)
+            if result is not None and not isinstance(result["cost"], (int, float)):
+                raise ValueError(f"Non-numeric cost: {result['cost']}")
+            return result
+        except Exception as e:
+            node = sel.get('node') if isinstance(sel, dict) else None
+            return {"node": node, "cost": 0, "lt": "", "breakdown": None, "error": str(e)}
+
+    def find_routes(self, origin, destination, inputs=None, max_legs=6):
+        """
+        Search the lane graph for routes from origin to destination.
+
+        Each leg is priced like a calculate section: every record of the lane
+        that agrees with the non-quantity inputs (e.g. SUMMARY, Truck size) is
+        priced with the input PALLET QTY/CBM/G/W. Returns the cost/lead-time
+        Pareto frontier ordered by cost, with the cheapest and the fastest
+        (shortest maximum lead time) of those routes.
+        """
+        inputs = inputs or {}
+        for location in (origin, destination):
+            if location not in self.route_graph.locations:
+                raise ValueError(f"Unknown location: {location}")
+        ctx = CalcContext(self.log_level, log_stdout=False)
+        routes, expanded = search_routes(self.route_graph, origin, destination,
+                                         lambda leg: self._leg_options(ctx, leg, inputs), max_legs)
+        routes = [{
+            "legs": list(route.legs),
+            "total_cost": route.cost,
+            "total_lt": self._format_lt(route.lt_min, route.lt_max),
+            "lt_days": [route.lt_min, route.lt_max],
+        } for route in routes]
+        return {
+            "origin": origin,
+            "destination": destination,
+            "cheapest": routes[0] if routes else None,
+            "fastest": min(routes, key=lambda r: (r["lt_days"][1], r["lt_days"][0], r["total_cost"])) if routes else None,
+            "pareto": routes,
+            "labels_expanded": expanded,
+        }
+
+    def query_lanes(self, params):
+        """
+        Lane records of every priced sheet filtered, sorted and paginated
+        (see LaneTable.query). Each record's inputs select it in calculate.
+        """
+        with timed('match'):
+            return self.lane_table.query(params)
+
+    def _leg_options(self, ctx, leg, inputs):
+        """Priced alternatives of a leg as (cost, lt_min, lt_max, leg dict)."""
+        sheet_name, node, frm, to, rows = leg
+        ws = self.sheets[sheet_name]
+        schema = self.schemas[sheet_name]
+        location = f"{frm} -> {to}"
+        options = []
+        seen = set()
+        for r in rows:
+            sel_inputs = self._record_inputs(ws, schema, r, inputs)
+            if sel_inputs is None:
+                continue
+            key = json.dumps(sel_inputs, sort_keys=True, default=str)
+            if key in seen:
+                continue
+            seen.add(key)
+            result = self._price_section(ctx, 0, {"node": node, "location": location, "inputs": sel_inputs})
+            if not result or result.get("error") or not isinstance(result["cost"], (int, float)):
+                continue
+            lt = str(result["lt"]).strip() if result["lt"] else ""
+            lt_range = (self.lt_ranges.get(lt) or parse_lead_time(lt) if lt else None) or (0, 0)
+            options.append((result["cost"], lt_range[0], lt_range[1], {
+                "node": node, "location": location, "sheet": sheet_name, "inputs": sel_inputs,
+                "cost": result["cost"], "lt": result["lt"],
+            }))
+        return options
+
+    def _record_inputs(self, ws, schema, row, inputs):
+        """
+        Calculate inputs selecting the record at `row`, with the quantities
+        taken from `inputs`; None when the record contradicts another input.
+        """
+        sel_inputs = {}
+        spans = self.record_spans[schema.sheet_name]
+        for c, title in schema.field_cols:
+            val = spans.field_value(ws, row, c)
+            if val is None or str(val).strip().upper() in ('', 'N/A'):
+                continue
+            if title == 'SUMMARY':
+                val = summary_name(val)
+            want = inputs.get(title)
+            if want is None and title == 'G/W':
+                want = inputs.get('GW')
+            if want is None or str(want).strip() == '':
+                pass
+            elif title in PARTIAL_SKIP_FIELDS:
+                val = want
+            elif str(val).strip() != str(want).strip():
+                return None
+            sel_inputs[title] = val
+        return sel_inputs
+
+    def sweep(self, selection, ranges):
+        """
+        Cost curve of one selection over a grid of PALLET QTY/CBM/G/W values.
 
-    def _is_date_format(self, val):
-        """Check if value looks like a date/days format"""
-        if not val:
-            return False
-        s = str(val).lower().strip()
-        has_numbers = bool(re.search(r'\d', s))
-        has_day = 'day' in s or 'days' in s
-        return has_numbers and has_day
+        The record is found like a partial match (every field except the
+        quantities) and its cost model is evaluated for the whole grid at
+        once; `cost` is flattened in C order over `axes`. Also returns where
+        each MIN rule of the record switches on or off.
+        """
+        node = selection.get('node')
+        location = selection.get('location')
+        inputs = selection.get('inputs') or {}
+        sheet_name = self._get_sheet_for_node(node) if node else None
+        if not sheet_name or not location or '->' not in location:
+            raise ValueError("Missing or unknown node/location")
+        frm_target, to_target = [s.strip() for s in location.split('->', 1)]
+        row = self.lane_index[sheet_name].find_partial(node, frm_target, to_target, inputs)
+        model = self.cost_models[sheet_name].rows.get(row) if row else None
+        if model is None:
+            raise ValueError(f"未找到匹配: {frm_target} -> {to_target}")
+
+        fixed = read_quantities(inputs)
+        axes, quantities = build_grid(ranges, fixed)
+        with timed('formula'):
+            cost = sweep_cost(model, quantities)
+        self.new_context().log("Sweep: Node=%s, Location=%s, row %s, %s points", node, location, row, len(cost))
+        return {
+            "node": node,
+            "location": location,
+            "lt": model.lead_time,
+            "axes": {name: values.tolist() for name, values in axes.items()},
+            "shape": [len(values) for values in axes.values()],
+            "fixed": {name: fixed[i] for i, name in enumerate(QUANTITY_NAMES) if name not in axes},
+            "cost": cost.tolist(),
+            "breakpoints": min_breakpoints(model, axes),
+        }
 
-    def _aggregate_lt(self, lt_strings):
+    def _aggregate_lt(self, ctx, lt_strings):
         total_min = 0
         total_max = 0
         
         for lt in lt_strings:
             if not lt: continue
             s = str(lt).strip()
-            self._log(f"  Parsing LT: '{s}'")
-            nums = re.findall(r'\d+', s)
-            self._log(f"    Found numbers: {nums}")
-            if len(nums) == 1:
-                val = int(nums[0])
-                total_min += val
-                total_max += val
-            elif len(nums) >= 2:
-                total_min += int(nums[0])
-                total_max += int(nums[1])
+            if s in self.lt_ranges:
+                lt_range = self.lt_ranges[s]
+            else:
+                lt_range = parse_lead_time(s)
+            ctx.log("  Parsing LT: '%s' -> %s", s, lt_range, level=TRACE)
+            if lt_range:
+                total_min += lt_range[0]
+                total_max += lt_range[1]
         
+        return self._format_lt(total_min, total_max)
+
+    def _format_lt(self, total_min, total_max):
         if total_min == 0 and total_max == 0:
             return "N/A"
         elif total_min == total_max:
@@ -260,454 +624,118 @@ class ExcelHandler:
         else:
             return f"{total_min}-{total_max} Days"
 
-    def _find_header_info(self, ws):
-        for r in range(1, 6):
-            row_values = []
-            for c in range(1, min(ws.max_column + 1, 30)):
-                row_values.append(ws.cell(r, c).value)
-            
-            if 'MAP' in row_values:
-                map_col = from_col = to_col = None
-                for idx, val in enumerate(row_values):
-                    if val == 'MAP': map_col = idx + 1
-                    elif val == 'From': from_col = idx + 1
-                    elif val == 'To': to_col = idx + 1
-                return r, map_col, from_col, to_col
-        return 2, None, None, None
-
     def _get_sheet_for_node(self, node):
         options = self.get_route_options()
         return options.get(node, {}).get('sheet')
 
-    def _row_matches_exact(self, ws, r, header_row, map_col, from_col, to_col, node, frm, to, inputs):
-        """Check if row matches exactly including all input fields."""
-        node_cell = ws.cell(r, map_col).value
-        if not node_cell: return False
-        if str(node_cell).strip() != node: return False
-        
-        frm_cell = ws.cell(r, from_col).value
-        if not frm_cell or str(frm_cell).strip() != frm: return False
-
-        to_cell = ws.cell(r, to_col).value
-        if not to_cell or str(to_cell).strip() != to: return False
-        
-        for field, val in inputs.items():
-            if not val or str(val).lower() == 'n/a': continue
-            
-            col = self._get_col_by_header(ws, header_row, field)
-            if col:
-                row_val = ws.cell(r, col).value
-                if row_val is None:
-                    row_val = ws.cell(r+1, col).value
-
-                input_val = val
-                if field == 'SUMMARY':
-                    input_val = 'A' if val == 'Ocean' else ('B' if val == 'Air' else 'C')
-                
-                if str(row_val).strip() != str(input_val).strip():
-                    return False
-        return True
-
-    def _row_matches_partial(self, ws, r, header_row, map_col, from_col, to_col, node, frm, to, inputs):
-        """Check if row matches, ignoring PALLET QTY, CBM, G/W fields.
-        Stricter logic: if user didn't input a field but Excel has a value, fail.
-        """
-        node_cell = ws.cell(r, map_col).value
-        if not node_cell: return False
-        if str(node_cell).strip() != node: return False
-        
-        frm_cell = ws.cell(r, from_col).value
-        if not frm_cell or str(frm_cell).strip() != frm: return False
-
-        to_cell = ws.cell(r, to_col).value
-        if not to_cell or str(to_cell).strip() != to: return False
-        
-        # Skip these fields for partial matching
-        skip_fields = ['PALLET QTY', 'CBM', 'G/W', 'GW']
-        
-        self._log(f"  检查第 {r} 行的部分匹配")
-        
-        # Get all field columns from Excel (between 'To' and 'SUMMARY')
-        summary_col = self._get_col_by_header(ws, header_row, 'SUMMARY')
-        to_col_idx = self._get_col_by_header(ws, header_row, 'To')
-        
-        if not summary_col or not to_col_idx:
-            self._log(f"    错误：找不到 SUMMARY 或 To 列")
-            return False
-        
-        # Iterate through each field column
-        for c in range(to_col_idx + 1, summary_col + 1):
-            field_header = ws.cell(header_row, c).value
-            if not field_header:
-                continue
-            
-            # Skip the special fields
-            if field_header in skip_fields:
-                self._log(f"    字段 '{field_header}': 在跳过列表中，跳过")
-                continue
-            
-            # Get Excel value from row (check both merged rows)
-            excel_val = ws.cell(r, c).value
-            if excel_val is None:
-                excel_val = ws.cell(r + 1, c).value
-            
-            # Get user input value
-            user_val = inputs.get(field_header)
-            
-            # Handle SUMMARY field special conversion
-            if field_header == 'SUMMARY' and user_val:
-                user_val_converted = 'A' if user_val == 'Ocean' else ('B' if user_val == 'Air' else 'C')
-            else:
-                user_val_converted = user_val
-            
-            # Check logic:
-            # 1. User didn't input (empty/None)
-            if not user_val or str(user_val).strip() == '':
-                # Excel has a value (not empty/N/A) → FAIL
-                if excel_val and str(excel_val).strip() not in ['', 'N/A']:
-                    self._log(f"    字段 '{field_header}': 用户未输入，Excel 为 '{excel_val}' - 失败")
-                    return False
-                else:
-                    self._log(f"    字段 '{field_header}': 用户未输入，Excel 也为空 - 跳过")
-            # 2. User did input
-            else:
-                # Excel is empty/N/A but user has input → FAIL (stricter matching)
-                if not excel_val or str(excel_val).strip() in ['', 'N/A']:
-                    self._log(f"    字段 '{field_header}': Excel 为空，但用户输入='{user_val}' - 失败")
-                    return False
-                
-                # Normal match check
-                if str(excel_val).strip() != str(user_val_converted).strip():
-                    self._log(f"    字段 '{field_header}': 不匹配 - Excel='{excel_val}', 用户='{user_val}' - 失败")
-                    return False
-                else:
-                    self._log(f"    字段 '{field_header}': 匹配 - Excel='{excel_val}', 用户='{user_val}' - 成功")
-        
-        self._log(f"  第 {r} 行部分匹配成功")
-        return True
-
-    def _get_col_by_header(self, ws, header_row, header_name):
-        for c in range(1, ws.max_column + 1):
-            if ws.cell(header_row, c).value == header_name:
-                return c
-        return None
+    def _quantities(self, inputs):
+        """(pallet_qty, cbm, gw) for a section, or the ValueError raised while reading them."""
+        try:
+            return read_quantities(inputs)
+        except ValueError as e:
+            return e
 
-    def _parse_min_value(self, cell_text, sheet_name, inputs):
-        """
-        Parse MIN logic from cell text.
-        Returns calculated value based on MIN rules.
-        """
-        if not cell_text or 'MIN' not in str(cell_text).upper():
-            return None
-            
-        text = str(cell_text).upper()
-        self._log(f"  Parsing MIN in: '{cell_text}'")
-        
-        # Extract MIN value
-        min_match = re.search(r'MIN\s*(\d+(?:\.\d+)?)', text)
-        if not min_match:
-            return None
-        min_val = float(min_match.group(1))
-        
-        # Extract base rate (number before MIN)
-        base_match = re.search(r'(\d+(?:\.\d+)?)', text)
-        if not base_match:
+    def _apply_min_rule(self, ctx, rule, quantities):
+        """Evaluate a compiled MIN rule, logging the comparison."""
+        if isinstance(quantities, ValueError):
+            raise quantities
+        ctx.log("  Parsing MIN in: '%s'", rule.text, level=TRACE)
+        result = rule(quantities)
+        if result is None:
             return None
-        base_rate = float(base_match.group(1))
-        
-        pallet_qty = float(inputs.get('PALLET QTY', 0) or 0)
-        cbm = float(inputs.get('CBM', 0) or 0)
-        gw = float(inputs.get('G/W', 0) or inputs.get('GW', 0) or 0)
-        
-        calculated = 0
-        
-        if sheet_name == 'VENDOR-WAHL':
-            if 'CBM' in text:
-                calculated = base_rate * 7.8 * cbm
-                self._log(f"    VENDOR-WAHL CBM: {base_rate} * 7.8 * {cbm} = {calculated}")
-            elif 'KG' in text:
-                calculated = base_rate * gw
-                self._log(f"    VENDOR-WAHL KG: {base_rate} * {gw} = {calculated}")
-            else:
-                calculated = base_rate * pallet_qty
-        else:  # WAHL-Customer
-            calculated = base_rate * pallet_qty
-            self._log(f"    WAHL-Customer: {base_rate} * {pallet_qty} = {calculated}")
-        
-        result = max(calculated, min_val)
-        self._log(f"    Compare: calculated={calculated}, MIN={min_val}, result={result}")
+        if ctx.enabled(TRACE):
+            ctx.log("    %s", rule.describe(quantities), level=TRACE)
+            ctx.log("    Compare: calculated=%s, MIN=%s, result=%s",
+                      rule.calculated(quantities), rule.minimum, result, level=TRACE)
         return result
 
-    def _evaluate_cell_formula(self, ws, ws_formula, formula, row, header_row, inputs, sheet_name):
-        """Evaluate a cell formula, replacing references to PALLET QTY, CBM, G/W with user inputs."""
-        if not formula or not isinstance(formula, str):
+    def _apply_formula(self, ctx, compiled, quantities):
+        """Evaluate a compiled cell formula; unsupported or failing formulas count as 0."""
+        if compiled.error:
+            ctx.log("      %s", compiled.error, level=TRACE)
+            return 0
+        if isinstance(quantities, ValueError):
+            ctx.log("      公式计算错误: %s", quantities, level=TRACE)
             return 0
-        
         try:
-            # Get user input values
-            pallet_qty = float(inputs.get('PALLET QTY', 0) or 0)
-            cbm = float(inputs.get('CBM', 0) or 0)
-            gw = float(inputs.get('G/W', 0) or inputs.get('GW', 0) or 0)
-            
-            # Get column indices for user input fields
-            pallet_col = self._get_col_by_header(ws, header_row, 'PALLET QTY')
-            cbm_col = self._get_col_by_header(ws, header_row, 'CBM')
-            gw_col = self._get_col_by_header(ws, header_row, 'G/W')
-            
-            # Simple formula parsing for common patterns like =A1*B2, =A1+B2, =A1
-            formula_str = formula[1:]  # Remove leading '='
-            
-            # Find all cell references (e.g., A1, AB12)
-            cell_refs = re.findall(r'([A-Z]+)(\d+)', formula_str)
-            
-            result_str = formula_str
-            
-            for col_letter, row_num in cell_refs:
-                col_idx = openpyxl.utils.column_index_from_string(col_letter)
-                ref_row = int(row_num)
-                
-                # Check if this reference is to a user input column
-                if col_idx == pallet_col:
-                    val = pallet_qty
-                    self._log(f"      替换 {col_letter}{row_num} (PALLET QTY) = {val}")
-                elif col_idx == cbm_col:
-                    val = cbm
-                    self._log(f"      替换 {col_letter}{row_num} (CBM) = {val}")
-                elif col_idx == gw_col:
-                    val = gw
-                    self._log(f"      替换 {col_letter}{row_num} (G/W) = {val}")
-                else:
-                    # Get value from Excel
-                    val = ws.cell(ref_row, col_idx).value
-                    if val is None:
-                        val = 0
-                    try:
-                        val = float(val)
-                    except (ValueError, TypeError):
-                        val = 0
-                
-                # Replace cell reference with value
-                result_str = result_str.replace(f"{col_letter}{row_num}", str(val), 1)
-            
-            # Evaluate the expression
-            # Only allow safe characters
-            safe_chars = set('0123456789.+-*/() ')
-            if all(c in safe_chars for c in result_str):
-                result = eval(result_str)
-                return float(result)
-            else:
-                self._log(f"      不安全的公式表达式: {result_str}")
-                return 0
-                
-        except Exception as e:
-            self._log(f"      公式计算错误: {e}")
+            return compiled(quantities)
+        except (ArithmeticError, ValueError) as e:
+            ctx.log("      公式计算错误: %s", e, level=TRACE)
             return 0
 
-    def _calculate_with_formula(self, ws, ws_formula, sheet_name, row, header_row, inputs):
-        """Calculate E2E Cost using formula with user inputs for partial match."""
-        e2e_cost_col = self._get_col_by_header(ws, header_row, 'E2E Cost')
-        e2e_lt_col = self._get_col_by_header(ws, header_row, 'E2E Lead Time')
-        
-        self._log(f"Calculating with formula at row {row}")
+    def _calculate_with_formula(self, ctx, ws, schema, row, inputs):
+        """Calculate E2E Cost using the row's compiled cost model with user inputs for partial match."""
+        model = self.cost_models[schema.sheet_name].rows[row]
+        quantities = self._quantities(inputs)
         
-        # Get the formula from the cell
-        formula_cell = ws_formula.cell(row, e2e_cost_col)
-        formula = formula_cell.value
-        self._log(f"Formula: {formula}")
+        ctx.log("Calculating with formula at row %s", row, level=TRACE)
+        ctx.log("Formula: %s", model.formula, level=TRACE)
         
-        total_cost = 0
-        
-        # If formula is SUM(range), parse and calculate each cell
-        if formula and isinstance(formula, str) and formula.startswith('=SUM'):
-            # Extract range like N30:AG30
-            range_match = re.search(r'SUM\(([A-Z]+)(\d+):([A-Z]+)(\d+)\)', formula)
-            if range_match:
-                start_col = range_match.group(1)
-                start_row = int(range_match.group(2))
-                end_col = range_match.group(3)
-                end_row = int(range_match.group(4))
-                
-                start_col_idx = openpyxl.utils.column_index_from_string(start_col)
-                end_col_idx = openpyxl.utils.column_index_from_string(end_col)
-                
-                self._log(f"SUM range: {start_col}{start_row} to {end_col}{end_row}")
-                
-                for c in range(start_col_idx, end_col_idx + 1):
-                    # Get value from both rows of merged cell
-                    row1_val = ws.cell(row, c).value
-                    row2_val = ws.cell(row + 1, c).value
-                    header_val = ws.cell(header_row, c).value
-                    
-                    # Check if row2 cell has a formula
-                    formula_val = ws_formula.cell(row + 1, c).value
-                    
-                    cell_contribution = 0
-                    
-                    # Check if row1 contains MIN logic
-                    if row1_val and 'MIN' in str(row1_val).upper():
-                        cell_contribution = self._parse_min_value(row1_val, sheet_name, inputs) or 0
-                    # Check if row2 has a formula that references other cells
-                    elif formula_val and isinstance(formula_val, str) and formula_val.startswith('='):
-                        cell_contribution = self._evaluate_cell_formula(ws, ws_formula, formula_val, row, header_row, inputs, sheet_name)
-                        self._log(f"    Col {c} ({header_val}): 公式={formula_val}, 计算值={cell_contribution}")
-                    elif row2_val is not None:
-                        # Use row2 value directly if it's a number
-                        try:
-                            cell_contribution = float(row2_val)
-                        except (ValueError, TypeError):
-                            cell_contribution = 0
+        with timed('formula'):
+            if model.terms is None:
+                total_cost = model.fallback
+            else:
+                total_cost = 0
+                for c, header_val, kind, payload in model.terms:
+                    if kind == 'min':
+                        cell_contribution = self._apply_min_rule(ctx, payload, quantities) or 0
+                    elif kind == 'formula':
+                        cell_contribution = self._apply_formula(ctx, payload, quantities)
+                        ctx.log("    Col %s (%s): 公式=%s, 计算值=%s", c, header_val, payload.text, cell_contribution, level=TRACE)
+                    else:
+                        cell_contribution = payload
                     
                     if cell_contribution > 0:
-                        self._log(f"    Col {c} ({header_val}): {cell_contribution}")
+                        ctx.log("    Col %s (%s): %s", c, header_val, cell_contribution, level=TRACE)
                     total_cost += cell_contribution
-        else:
-            # Fallback to direct value
-            total_cost = ws.cell(row, e2e_cost_col).value or 0
-            if not total_cost:
-                total_cost = ws.cell(row + 1, e2e_cost_col).value or 0
-        
-        self._log(f"Total calculated cost: {total_cost}")
         
-        # Get LT
-        lt_row1 = ws.cell(row, e2e_lt_col).value
-        lt_row2 = ws.cell(row + 1, e2e_lt_col).value
+        ctx.log("Total calculated cost: %s", total_cost, level=TRACE)
         
-        if self._is_date_format(lt_row2):
-            lt = lt_row2
-        elif self._is_date_format(lt_row1):
-            lt = lt_row1
-        else:
-            lt = lt_row2 if lt_row2 and str(lt_row2).strip() else lt_row1
-        
-        lt_str = str(lt).strip() if lt else ""
-        
-        breakdown, log_details = self._get_breakdown_merged(ws, ws_formula, sheet_name, row, header_row, inputs)
-        return total_cost, lt_str, breakdown, log_details
-
-    def _extract_data_from_row(self, ws, ws_formula, sheet_name, row, header_row, inputs):
-        e2e_cost_col = self._get_col_by_header(ws, header_row, 'E2E Cost')
-        e2e_lt_col = self._get_col_by_header(ws, header_row, 'E2E Lead Time')
-        map_col = self._get_col_by_header(ws, header_row, 'MAP')
-        from_col = self._get_col_by_header(ws, header_row, 'From')
-        to_col = self._get_col_by_header(ws, header_row, 'To')
-        
-        self._log(f"E2E Cost column: {e2e_cost_col}, E2E Lead Time column: {e2e_lt_col}")
-        
-        # Check if this is a single-row entry
-        # Method 1: Next row has a different MAP node
-        current_map = ws.cell(row, map_col).value if map_col else None
-        next_map = ws.cell(row + 1, map_col).value if map_col else None
-        
-        # Method 2: Next row has different From/To values (new record)
-        current_from = ws.cell(row, from_col).value if from_col else None
-        next_from = ws.cell(row + 1, from_col).value if from_col else None
-        current_to = ws.cell(row, to_col).value if to_col else None
-        next_to = ws.cell(row + 1, to_col).value if to_col else None
-        
-        is_single_row = False
-        # If next row has a different MAP node, it's single-row 
-        if next_map and str(next_map).strip() and current_map != next_map:
-            is_single_row = True
-        # If next row has different From/To (new record starts), it's single-row
-        elif next_from and str(next_from).strip() and (current_from != next_from or current_to != next_to):
-            is_single_row = True
-        # If current row has a cost but next row's cost cell has a new MAP value, it's single-row
-        elif ws.cell(row, e2e_cost_col).value and next_map and str(next_map).strip():
-            is_single_row = True
-        
-        if is_single_row:
-            self._log(f"Single-row data detected (current MAP={current_map}, next MAP={next_map})")
-        
-        cost = ws.cell(row, e2e_cost_col).value or 0
-        self._log(f"Cost from row {row}: {cost}")
-        
-        # Only check row+1 for merged cells (not single-row data)
-        if not cost and not is_single_row:
-            cost = ws.cell(row + 1, e2e_cost_col).value or 0
-            self._log(f"Cost from row {row+1}: {cost}")
-        
-        lt_row1 = ws.cell(row, e2e_lt_col).value
-        self._log(f"LT Row {row}: '{lt_row1}'")
-        
-        # For single-row data, use row1 only
-        if is_single_row:
-            lt = lt_row1
-            self._log(f"Selected LT from Row {row} (single-row data)")
-        else:
-            lt_row2 = ws.cell(row + 1, e2e_lt_col).value
-            self._log(f"LT Row {row+1}: '{lt_row2}'")
-            
-            if self._is_date_format(lt_row2):
-                lt = lt_row2
-                self._log(f"Selected LT from Row {row+1} (date format)")
-            elif self._is_date_format(lt_row1):
-                lt = lt_row1
-                self._log(f"Selected LT from Row {row} (date format)")
-            else:
-                lt = lt_row2 if lt_row2 and str(lt_row2).strip() else lt_row1
-                self._log(f"Selected LT (fallback): '{lt}'")
-        
-        lt_str = str(lt).strip() if lt else ""
-        self._log(f"Final LT: '{lt_str}'")
+        with timed('breakdown'):
+            span = self.record_spans[schema.sheet_name].get(row)
+            breakdown, log_details = self._get_breakdown_merged(ctx, ws, schema, span, inputs)
+        return total_cost, model.lead_time, breakdown, log_details
 
-        breakdown, log_details = self._get_breakdown_merged(ws, ws_formula, sheet_name, row, header_row, inputs, is_single_row)
-        return cost, lt_str, breakdown, log_details
+    def _extract_data_from_row(self, ctx, ws, schema, row, inputs):
+        """Stored E2E Cost and Lead Time of the record at row, with its breakdown."""
+        span = self.record_spans[schema.sheet_name].get(row)
+        ctx.log("E2E Cost column: %s, E2E Lead Time column: %s", schema.e2e_cost_col, schema.e2e_lt_col, level=TRACE)
+        ctx.log("Record rows %s-%s (%s)", span.first, span.last, span.kind, level=TRACE)
+        ctx.log("Cost: %s, LT: '%s'", span.cost, span.lead_time, level=TRACE)
 
-    def _get_breakdown_merged(self, ws, ws_formula, sheet_name, row, header_row, inputs=None, is_single_row=False):
+        with timed('breakdown'):
+            breakdown, log_details = self._get_breakdown_merged(ctx, ws, schema, span, inputs)
+        return span.cost, span.lead_time, breakdown, log_details
+
+    def _get_breakdown_merged(self, ctx, ws, schema, span, inputs=None):
+        model = self.cost_models[schema.sheet_name]
+        quantities = self._quantities(inputs) if inputs else None
         base_costs = []
         variable_costs = []
         log_details = []
         
-        breakdown_cols = []
-        for c in range(1, ws.max_column + 1):
-            idx_val = ws.cell(1, c).value
-            if idx_val is not None:
-                try:
-                    int(idx_val)
-                    breakdown_cols.append(c)
-                except (ValueError, TypeError):
-                    if str(idx_val).isdigit():
-                        breakdown_cols.append(c)
-        
-        self._log(f"Breakdown columns: {breakdown_cols}")
+        tracing = ctx.enabled(TRACE)
+        if tracing:
+            ctx.log("Breakdown columns: %s", [c for c, _, _ in schema.breakdown_cols], level=TRACE)
 
-        for c in breakdown_cols:
-            title = ws.cell(header_row, c).value
-            if not title: continue
-            title_str = str(title).strip()
-            
-            fill = ws.cell(1, c).fill
-            is_green = False
-            if fill and hasattr(fill.start_color, 'rgb'):
-                color_rgb = str(fill.start_color.rgb)
-                if color_rgb in ['FF92D050', '92D050']:
-                    is_green = True
+        # Rate texts are in the record's first row, amounts in its value row
+        row, value_row = span.first, span.value_row
+        for c, title_str, is_green in schema.breakdown_cols:
+            val1 = ws.value(row, c)
+            val2 = ws.value(value_row, c)
             
-            val1 = ws.cell(row, c).value
-            
-            # For single-row data, only use current row
-            if is_single_row:
-                val2 = val1  # Use same value for display
-                # Check for formula in current row
-                formula_val = ws_formula.cell(row, c).value
-                if inputs and formula_val and isinstance(formula_val, str) and formula_val.startswith('='):
-                    calculated_val = self._evaluate_cell_formula(ws, ws_formula, formula_val, row, header_row, inputs, sheet_name)
-                    if calculated_val > 0:
-                        val2 = calculated_val
-            else:
-                val2 = ws.cell(row + 1, c).value
-                
-                # Check for formula in row2 and evaluate with user inputs
-                formula_val = ws_formula.cell(row + 1, c).value
-                if inputs and formula_val and isinstance(formula_val, str) and formula_val.startswith('='):
-                    calculated_val = self._evaluate_cell_formula(ws, ws_formula, formula_val, row, header_row, inputs, sheet_name)
-                    if calculated_val > 0:
-                        val2 = calculated_val
+            # Evaluate a formula in the value row with user inputs
+            compiled = model.formulas.get((value_row, c))
+            if inputs and compiled:
+                calculated_val = self._apply_formula(ctx, compiled, quantities)
+                if calculated_val > 0:
+                    val2 = calculated_val
             
             # Check for MIN logic in val1
-            if inputs and val1 and 'MIN' in str(val1).upper():
-                calculated_val = self._parse_min_value(val1, sheet_name, inputs)
-                if calculated_val > 0:
+            rule = model.min_rules.get((row, c))
+            if inputs and rule:
+                calculated_val = self._apply_min_rule(ctx, rule, quantities)
+                if calculated_val is not None and calculated_val > 0:
                     val2 = calculated_val
             
             val1_str = str(val1).strip() if val1 is not None else ""
@@ -724,7 +752,8 @@ class ExcelHandler:
                 except (ValueError, TypeError):
                     pass
             
-            log_details.append(f"Col {c} ({title_str}): Row1='{val1_str}', Row2='{val2_str}', Green={is_green}")
+            if tracing:
+                log_details.append(f"Col {c} ({title_str}): Row1='{val1_str}', Row2='{val2_str}', Green={is_green}")
             
             if val1_str or val2_str:
                 item = {
@@ -737,7 +766,7 @@ class ExcelHandler:
                 else:
                     base_costs.append(item)
         
-        self._log(f"Base costs: {len(base_costs)} items")
-        self._log(f"Variable costs: {len(variable_costs)} items")
+        ctx.log("Base costs: %s items", len(base_costs), level=TRACE)
+        ctx.log("Variable costs: %s items", len(variable_costs), level=TRACE)
                     
         return {"base": base_costs, "variable": variable_costs}, log_details
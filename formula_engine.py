@@ -0,0 +1,635 @@
+import math
+import operator
+import re
+
+import numpy as np
+from openpyxl.utils import column_index_from_string
+
+TOKEN_RE = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<string>"(?:[^"]|"")*")
+  | (?P<func>[A-Z][A-Z0-9.]*)\(
+  | (?P<range>\$?[A-Z]{1,3}\$?\d+:\$?[A-Z]{1,3}\$?\d+)
+  | (?P<ref>\$?[A-Z]{1,3}\$?\d+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:E[+-]?\d+)?)
+  | (?P<bool>TRUE|FALSE)(?![A-Z0-9(])
+  | (?P<op><=|>=|<>|[-+*/^%=<>(),])
+''', re.X | re.I)
+CELL_RE = re.compile(r'\$?([A-Z]{1,3})\$?(\d+)', re.I)
+COMPARISONS = {'=': operator.eq, '<>': operator.ne, '<': operator.lt, '>': operator.gt,
+               '<=': operator.le, '>=': operator.ge}
+
+
+class FormulaError(Exception):
+    """A formula outside the supported subset (see FUNCTIONS)."""
+
+
+def _cell(text):
+    m = CELL_RE.fullmatch(text)
+    return int(m.group(2)), column_index_from_string(m.group(1).upper())
+
+
+def tokenize(body):
+    tokens = []
+    pos = 0
+    while pos < len(body):
+        m = TOKEN_RE.match(body, pos)
+        if not m:
+            raise FormulaError(f"unsupported syntax at {body[pos:]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        text = m.group(kind)
+        if kind == 'space':
+            continue
+        if kind == 'string':
+            tokens.append(('num', text[1:-1].replace('""', '"')))
+        elif kind == 'number':
+            tokens.append(('num', float(text)))
+        elif kind == 'bool':
+            tokens.append(('num', text.upper() == 'TRUE'))
+        elif kind == 'ref':
+            tokens.append(('ref', _cell(text)))
+        elif kind == 'range':
+            start, end = text.split(':')
+            (r1, c1), (r2, c2) = _cell(start), _cell(end)
+            tokens.append(('range', (min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2))))
+        elif kind == 'func':
+            tokens.append(('func', text.upper()))
+        else:
+            tokens.append(('op', text))
+    return tokens
+
+
+class _Parser:
+    """
+    Recursive descent over Excel precedence: comparison, + -, * /, ^,
+    postfix %, unary minus. Produces nested tuples:
+    ('num', v), ('ref', (row, col)), ('range', (r1, c1, r2, c2)), ('neg', a),
+    ('pct', a), ('bin', op, a, b), ('cmp', op, a, b), ('call', NAME, args).
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        tok = self.peek()
+        if tok is None:
+            raise FormulaError("unexpected end of formula")
+        self.pos += 1
+        return tok
+
+    def expect(self, op):
+        if self.take() != ('op', op):
+            raise FormulaError(f"missing {op!r}")
+
+    def parse(self):
+        node = self.comparison()
+        if self.peek() is not None:
+            raise FormulaError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def comparison(self):
+        left = self.additive()
+        while self.peek() is not None and self.peek()[0] == 'op' and self.peek()[1] in COMPARISONS:
+            left = ('cmp', self.take()[1], left, self.additive())
+        return left
+
+    def additive(self):
+        left = self.multiplicative()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            left = ('bin', self.take()[1], left, self.multiplicative())
+        return left
+
+    def multiplicative(self):
+        left = self.power()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            left = ('bin', self.take()[1], left, self.power())
+        return left
+
+    def power(self):
+        left = self.unary()
+        while self.peek() == ('op', '^'):
+            self.take()
+            left = ('bin', '^', left, self.unary())
+        return left
+
+    def unary(self):
+        if self.peek() == ('op', '-'):
+            self.take()
+            return ('neg', self.unary())
+        if self.peek() == ('op', '+'):
+            self.take()
+            return self.unary()
+        node = self.primary()
+        while self.peek() == ('op', '%'):
+            self.take()
+            node = ('pct', node)
+        return node
+
+    def primary(self):
+        kind, val = self.take()
+        if kind in ('num', 'ref', 'range'):
+            return (kind, val)
+        if kind == 'func':
+            if val not in FUNCTIONS:
+                raise FormulaError(f"unsupported function {val}")
+            args = []
+            if self.peek() != ('op', ')'):
+                args.append(self.comparison())
+                while self.peek() == ('op', ','):
+                    self.take()
+                    args.append(self.comparison())
+            self.expect(')')
+            return ('call', val, tuple(args))
+        if (kind, val) == ('op', '('):
+            node = self.comparison()
+            self.expect(')')
+            return node
+        raise FormulaError(f"unexpected {val!r}")
+
+
+def parse(formula):
+    """AST of a '=...' formula; raises FormulaError outside the supported subset."""
+    return _Parser(tokenize(formula[1:] if formula.startswith('=') else formula)).parse()
+
+
+# --- Evaluation: values are floats, bools, str, None (blank) or numpy arrays
+# --- (the cost sweep evaluates every grid point at once)
+
+def _num(v):
+    """Value as a number: text that is not numeric and blanks count as 0."""
+    if type(v) is float or isinstance(v, (int, np.ndarray)):
+        return v
+    if v is None:
+        return 0
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _is_array(values):
+    return any(isinstance(v, np.ndarray) for v in values)
+
+
+def _numbers(values):
+    """Numeric arguments of SUM/MIN/MAX/AVERAGE: blanks and text in ranges are skipped."""
+    return [v if isinstance(v, np.ndarray) else float(v) for v in values
+            if isinstance(v, (int, float, np.ndarray))]
+
+
+def _sum(*values):
+    return sum(_numbers(values))
+
+
+def _min(*values):
+    nums = _numbers(values)
+    if not nums:
+        return 0.0
+    return np.minimum.reduce(np.broadcast_arrays(*nums)) if _is_array(nums) else min(nums)
+
+
+def _max(*values):
+    nums = _numbers(values)
+    if not nums:
+        return 0.0
+    return np.maximum.reduce(np.broadcast_arrays(*nums)) if _is_array(nums) else max(nums)
+
+
+def _average(*values):
+    nums = _numbers(values)
+    return sum(nums) / len(nums)
+
+
+def _round_with(fn):
+    def rounding(x, digits=0):
+        x, scale = _num(x), 10.0 ** int(_num(digits))
+        if isinstance(x, np.ndarray):
+            # Round off float noise first, so 0.1*3 rounds up to 0.3, not 0.31
+            return np.sign(x) * fn(np.round(np.abs(x) * scale, 9)) / scale
+        return math.copysign(fn(round(abs(x) * scale, 9)) / scale, x) if x else 0.0
+    return rounding
+
+
+def _half_up(x):
+    return np.floor(x + 0.5) if isinstance(x, np.ndarray) else math.floor(x + 0.5)
+
+
+def _up(x):
+    return np.ceil(x) if isinstance(x, np.ndarray) else math.ceil(x)
+
+
+def _down(x):
+    return np.floor(x) if isinstance(x, np.ndarray) else math.floor(x)
+
+
+def _ceiling(x, significance=1):
+    x, significance = _num(x), _num(significance)
+    if isinstance(x, np.ndarray):
+        return np.ceil(np.round(x / significance, 9)) * significance
+    return math.ceil(round(x / significance, 9)) * significance
+
+
+def _floor(x, significance=1):
+    x, significance = _num(x), _num(significance)
+    if isinstance(x, np.ndarray):
+        return np.floor(np.round(x / significance, 9)) * significance
+    return math.floor(round(x / significance, 9)) * significance
+
+
+def _int(x):
+    return _down(_num(x))
+
+
+def _abs(x):
+    return abs(_num(x))
+
+
+def _mod(a, b):
+    a, b = _num(a), _num(b)
+    return a - b * _down(a / b)
+
+
+def _truth(v):
+    return v.astype(bool) if isinstance(v, np.ndarray) else bool(_num(v))
+
+
+def _and(*values):
+    truths = [_truth(v) for v in values if v is not None]
+    return np.logical_and.reduce(np.broadcast_arrays(*truths)) if _is_array(truths) else all(truths)
+
+
+def _or(*values):
+    truths = [_truth(v) for v in values if v is not None]
+    return np.logical_or.reduce(np.broadcast_arrays(*truths)) if _is_array(truths) else any(truths)
+
+
+def _not(v):
+    t = _truth(v)
+    return ~t if isinstance(t, np.ndarray) else not t
+
+
+def _power(a, b):
+    a, b = _num(a), _num(b)
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        return np.power(a, b)
+    return math.pow(a, b)
+
+
+def _compare(op, a, b):
+    if isinstance(a, str) or isinstance(b, str):
+        if isinstance(a, str) and isinstance(b, str):
+            a, b = a.casefold(), b.casefold()
+        elif a is None or b is None:
+            a, b = a or '', b or ''
+        else:
+            # Excel sorts numbers before text
+            a, b = (0, 1) if isinstance(b, str) else (1, 0)
+    return COMPARISONS[op](_num(a) if not isinstance(a, str) else a, _num(b) if not isinstance(b, str) else b)
+
+
+ARITHMETIC = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv, '^': _power}
+# IF is evaluated lazily, see _closure
+FUNCTIONS = {
+    'SUM': _sum, 'MIN': _min, 'MAX': _max, 'AVERAGE': _average,
+    'ROUND': _round_with(_half_up), 'ROUNDUP': _round_with(_up), 'ROUNDDOWN': _round_with(_down),
+    'CEILING': _ceiling, 'FLOOR': _floor, 'INT': _int, 'ABS': _abs, 'MOD': _mod,
+    'AND': _and, 'OR': _or, 'NOT': _not, 'IF': None,
+}
+
+
+def _closure(node):
+    """Function of (quantities, memo) evaluating a bound AST node."""
+    kind = node[0]
+    if kind == 'num':
+        value = node[1]
+        return lambda q, m: value
+    if kind == 'var':
+        idx = node[1]
+        return lambda q, m: q[idx]
+    if kind == 'cell':
+        key = node[1]
+        return lambda q, m: m[key]
+    if kind == 'neg':
+        operand = _closure(node[1])
+        return lambda q, m: -_num(operand(q, m))
+    if kind == 'pct':
+        operand = _closure(node[1])
+        return lambda q, m: _num(operand(q, m)) / 100
+    if kind == 'bin':
+        fn, left, right = ARITHMETIC[node[1]], _closure(node[2]), _closure(node[3])
+        if node[1] == '/':
+            def divide(q, m):
+                a, b = _num(left(q, m)), _num(right(q, m))
+                if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+                    return np.true_divide(a, b)
+                return a / b
+            return divide
+        return lambda q, m: fn(_num(left(q, m)), _num(right(q, m)))
+    if kind == 'cmp':
+        op, left, right = node[1], _closure(node[2]), _closure(node[3])
+        return lambda q, m: _compare(op, left(q, m), right(q, m))
+    if kind == 'call':
+        name, args = node[1], node[2]
+        if name == 'IF':
+            cond = _closure(args[0])
+            then = _closure(args[1]) if len(args) > 1 else (lambda q, m: True)
+            other = _closure(args[2]) if len(args) > 2 else (lambda q, m: False)
+
+            def if_(q, m):
+                c = cond(q, m)
+                if isinstance(c, np.ndarray):
+                    return np.where(_truth(c), _num(then(q, m)), _num(other(q, m)))
+                return then(q, m) if _truth(c) else other(q, m)
+            return if_
+        fn = FUNCTIONS[name]
+        parts = [(arg[0] == 'list', _closure(arg)) for arg in args]
+
+        def call(q, m):
+            values = []
+            for is_list, part in parts:
+                if is_list:
+                    values.extend(part(q, m))
+                else:
+                    values.append(part(q, m))
+            return fn(*values)
+        return call
+    if kind == 'list':
+        # A range: its constant values, then its input dependent cells (the
+        # functions taking ranges do not depend on the order)
+        values, items = list(node[1]), [_closure(item) for item in node[2]]
+        if not items:
+            return lambda q, m: values
+        return lambda q, m: values + [item(q, m) for item in items]
+    raise FormulaError(f"cannot evaluate {kind}")
+
+
+def _has_inputs(node):
+    kind = node[0]
+    if kind in ('var', 'cell'):
+        return True
+    if kind in ('num', 'ref', 'range'):
+        return False
+    if kind == 'list':
+        return bool(node[2])
+    if kind == 'call':
+        return any(_has_inputs(arg) for arg in node[2])
+    return any(_has_inputs(child) for child in node[1:] if isinstance(child, tuple))
+
+
+def _fold(node):
+    """Evaluate a subtree without inputs once, at load time."""
+    if node[0] in ('num', 'list') or _has_inputs(node):
+        return node
+    try:
+        return ('num', _closure(node)(None, None))
+    except Exception:
+        return node     # fails at run time, like the cell did in Excel
+
+
+class Step:
+    """One cell of a compiled program: its bound AST and the closure computing it."""
+
+    __slots__ = ('key', 'node', 'fn')
+
+    def __init__(self, key, node):
+        self.key = key
+        self.node = node
+        self.fn = _closure(node)
+
+    def __getstate__(self):
+        # Closures cannot be pickled: snapshots keep the AST and rebuild fn
+        return self.key, self.node
+
+    def __setstate__(self, state):
+        self.key, self.node = state
+        self.fn = _closure(self.node)
+
+
+class Programs:
+    """
+    The compiled cells of one sheet, shared by all its compiled formulas.
+
+    Each cell is one Step and the input dependent cells it reads directly,
+    so a chain of N cells is N entries however long it is; the order a
+    cell's program runs its upstream cells in is worked out on its first
+    run (order()). Everything is kept flat, keyed by cell, so pickling
+    does not recurse along the chain.
+    """
+
+    def __init__(self):
+        self.steps = {}         # cell -> Step
+        self.upstream = {}      # cell -> input dependent cells it reads
+        self.inputs = {}        # cell -> quantity indexes its program uses
+
+    def add(self, step, upstream=(), inputs=()):
+        self.steps[step.key] = step
+        self.upstream[step.key] = upstream
+        self.inputs[step.key] = inputs
+
+    def order(self, key):
+        """Steps of the cell's program, upstream first: an iterative post-order walk."""
+        order = []
+        seen = set()
+        stack = [(key, False)]
+        while stack:
+            cell, expanded = stack.pop()
+            if expanded:
+                order.append(self.steps[cell])
+                continue
+            if cell in seen:
+                continue
+            seen.add(cell)
+            stack.append((cell, True))
+            stack.extend((ref, False) for ref in reversed(self.upstream[cell]) if ref not in seen)
+        return order
+
+
+def run_program(programs, key):
+    """
+    Function of the quantities running the program of a cell: the input
+    dependent cells upstream of it in topological order, each computed once
+    per call and memoized for the cells downstream of it; returns the
+    cell's value.
+    """
+    step = programs.steps[key]
+    if not programs.upstream[key]:
+        if step.node[0] == 'num':
+            value = _num(step.node[1])
+            return lambda q: value
+        fn = step.fn
+        return lambda q: _num(fn(q, None))
+    order = None
+
+    def run(q):
+        nonlocal order
+        if order is None:
+            order = [(s.key, s.fn) for s in programs.order(key)]
+        memo = {}
+        for cell, fn in order:
+            memo[cell] = fn(q, memo)
+        return _num(memo[key])
+    return run
+
+
+class FormulaGraph:
+    """
+    Dependency graph of the formula cells of one sheet, built at load.
+
+    Cells of the input columns (PALLET QTY, CBM, G/W) are the quantities a
+    quote varies; a formula cell referencing one, directly or through other
+    formula cells, is input dependent. Every other formula cell is constant:
+    it is evaluated once here (falling back to its cached value when the
+    formula is unsupported) and folded into the formulas reading it.
+    compile() turns a cell into a program that recomputes only the input
+    dependent cells upstream of it.
+
+    Cells are resolved upstream first by an iterative walk, so chains of
+    any length neither recurse nor get compiled twice: each cell is bound
+    once into `programs`, shared by the programs of all cells downstream
+    of it. Cells on a reference cycle, and the cells reading them, do not
+    compile ("circular reference"); as constants they read their cached
+    value.
+    """
+
+    def __init__(self, ws, input_cols):
+        self.ws = ws
+        self.input_cols = input_cols    # column -> quantity index
+        self.asts = {}
+        self.errors = {}
+        for key, formula in ws.formulas.items():
+            if isinstance(formula, str) and formula.startswith('='):
+                try:
+                    self.asts[key] = parse(formula)
+                except FormulaError as e:
+                    self.errors[key] = str(e)
+        self._dynamic = {}      # resolved cell -> whether it depends on the inputs
+        self._constants = {}    # constant cell -> value
+        self.programs = Programs()     # compiled input dependent cells, see compile()
+        self._cyclic = set()    # cells on or downstream of a reference cycle
+
+    def _refs(self, node):
+        """Cells a node reads, ranges expanded (clipped to the used area)."""
+        kind = node[0]
+        if kind == 'ref':
+            yield node[1]
+        elif kind == 'range':
+            r1, c1, r2, c2 = node[1]
+            for r in range(r1, min(r2, self.ws.max_row) + 1):
+                for c in range(c1, min(c2, self.ws.max_column) + 1):
+                    yield r, c
+        elif kind == 'call':
+            for arg in node[2]:
+                yield from self._refs(arg)
+        elif kind != 'num':
+            for child in node[1:]:
+                if isinstance(child, tuple):
+                    yield from self._refs(child)
+
+    def _formula_refs(self, key):
+        """Formula cells outside the input columns that a cell reads, each once."""
+        return [ref for ref in dict.fromkeys(self._refs(self.asts[key]))
+                if ref in self.asts and ref[1] not in self.input_cols]
+
+    def _resolve(self, key):
+        """Resolve a formula cell and every formula cell upstream of it, upstream first."""
+        if key in self._dynamic or key in self._cyclic:
+            return
+        stack = [(key, iter(self._formula_refs(key)))]
+        depth = {key: 0}        # cells on the walk's path -> their position in it
+        while stack:
+            cell, refs = stack[-1]
+            for ref in refs:
+                if ref in self._dynamic or ref in self._cyclic:
+                    continue
+                if ref in depth:
+                    # A back edge: every cell on the path from ref up is on a cycle
+                    self._cyclic.update(c for c, _ in stack[depth[ref]:])
+                    continue
+                depth[ref] = len(stack)
+                stack.append((ref, iter(self._formula_refs(ref))))
+                break
+            else:
+                stack.pop()
+                del depth[cell]
+                self._finish(cell)
+
+    def _finish(self, key):
+        """Classify a cell whose upstream cells are resolved; bind it once."""
+        refs = self._formula_refs(key)
+        if key in self._cyclic or any(ref in self._cyclic for ref in refs):
+            self._cyclic.add(key)
+            return
+        ast = self.asts[key]
+        reads_inputs = any(ref[1] in self.input_cols for ref in self._refs(ast))
+        upstream = [ref for ref in refs if self._dynamic[ref]]
+        self._dynamic[key] = reads_inputs or bool(upstream)
+        if not self._dynamic[key]:
+            try:
+                self._constants[key] = _closure(self._bind(ast))(None, None)
+            except Exception:
+                self._constants[key] = self.ws.value(*key)
+            return
+
+        used = {self.input_cols[ref[1]] for ref in self._refs(ast) if ref[1] in self.input_cols}
+        for ref in upstream:
+            used.update(self.programs.inputs[ref])
+        self.programs.add(Step(key, self._bind(ast)), tuple(upstream), tuple(sorted(used)))
+
+    def is_dynamic(self, key):
+        """Whether the cell's value depends on the input columns; raises FormulaError on a cycle."""
+        if key[1] in self.input_cols:
+            return True
+        if key not in self.asts:
+            return False
+        self._resolve(key)
+        if key in self._cyclic:
+            raise FormulaError("circular reference")
+        return self._dynamic[key]
+
+    def value(self, key):
+        """Value of a cell that does not depend on the inputs."""
+        if key in self.asts:
+            self._resolve(key)
+            if key in self._constants:
+                return self._constants[key]
+        return self.ws.value(*key)
+
+    def _bind(self, node):
+        """Resolve references: input columns to quantities, dynamic cells to memo slots, the rest to values."""
+        kind = node[0]
+        if kind == 'ref':
+            key = node[1]
+            if key[1] in self.input_cols:
+                return ('var', self.input_cols[key[1]])
+            if self._dynamic.get(key):
+                return ('cell', key)
+            return ('num', self.value(key))
+        if kind == 'range':
+            # Blank cells are left out: every function taking a range skips them
+            items = [self._bind(('ref', key)) for key in self._refs(node)]
+            return ('list', tuple(item[1] for item in items if item[0] == 'num' and item[1] is not None),
+                    tuple(item for item in items if item[0] != 'num'))
+        if kind == 'num':
+            return node
+        if kind == 'call':
+            return _fold(('call', node[1], tuple(self._bind(arg) for arg in node[2])))
+        return _fold(tuple(self._bind(child) if isinstance(child, tuple) else child for child in node))
+
+    def compile(self, key):
+        """
+        Compile the cell into `programs`, where run_program(programs, key)
+        runs it; returns the quantity indexes it uses. Raises FormulaError.
+        """
+        if key in self.errors:
+            raise FormulaError(self.errors[key])
+        self._resolve(key)
+        if key in self._cyclic:
+            raise FormulaError("circular reference")
+        if key not in self.programs.steps:
+            self.programs.add(Step(key, ('num', self.value(key))))
+        return self.programs.inputs[key]
@@ -99,18 +99,27 @@ function App() {
     const [loading, setLoading] = useState(false)
     const [logs, setLogs] = useState([])
     const [showLogs, setShowLogs] = useState(false)
+    // Selections of the last calculation, to fetch its logs on demand
+    const [calculatedPayload, setCalculatedPayload] = useState(null)
     const [currentFile, setCurrentFile] = useState('Built-in Template')
     const [fileMessage, setFileMessage] = useState('')
+    // Content-hash ID of the loaded workbook; scopes every API call so other
+    // users' uploads do not change what this page is pricing against
+    const [workbookId, setWorkbookId] = useState(null)
     const fileInputRef = useRef(null)
 
     useEffect(() => {
         fetchRoutes()
     }, [])
 
-    const fetchRoutes = async () => {
+    const workbookParams = (id = workbookId) => (id ? { params: { workbook: id } } : {})
+
+    const fetchRoutes = async (id) => {
         try {
-            const res = await axios.get('/api/routes')
+            const res = await axios.get('/api/routes', workbookParams(id))
             setRouteOptions(res.data)
+            // Pin the workbook the first load was served from
+            if (!id && !workbookId) setWorkbookId(res.headers['x-workbook-id'] || null)
         } catch (err) {
             console.error("Error fetching routes", err)
         }
@@ -375,7 +384,8 @@ function App() {
 
     const updateFields = async (nodeId, node, location) => {
         try {
-            const res = await axios.post('/api/fields', { node, location })
+            // GET so the browser revalidates the cached options by ETag
+            const res = await axios.get('/api/fields', { params: { ...workbookParams().params, node, location } })
             const newNodes = [...selectedNodes]
             const idx = newNodes.findIndex(n => n.id === nodeId)
             newNodes[idx].fields = res.data
@@ -386,11 +396,39 @@ function App() {
         }
     }
 
+    // Narrow every other field to the options still reachable with the current choices
+    const refreshOptions = async (nodeId, node, location, inputs) => {
+        try {
+            const res = await axios.post('/api/fields', { node, location, inputs }, workbookParams())
+            setSelectedNodes(prev => prev.map(n => n.id === nodeId && n.node === node && n.location === location
+                ? { ...n, fields: res.data }
+                : n))
+        } catch (err) {
+            console.error("Error fetching field options", err)
+        }
+    }
+
     const handleInputChange = (nodeId, fieldName, value) => {
         const newNodes = [...selectedNodes]
         const idx = newNodes.findIndex(n => n.id === nodeId)
         newNodes[idx].inputs[fieldName] = value
         setSelectedNodes(newNodes)
+
+        // Free typing only refreshes once the value is one of the options (or cleared)
+        const current = newNodes[idx]
+        const field = current.fields.find(f => f.name === fieldName)
+        if (!value || (field && field.options.map(String).includes(String(value)))) {
+            refreshOptions(nodeId, current.node, current.location, { ...current.inputs })
+        }
+    }
+
+    // Uploads are compiled in the background; poll the job until it settles
+    const waitForJob = async (statusUrl) => {
+        while (true) {
+            const res = await axios.get(statusUrl)
+            if (res.data.status === 'done' || res.data.status === 'failed') return res.data
+            await new Promise(resolve => setTimeout(resolve, 300))
+        }
     }
 
     const handleFileUpload = async (event) => {
@@ -399,11 +437,19 @@ function App() {
         const formData = new FormData()
         formData.append('file', file)
         try {
-            await axios.post('/api/upload', formData)
+            const res = await axios.post('/api/upload', formData)
+            setFileMessage(`正在解析: ${file.name}`)
+            const job = await waitForJob(res.data.status_url)
+            if (job.status !== 'done') {
+                setFileMessage('')
+                alert(`Upload failed: ${(job.errors || []).join('; ')}`)
+                return
+            }
+            setWorkbookId(res.data.workbook_id)
             setCurrentFile(file.name)
             setFileMessage(`已加载自定义文件: ${file.name}`)
             setTimeout(() => setFileMessage(''), 5000)
-            fetchRoutes()
+            fetchRoutes(res.data.workbook_id)
             setSelectedNodes([])
             setResults(null)
         } catch (err) { alert("Upload failed") }
@@ -411,11 +457,12 @@ function App() {
 
     const loadBuiltin = async () => {
         try {
-            await axios.post('/api/load-builtin')
+            const res = await axios.post('/api/load-builtin')
+            setWorkbookId(res.data.workbook_id)
             setCurrentFile('Built-in Template')
             setFileMessage('已加载内置模板')
             setTimeout(() => setFileMessage(''), 5000)
-            fetchRoutes()
+            fetchRoutes(res.data.workbook_id)
             setSelectedNodes([])
             setResults(null)
         } catch (err) { alert("Failed to restore") }
@@ -440,6 +487,19 @@ function App() {
         }
     }
 
+    // Logs are only requested when the panel is opened on a calculation without them
+    const toggleLogs = async () => {
+        const open = !showLogs
+        setShowLogs(open)
+        if (!open || logs.length > 0 || !calculatedPayload) return
+        try {
+            const res = await axios.post('/api/calculate?debug=1', calculatedPayload, workbookParams())
+            setLogs(res.data.logs || [])
+        } catch (err) {
+            console.error("Error fetching logs", err)
+        }
+    }
+
     const calculate = async () => {
         setLoading(true)
         setLogs([])
@@ -449,10 +509,13 @@ function App() {
                 location: n.location,
                 inputs: n.inputs
             }))
-            const res = await axios.post('/api/calculate', payload)
+            // The trace is only asked for while the logs panel is open: debug
+            // responses are recomputed, plain ones come from the result cache
+            const url = showLogs ? '/api/calculate?debug=1' : '/api/calculate'
+            const res = await axios.post(url, payload, workbookParams())
             setResults(res.data)
             setLogs(res.data.logs || [])
-            setShowLogs(true)
+            setCalculatedPayload(payload)
 
             const updatedNodes = [...selectedNodes]
 
@@ -950,6 +1013,11 @@ function App() {
                                             <>
                                                 <span className="status-fail">✗ 失败</span>
                                                 {nr.error && <span className="status-reason">原因: {nr.error}</span>}
+                                                {nr.suggestions && nr.suggestions.length > 0 && (
+                                                    <span className="status-reason">
+                                                        最接近的记录: {nr.suggestions[0].mismatches.map(m => `${m.field} = ${m.record ?? '(空)'}`).join(', ')}
+                                                    </span>
+                                                )}
                                             </>
                                         )}
                                     </div>
@@ -972,11 +1040,11 @@ function App() {
             }
 
             {
-                logs.length > 0 && (
+                results && (
                     <div className="logs-section glass" style={{ marginTop: '2rem', padding: '1.5rem' }}>
                         <div
                             style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', cursor: 'pointer' }}
-                            onClick={() => setShowLogs(!showLogs)}
+                            onClick={toggleLogs}
                         >
                             <h3 style={{ margin: 0, display: 'flex', alignItems: 'center', gap: '0.5rem' }}>
                                 <FileText size={20} /> Operation Logs
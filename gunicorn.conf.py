@@ -0,0 +1,19 @@
+# Pre-fork mode: gunicorn -c gunicorn.conf.py app:app
+#
+# With preload_app the master imports app.py, so the built-in workbook is
+# compiled once and the workers share it copy-on-write. Uploads reach every
+# worker through the registry's shared folder (uploads/.workbooks).
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Park everything the master allocated in the GC's permanent generation:
+    # collections in the workers would otherwise write to those objects and
+    # un-share their pages.
+    gc.freeze()
@@ -0,0 +1,57 @@
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:     # optional: without it responses are gzip-compressed only
+    brotli = None
+
+# Smaller bodies are sent as is: compressing them saves less than it costs
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain', 'text/csv')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def make_etag(*parts):
+    """
+    Opaque entity tag of a response built from `parts` (the workbook
+    version it depends on and the request key), so it changes exactly
+    when the response can.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None, the best the client accepts (request.accept_encodings)."""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    return data
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a buffered text response in place for the client. Streamed,
+    file and already encoded responses and small bodies are left alone.
+    """
+    response.vary.add('Accept-Encoding')
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None or response.content_length is None or response.content_length < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
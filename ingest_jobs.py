@@ -0,0 +1,234 @@
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from excel_handler import ExcelHandler
+from snapshot_cache import file_digest, snapshot_path
+from workbook_registry import workbook_id
+
+JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+JOB_TTL_SECONDS = 24 * 3600
+
+
+def _job_path(jobs_dir, job_id):
+    return os.path.join(jobs_dir, job_id + '.json')
+
+
+def _write_job(jobs_dir, job):
+    """Save the job record atomically, so any process can report its status."""
+    path = _job_path(jobs_dir, job['id'])
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def compile_workbook(jobs_dir, job, file_path, previous_path=None):
+    """
+    Runs in the ingest process pool: parse and compile the workbook, which
+    writes its compiled snapshot for the web process to load. Returns the
+    updated job record; status 'failed' with errors when the workbook has
+    nothing to price.
+
+    previous_path is the workbook being replaced. Its snapshot is loaded so
+    that only the sheets whose content changed are parsed and compiled.
+    """
+    job = dict(job, status='compiling')
+    job['timings']['queued_ms'] = _ms(time.time() - job['submitted_at'])
+    _write_job(jobs_dir, job)
+
+    start = time.perf_counter()
+    previous = None
+    if previous_path and os.path.exists(previous_path):
+        previous = ExcelHandler(previous_path, log_stdout=False)
+    handler = ExcelHandler(file_path, log_stdout=False, previous=previous)
+    job['timings']['compile_ms'] = _ms(time.perf_counter() - start)
+    if previous is not None:
+        job['recompiled'] = handler.recompiled
+
+    errors = []
+    if handler.load_error:
+        errors.append(f"无法读取工作簿: {handler.load_error}")
+    else:
+        missing = [name for name in ExcelHandler.SHEETS if name not in handler.sheets]
+        if missing:
+            job['warnings'] = [f"缺少工作表: {name}" for name in missing]
+        for name in handler.sheets:
+            if name not in handler.lane_index:
+                errors.append(f"工作表 {name} 中未找到 MAP 标题")
+        if not handler.lane_index:
+            errors.append("未找到可计价的工作表")
+        unclassified = handler.unclassified_records()
+        if unclassified:
+            job['unclassified_records'] = unclassified
+    job['summary'] = {
+        "sheets": sorted(handler.sheets),
+        "lanes": sum(len(lanes.match_rows) for lanes in handler.lane_index.values()),
+        "routes": len(handler.get_route_options()),
+        "unclassified_records": len(handler.unclassified_records()),
+    }
+    if errors:
+        job['status'] = 'failed'
+        job['errors'] = errors
+    return job
+
+
+class IngestJobs:
+    """
+    Upload ingestion off the request thread.
+
+    submit() records a job and hands the workbook to a process pool that
+    parses and compiles it; when that succeeds, the compiled snapshot is
+    loaded into the registry and activated. Until then, and for good when
+    it fails, the previously active workbook keeps serving. A job that
+    replaces a given workbook (a file changed on disk) is only activated
+    if that workbook is still the active one. Job records are
+    JSON files in jobs_dir, so every gunicorn worker can report any job.
+    """
+
+    def __init__(self, registry, jobs_dir, max_workers=None):
+        if max_workers is None:
+            max_workers = int(os.environ.get('SHP_INGEST_WORKERS', 1))
+        self.registry = registry
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._activated_seq = 0
+        self._pending = set()   # workbook ids being ingested
+
+    def _executor(self, broken=None):
+        # Created on first use, so a pre-fork master never owns the pool;
+        # replaced when a crashed child has left it unusable
+        with self._lock:
+            if self._pool is None or self._pool is broken:
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _submit(self, *args):
+        pool = self._executor()
+        try:
+            return pool.submit(*args)
+        except BrokenProcessPool:
+            return self._executor(broken=pool).submit(*args)
+
+    def submit(self, file_path, filename, replaces=None, activate=True, upload_path=None):
+        """
+        Queue ingestion of file_path; returns the new job record. Sheets are
+        reused from `replaces` (a workbook id), by default the active workbook.
+        With replaces given, the workbook only becomes active if `replaces`
+        still is; with activate=False it never does.
+
+        upload_path: where an uploaded file_path is moved once published.
+        When the job fails, it and the published copy are removed again.
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._prune()
+        wb_id, load_path = self.registry.publish(file_path)
+        # Files kept only for this job; never the caller's own (watched) file
+        owned = [load_path] if load_path != file_path else []
+        if upload_path:
+            os.replace(file_path, upload_path)
+            if load_path == file_path:
+                load_path = upload_path
+            owned.append(upload_path)
+        previous = self.registry.get(replaces)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self._pending.add(wb_id)
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "filename": filename,
+            "workbook_id": wb_id,
+            "submitted_at": time.time(),
+            "timings": {},
+            "errors": [],
+        }
+        if replaces:
+            job['replaces'] = replaces
+        if not activate:
+            job['activate'] = False
+        _write_job(self.jobs_dir, job)
+        future = self._submit(compile_workbook, self.jobs_dir, job, load_path,
+                              previous.file_path if previous else None)
+        future.add_done_callback(lambda f: self._finish(f, job, seq, load_path, filename, owned))
+        return job
+
+    def _finish(self, future, job, seq, load_path, filename, owned=()):
+        try:
+            job = future.result()
+            if job['status'] != 'failed':
+                job['status'] = 'loading'
+                _write_job(self.jobs_dir, job)
+                start = time.perf_counter()
+                with self._lock:
+                    # A job finishing after a newer upload must not replace it
+                    activate = seq > self._activated_seq and job.get('activate', True)
+                    if 'replaces' in job:
+                        activate = activate and self.registry.active_id == job['replaces']
+                    if activate:
+                        self._activated_seq = seq
+                self.registry.load(load_path, filename, activate=activate)
+                job['timings']['load_ms'] = _ms(time.perf_counter() - start)
+                job['activated'] = activate
+                job['status'] = 'done'
+        except Exception as e:
+            job = dict(job, status='failed', errors=job.get('errors', []) + [str(e)])
+        job['timings']['total_ms'] = _ms(time.time() - job['submitted_at'])
+        _write_job(self.jobs_dir, job)
+        with self._lock:
+            self._pending.discard(job['workbook_id'])
+        if job['status'] == 'failed' and job['workbook_id'] not in self.registry:
+            self._remove(job['workbook_id'], owned)
+
+    @staticmethod
+    def _remove(wb_id, paths):
+        """Delete the files of a rejected workbook, with any snapshot written for them."""
+        for path in paths:
+            try:
+                # A later upload of the same name may have replaced it
+                if workbook_id(path) != wb_id:
+                    continue
+                for target in (snapshot_path(path, file_digest(path)), path):
+                    if os.path.exists(target):
+                        os.remove(target)
+            except OSError:
+                pass
+
+    def pending(self, wb_id):
+        """Whether workbook wb_id is queued or being compiled."""
+        with self._lock:
+            return wb_id in self._pending
+
+    def get(self, job_id):
+        """The job record, or None for an unknown id."""
+        if not JOB_ID_RE.fullmatch(job_id or ''):
+            return None
+        try:
+            with open(_job_path(self.jobs_dir, job_id), encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for name in os.listdir(self.jobs_dir):
+            path = os.path.join(self.jobs_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,250 @@
+PARTIAL_SKIP_FIELDS = ['PALLET QTY', 'CBM', 'G/W', 'GW']
+SUMMARY_CODES = {'Ocean': 'A', 'Air': 'B'}
+SUMMARY_NAMES = {'A': 'Ocean', 'B': 'Air', 'C': 'Land'}
+# Ranking weight of a mismatch: a differing value costs more to fix than
+# filling in or clearing one field
+MISMATCH_WEIGHTS = {'missing_input': 1, 'not_in_record': 1, 'different': 2}
+
+
+def _key_part(val):
+    return str(val).strip() if val else ""
+
+
+def summary_code(val):
+    """Convert a Shipping method display value back to its SUMMARY code."""
+    return SUMMARY_CODES.get(val, 'C')
+
+
+def summary_name(code):
+    """SUMMARY code to its Shipping method display value, as get_node_fields shows it."""
+    return SUMMARY_NAMES.get(code, code)
+
+
+class LaneIndex:
+    """
+    Rows of one sheet compiled into lanes keyed by (MAP node, From, To).
+
+    Each lane keeps its rows in sheet order, posting lists per column value
+    for exact matching, and a signature table for partial matching, so a
+    lookup only touches the few candidate rows of the lane. Facets (bitsets
+    of lane rows per field value) answer which field options remain
+    reachable given the inputs chosen so far.
+    """
+
+    def __init__(self, ws, schema, spans):
+        self.schema = schema
+        self.header_cols = schema.columns
+        self.partial_cols = None
+        if schema.match_cols is not None:
+            self.partial_cols = [(c, title) for c, title in schema.match_cols if title not in PARTIAL_SKIP_FIELDS]
+
+        self.rows = {}          # (node, frm, to) -> [row, ...] for field listing
+        self.match_rows = {}    # (node, frm, to) -> [row, ...] eligible for calculate
+        self.postings = {}      # (node, frm, to) -> {col: {value: [row, ...]}}
+        self.row_keys = {}      # row -> {col: stripped value, falling back to the record's value row}
+        self.partial = {}       # (node, frm, to) -> {signature: first row}
+        self.facets = {}        # (node, frm, to) -> [(title, [(option, rows bitset)] sorted, {match key: rows bitset})]
+
+        header_row, map_col, from_col, to_col = schema.header_row, schema.map_col, schema.from_col, schema.to_col
+        header_items = sorted(self.header_cols.values())
+        rows = [ws.row_values(r) for r in range(header_row + 1, ws.max_row + 1)]
+        for offset, values in enumerate(rows):
+            r = header_row + 1 + offset
+            node_val = values[map_col - 1]
+            if not node_val:
+                continue
+            frm_val = values[from_col - 1] if from_col else None
+            to_val = values[to_col - 1] if to_col else None
+            key = (_key_part(node_val), _key_part(frm_val), _key_part(to_val))
+            if not key[0]:
+                continue
+            self.rows.setdefault(key, []).append(r)
+            if not frm_val or not to_val:
+                continue
+
+            span = spans.get(r)
+            below = None if span.is_single_row else rows[span.value_row - header_row - 1]
+            merged = {}
+            for c in header_items:
+                val = values[c - 1]
+                if val is None and below is not None:
+                    val = below[c - 1]
+                merged[c] = val
+            keys = {c: str(val).strip() for c, val in merged.items()}
+            self.row_keys[r] = keys
+            self.match_rows.setdefault(key, []).append(r)
+
+            lane_postings = self.postings.setdefault(key, {})
+            for c, val in keys.items():
+                lane_postings.setdefault(c, {}).setdefault(val, []).append(r)
+
+            if self.partial_cols is not None:
+                signature = tuple(self._excel_signature_value(merged[c]) for c, _ in self.partial_cols)
+                self.partial.setdefault(key, {}).setdefault(signature, r)
+
+        for key, lane_rows in self.rows.items():
+            self.facets[key] = self._build_facets(ws, schema, lane_rows)
+
+    @staticmethod
+    def _build_facets(ws, schema, lane_rows):
+        """
+        Bit i of a bitset stands for the i-th row of the lane. Options are the
+        cell values get_node_fields lists (SUMMARY as its display name); match
+        keys are the stripped values inputs are compared with.
+        """
+        facets = []
+        for c, title in schema.field_cols:
+            options = {}
+            keys = {}
+            for i, r in enumerate(lane_rows):
+                val = ws.value(r, c)
+                if val is None or str(val).strip().upper() == "N/A" or str(val).strip() == "":
+                    continue
+                bit = 1 << i
+                key = str(val).strip()
+                keys[key] = keys.get(key, 0) | bit
+                if title == 'SUMMARY':
+                    val = summary_name(val)
+                options[val] = options.get(val, 0) | bit
+            facets.append((title, sorted(options.items(), key=lambda item: item[0]), keys))
+        return facets
+
+    @staticmethod
+    def _excel_signature_value(val):
+        if not val or str(val).strip() in ['', 'N/A']:
+            return None
+        return str(val).strip()
+
+    @staticmethod
+    def _input_signature_value(field, val):
+        if not val or str(val).strip() == '':
+            return None
+        if field == 'SUMMARY':
+            val = summary_code(val)
+        return str(val).strip()
+
+    def lane_rows(self, node, frm, to):
+        return self.rows.get((node, frm, to), [])
+
+    def facet_options(self, node, frm, to, inputs=None):
+        """
+        Options of every field of the lane that some row still offers given
+        the other chosen inputs, in get_node_fields format. A field's own
+        choice does not narrow its options, so it can still be changed;
+        PALLET QTY, CBM and G/W are free quantities and never narrow.
+        """
+        key = (node, frm, to)
+        facets = self.facets.get(key)
+        if not facets:
+            return []
+        lane_mask = (1 << len(self.rows[key])) - 1
+        chosen = {}
+        for title, options, keys in facets:
+            val = (inputs or {}).get(title)
+            if title in PARTIAL_SKIP_FIELDS or not val or str(val).strip().lower() in ('', 'n/a'):
+                continue
+            chosen[title] = keys.get(summary_code(val) if title == 'SUMMARY' else str(val).strip(), 0)
+
+        fields = []
+        for title, options, keys in facets:
+            if not options:
+                continue
+            allowed = lane_mask
+            for other, mask in chosen.items():
+                if other != title:
+                    allowed &= mask
+            fields.append({
+                "name": title,
+                "display_name": "Shipping method" if title == "SUMMARY" else title,
+                "options": [val for val, mask in options if mask & allowed],
+            })
+        return fields
+
+    def find_exact(self, node, frm, to, inputs):
+        """First row of the lane whose fields equal every non-empty input."""
+        key = (node, frm, to)
+        candidates = self.match_rows.get(key)
+        if not candidates:
+            return None
+        lane_postings = self.postings[key]
+
+        constraints = []
+        for field, val in inputs.items():
+            if not val or str(val).lower() == 'n/a':
+                continue
+            col = self.header_cols.get(field)
+            if not col:
+                continue
+            input_val = summary_code(val) if field == 'SUMMARY' else val
+            constraints.append((col, str(input_val).strip()))
+        if not constraints:
+            return candidates[0]
+
+        shortest = None
+        for col, want in constraints:
+            rows = lane_postings.get(col, {}).get(want)
+            if not rows:
+                return None
+            if shortest is None or len(rows) < len(shortest):
+                shortest = rows
+        for r in shortest:
+            keys = self.row_keys[r]
+            if all(keys[col] == want for col, want in constraints):
+                return r
+        return None
+
+    def find_partial(self, node, frm, to, inputs):
+        """First row of the lane matching all fields except PALLET QTY, CBM and G/W."""
+        if self.partial_cols is None:
+            return None
+        table = self.partial.get((node, frm, to))
+        if not table:
+            return None
+        signature = tuple(self._input_signature_value(title, inputs.get(title)) for _, title in self.partial_cols)
+        return table.get(signature)
+
+    def nearest(self, node, frm, to, inputs, limit=3):
+        """
+        Closest records of the lane when nothing matches: the lane's distinct
+        partial-match signatures ranked by the number, then the kind, of
+        fields differing from the inputs. Each suggestion lists the
+        mismatches and the inputs that would select the record (keeping the
+        requested PALLET QTY, CBM and G/W).
+        """
+        if self.partial_cols is None:
+            return []
+        table = self.partial.get((node, frm, to))
+        if not table:
+            return []
+        wanted = tuple(self._input_signature_value(title, inputs.get(title)) for _, title in self.partial_cols)
+        ranked = []
+        for signature, row in table.items():
+            mismatches = []
+            weight = 0
+            for (_, title), want, have in zip(self.partial_cols, wanted, signature):
+                if want == have:
+                    continue
+                if want is None:
+                    kind = 'missing_input'
+                elif have is None:
+                    kind = 'not_in_record'
+                else:
+                    kind = 'different'
+                weight += MISMATCH_WEIGHTS[kind]
+                mismatches.append({
+                    "field": title,
+                    "input": inputs.get(title),
+                    "record": summary_name(have) if title == 'SUMMARY' and have else have,
+                    "kind": kind,
+                })
+            ranked.append((len(mismatches), weight, row, signature, mismatches))
+        ranked.sort(key=lambda item: item[:3])
+
+        suggestions = []
+        for _, _, row, signature, mismatches in ranked[:limit]:
+            suggested = {title: inputs[title] for title in PARTIAL_SKIP_FIELDS if inputs.get(title) not in (None, '')}
+            for (_, title), have in zip(self.partial_cols, signature):
+                if have is not None:
+                    suggested[title] = summary_name(have) if title == 'SUMMARY' else have
+            suggestions.append({"row": row, "mismatches": mismatches, "inputs": suggested})
+        return suggestions
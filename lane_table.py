@@ -0,0 +1,205 @@
+import numpy as np
+
+from cost_model import parse_lead_time
+from lane_index import SUMMARY_NAMES, summary_name
+
+SORT_KEYS = ('cost', 'lt')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+class _Column:
+    """Strings of one column dictionary-encoded: `codes[i]` indexes `values`, -1 when empty."""
+
+    __slots__ = ('values', 'lookup', 'codes')
+
+    def __init__(self, items):
+        self.values = []
+        self.lookup = {}
+        codes = np.full(len(items), -1, dtype=np.int32)
+        for i, val in enumerate(items):
+            if val is None:
+                continue
+            key = str(val).strip()
+            code = self.lookup.get(key)
+            if code is None:
+                code = self.lookup[key] = len(self.values)
+                self.values.append(val)
+            codes[i] = code
+        self.codes = codes
+
+    def mask(self, wanted):
+        """Rows whose value is one of `wanted` (compared as stripped text)."""
+        codes = [self.lookup[k] for k in (str(v).strip() for v in wanted) if k in self.lookup]
+        if not codes:
+            return np.zeros(len(self.codes), dtype=bool)
+        return np.isin(self.codes, codes)
+
+    def value(self, i):
+        code = self.codes[i]
+        return self.values[code] if code >= 0 else None
+
+
+class LaneTable:
+    """
+    Every lane record of the priced sheets as columns, for lane queries.
+
+    Built once per workbook from the compiled lane indexes and record spans:
+    sheet, MAP node, From, To and each field column are dictionary-encoded,
+    and the record's E2E Cost (the value cached in the sheet) and lead-time
+    days are float arrays, so a query is a few vectorized comparisons and a
+    sort over the matching records; no sheet cell is read.
+    """
+
+    def __init__(self, sheets, schemas, lane_index, record_spans, lt_ranges):
+        records = []
+        sheet_order = {name: i for i, name in enumerate(lane_index)}
+        for sheet_name, lanes in lane_index.items():
+            for (node, frm, to), rows in lanes.match_rows.items():
+                records.extend((sheet_name, node, frm, to, r) for r in rows)
+        records.sort(key=lambda rec: (sheet_order[rec[0]], rec[4]))
+
+        n = len(records)
+        self.size = n
+        self.rows = np.array([rec[4] for rec in records], dtype=np.int32)
+        self.sheet = _Column([rec[0] for rec in records])
+        self.node = _Column([rec[1] for rec in records])
+        self.frm = _Column([rec[2] for rec in records])
+        self.to = _Column([rec[3] for rec in records])
+
+        self.cost = np.full(n, np.nan)
+        self.lt_min = np.full(n, np.nan)
+        self.lt_max = np.full(n, np.nan)
+        self.lead_time = [""] * n
+        field_values = {}   # title -> value per record
+        for i, (sheet_name, _, _, _, r) in enumerate(records):
+            ws = sheets[sheet_name]
+            schema = schemas[sheet_name]
+            spans = record_spans[sheet_name]
+            span = spans.get(r)
+            if schema.e2e_cost_col and isinstance(span.cost, (int, float)) and not isinstance(span.cost, bool):
+                self.cost[i] = span.cost
+            if span.lead_time:
+                self.lead_time[i] = span.lead_time
+                days = lt_ranges.get(span.lead_time) or parse_lead_time(span.lead_time)
+                if days:
+                    self.lt_min[i], self.lt_max[i] = days
+            for c, title in schema.field_cols:
+                # Same record values as ExcelHandler._record_inputs
+                val = spans.field_value(ws, r, c)
+                if val is None or str(val).strip().upper() in ('', 'N/A'):
+                    continue
+                if title == 'SUMMARY':
+                    val = summary_name(val)
+                if title not in field_values:
+                    field_values[title] = [None] * n
+                field_values[title][i] = val
+        self.fields = {title: _Column(values) for title, values in field_values.items()}
+
+    def query(self, params):
+        """
+        Records matching `params`, sorted and paginated.
+
+        node, from, to, sheet: a value or a list of values; location:
+        "From -> To"; fields: {field title: value or list of values}, SUMMARY
+        by display name or code; cost_min/cost_max bound the E2E Cost and
+        lt_min/lt_max the lead-time days (a record passes when its whole
+        range lies within them); sort: 'cost' or 'lt', '-' for descending,
+        records without a value last; offset and limit page the result.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        location = params.get('location')
+        if location:
+            if '->' not in str(location):
+                raise ValueError("location must be 'From -> To'")
+            frm, to = [s.strip() for s in str(location).split('->', 1)]
+            mask &= self.frm.mask([frm]) & self.to.mask([to])
+        for name, column in (('sheet', self.sheet), ('node', self.node), ('from', self.frm), ('to', self.to)):
+            wanted = _values(params.get(name))
+            if wanted:
+                mask &= column.mask(wanted)
+
+        fields = params.get('fields') or {}
+        if not isinstance(fields, dict):
+            raise ValueError("fields must be an object")
+        for title, wanted in fields.items():
+            wanted = _values(wanted)
+            if not wanted:
+                continue
+            column = self.fields.get(title)
+            if column is None:
+                raise ValueError(f"Unknown field: {title}")
+            if title == 'SUMMARY':
+                wanted = [SUMMARY_NAMES.get(str(v).strip(), v) for v in wanted]
+            mask &= column.mask(wanted)
+
+        for name, values, compare in (('cost_min', self.cost, np.greater_equal), ('cost_max', self.cost, np.less_equal),
+                                      ('lt_min', self.lt_min, np.greater_equal), ('lt_max', self.lt_max, np.less_equal)):
+            bound = _number(params, name)
+            if bound is not None:
+                mask &= compare(values, bound)   # NaN never passes
+
+        matched = np.flatnonzero(mask)
+        order = self._order(matched, params.get('sort') or 'cost')
+        offset = max(_integer(params, 'offset', 0), 0)
+        limit = min(max(_integer(params, 'limit', DEFAULT_LIMIT), 1), MAX_LIMIT)
+        page = matched[order[offset:offset + limit]]
+        return {
+            "total": int(len(matched)),
+            "offset": offset,
+            "limit": limit,
+            "lanes": [self._record(i) for i in page],
+        }
+
+    def _order(self, matched, sort):
+        key = sort.lstrip('-') if isinstance(sort, str) else None
+        if key not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}, optionally prefixed with '-'")
+        sign = -1 if sort.startswith('-') else 1
+        if key == 'cost':
+            keys = (self.lt_max[matched], sign * self.cost[matched])
+        else:
+            keys = (self.cost[matched], sign * self.lt_min[matched], sign * self.lt_max[matched])
+        # lexsort sorts by the last key first and puts NaN last; ties keep sheet order
+        return np.lexsort((np.arange(len(matched)),) + keys)
+
+    def _record(self, i):
+        frm, to = self.frm.value(i), self.to.value(i)
+        cost = self.cost[i]
+        lt_days = None if np.isnan(self.lt_min[i]) else [int(self.lt_min[i]), int(self.lt_max[i])]
+        return {
+            "sheet": self.sheet.value(i),
+            "node": self.node.value(i),
+            "location": f"{frm} -> {to}",
+            "row": int(self.rows[i]),
+            "inputs": {title: column.value(i) for title, column in self.fields.items() if column.codes[i] >= 0},
+            "cost": None if np.isnan(cost) else float(cost),
+            "lt": self.lead_time[i],
+            "lt_days": lt_days,
+        }
+
+
+def _values(val):
+    if val is None or val == '':
+        return []
+    return val if isinstance(val, list) else [val]
+
+
+def _number(params, name):
+    val = params.get(name)
+    if val is None or val == '':
+        return None
+    try:
+        return float(val)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+
+def _integer(params, name, default):
+    val = params.get(name)
+    if val is None or val == '':
+        return default
+    try:
+        return int(val)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
@@ -0,0 +1,444 @@
+"""
+Load/soak test of the HTTP API: virtual users replay sessions of
+/api/routes -> /api/fields -> /api/calculate calls against a local server.
+
+    python loadtest.py                                  # start gunicorn, 8 users for 30 s
+    python loadtest.py --concurrency 32 --duration 600  # soak
+    python loadtest.py --upload-every 5                 # upload a workbook every 5 s meanwhile
+    python loadtest.py --url http://127.0.0.1:5000      # an already running server
+    python loadtest.py --traffic recorded.ndjson        # replay recorded traffic
+    python loadtest.py -o run.json --save-traffic sessions.ndjson
+
+Sessions are synthesized from the server's own routes and fields the way
+the UI walks them (pick a lane, list its fields, narrow them with the
+choices made, calculate), or read from an NDJSON traffic file: one request
+per line as {"session", "method", "path", "body"}, which is what the app
+writes with SHP_RECORD_TRAFFIC set. Each user keeps the ETags it was sent
+and revalidates with If-None-Match, like a browser.
+
+Reports latency percentiles, errors and throughput per endpoint; calls to
+/api/calculate made while an upload was being compiled are also reported
+on their own. Content the server compiled before comes from its snapshot,
+so pass a different (larger) workbook with --upload-file to keep the
+compile pool busy; the upload becomes the active workbook.
+
+Runs offline with the standard library only; the started server gets a
+temporary upload folder, so the checkout is left untouched.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_UPLOAD = os.path.join(BASE_DIR, '5.shipping cost based on summary.xlsx')
+QUANTITY_FIELDS = ('PALLET QTY', 'CBM', 'G/W')
+PERCENTILES = (50, 95, 99)
+DURING_UPLOAD = 'POST /api/calculate (during upload)'
+
+
+class Client:
+    """One keep-alive connection with a browser-like ETag cache."""
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.timeout = timeout
+        self.conn = None
+        self.etags = {}
+
+    def request(self, method, path, body=None, headers=None):
+        """(status, response bytes); reconnects once when the connection was dropped."""
+        headers = dict(headers or {}, **{'Accept-Encoding': 'gzip'})
+        if method == 'GET' and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request(method, path, body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+        etag = response.getheader('ETag')
+        if method == 'GET' and etag:
+            self.etags[path] = etag
+        return response.status, data
+
+    def json(self, method, path, body=None):
+        """Decoded JSON of an uncached, uncompressed request (used to synthesize sessions)."""
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        self.conn.request(method, path, json.dumps(body).encode() if body is not None else None, headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"{method} {path}: HTTP {response.status} {data[:200]!r}")
+        return json.loads(data)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def _pick_inputs(fields, rng):
+    """A choice for every field, quantities sometimes off the listed values (a partial match)."""
+    inputs = {}
+    for field in fields:
+        if not field['options']:
+            continue
+        val = rng.choice(field['options'])
+        if field['name'] in QUANTITY_FIELDS and isinstance(val, (int, float)) and rng.random() < 0.3:
+            val = round(val * rng.uniform(0.5, 2), 1)
+        inputs[field['name']] = val
+    return inputs
+
+
+def synthesize_sessions(base_url, count, seed=0, max_sections=3):
+    """
+    `count` sessions built from the server's routes and fields: each lists
+    the routes, then per section (1..max_sections lanes) its fields and the
+    fields narrowed by the choices, then calculates the selections.
+    """
+    rng = random.Random(seed)
+    client = Client(base_url)
+    try:
+        routes = client.json('GET', '/api/routes')
+        lanes = [(node, loc) for node, opts in sorted(routes.items()) for loc in opts['locations']]
+        if not lanes:
+            raise RuntimeError("The server lists no routes")
+        fields = {}
+        sessions = []
+        for n in range(count):
+            session = f"synthetic-{n}"
+            requests = [{"session": session, "method": "GET", "path": "/api/routes", "body": None}]
+            selections = []
+            for node, location in rng.sample(lanes, min(len(lanes), rng.randint(1, max_sections))):
+                path = '/api/fields?' + urlencode({'node': node, 'location': location})
+                if path not in fields:
+                    fields[path] = client.json('GET', path)
+                inputs = _pick_inputs(fields[path], rng)
+                requests.append({"session": session, "method": "GET", "path": path, "body": None})
+                requests.append({"session": session, "method": "POST", "path": "/api/fields",
+                                 "body": {"node": node, "location": location, "inputs": inputs}})
+                selections.append({"node": node, "location": location, "inputs": inputs})
+            requests.append({"session": session, "method": "POST", "path": "/api/calculate", "body": selections})
+            sessions.append(requests)
+        return sessions
+    finally:
+        client.close()
+
+
+def load_traffic(path):
+    """
+    Sessions of a traffic file, each in file order. The ?workbook= of a
+    recorded request is dropped: replays go to the server's active workbook.
+    """
+    sessions = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            req = json.loads(line)
+            parts = urlsplit(req['path'])
+            query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'workbook']
+            req['path'] = parts.path + ('?' + urlencode(query) if query else '')
+            sessions.setdefault(req.get('session', ''), []).append(req)
+    return list(sessions.values())
+
+
+def save_traffic(path, sessions):
+    with open(path, 'w', encoding='utf-8') as f:
+        for requests in sessions:
+            for req in requests:
+                f.write(json.dumps(req, ensure_ascii=False) + '\n')
+
+
+def _endpoint(method, path):
+    return f"{method} {urlsplit(path).path}"
+
+
+class Samples:
+    """(endpoint, start, seconds, status, error) of every request made."""
+
+    def __init__(self):
+        self.items = []
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, start, seconds, status, error=None):
+        with self._lock:
+            self.items.append((endpoint, start, seconds, status, error))
+
+
+def _timed_request(client, samples, method, path, body=None, headers=None):
+    start = time.perf_counter()
+    try:
+        status, data = client.request(method, path, body, headers)
+    except (OSError, http.client.HTTPException) as e:
+        samples.add(_endpoint(method, path), start, time.perf_counter() - start, None, f"{type(e).__name__}: {e}")
+        client.close()
+        return None, None
+    error = f"HTTP {status}" if status >= 400 else None
+    samples.add(_endpoint(method, path), start, time.perf_counter() - start, status, error)
+    return status, data
+
+
+def run_users(base_url, sessions, samples, concurrency, duration, stop):
+    """`concurrency` users replaying the sessions round-robin until `duration` seconds or stop is set."""
+    order = itertools.cycle(sessions)
+    order_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user():
+        client = Client(base_url)
+        try:
+            while not stop.is_set() and time.perf_counter() < deadline:
+                with order_lock:
+                    requests = next(order)
+                for req in requests:
+                    if stop.is_set() or time.perf_counter() >= deadline:
+                        break
+                    _timed_request(client, samples, req['method'], req['path'], req.get('body'))
+        finally:
+            client.close()
+
+    users = [threading.Thread(target=user, name=f'user-{i}', daemon=True) for i in range(concurrency)]
+    for t in users:
+        t.start()
+    for t in users:
+        t.join()
+
+
+def _multipart(file_path, filename):
+    boundary = uuid.uuid4().hex
+    with open(file_path, 'rb') as f:
+        content = f.read()
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            'Content-Type: application/vnd.openxmlformats-officedocument.spreadsheetml.sheet\r\n\r\n').encode()
+    body += content + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+def run_uploads(base_url, file_path, every, samples, windows, stop):
+    """
+    Upload file_path every `every` seconds until stop is set, each time
+    waiting for its ingest job; windows gets the (start, end) of each job.
+    """
+    client = Client(base_url)
+    body, headers = _multipart(file_path, os.path.basename(file_path))
+    try:
+        while not stop.wait(every):
+            start = time.perf_counter()
+            status, data = _timed_request(client, samples, 'POST', '/api/upload', body, headers)
+            if status != 202:
+                continue
+            status_url = json.loads(data)['status_url']
+            job = {}
+            while job.get('status') not in ('done', 'failed'):
+                time.sleep(0.05)
+                status, data = client.request('GET', status_url)
+                if status != 200:
+                    break
+                job = json.loads(data)
+            end = time.perf_counter()
+            windows.append((start, end))
+            samples.add('upload job', start, end - start, status,
+                        None if job.get('status') == 'done' else f"job {job.get('status')}: {job.get('error')}")
+    finally:
+        client.close()
+
+
+def _percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, windows, wall_seconds):
+    """Per endpoint: requests, errors (with a few examples), throughput and latency percentiles in ms."""
+    groups = {}
+    for endpoint, start, seconds, status, error in samples.items:
+        groups.setdefault(endpoint, []).append((seconds, status, error))
+        if endpoint == 'POST /api/calculate' and any(a <= start < b for a, b in windows):
+            groups.setdefault(DURING_UPLOAD, []).append((seconds, status, error))
+    report = {}
+    for endpoint, items in sorted(groups.items()):
+        latencies = sorted(s * 1000 for s, _, _ in items)
+        errors = [e for _, _, e in items if e]
+        statuses = {}
+        for _, status, _ in items:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        stats = {
+            "requests": len(items),
+            "errors": len(errors),
+            "error_examples": sorted(set(errors))[:3],
+            "statuses": statuses,
+            "throughput_rps": round(len(items) / wall_seconds, 2) if wall_seconds else None,
+            "max_ms": round(latencies[-1], 3),
+        }
+        for p in PERCENTILES:
+            stats[f"p{p}_ms"] = round(_percentile(latencies, p), 3)
+        report[endpoint] = stats
+    return report
+
+
+def _print_report(report, wall_seconds):
+    print(f"{'endpoint':<38} {'reqs':>7} {'errs':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+          file=sys.stderr)
+    for endpoint, s in report.items():
+        print(f"{endpoint:<38} {s['requests']:>7} {s['errors']:>5} {s['throughput_rps']:>8} {s['p50_ms']:>8.1f} "
+              f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}", file=sys.stderr)
+        for example in s['error_examples']:
+            print(f"    {example}", file=sys.stderr)
+    print(f"{wall_seconds:.1f} s", file=sys.stderr)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, workers, threads, upload_dir, log_path, timeout=120):
+    """
+    Start app.py on a free local port (gunicorn with gunicorn.conf.py, or
+    Flask's threaded development server); returns (process, base URL) once
+    it answers /api/routes.
+    """
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads),
+               SHP_UPLOAD_FOLDER=upload_dir, SHP_LOG_STDOUT='0')
+    if kind == 'gunicorn':
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', 'app:app']
+    else:
+        cmd = [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log = open(log_path, 'wb')
+    process = subprocess.Popen(cmd, cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}, see {log_path}")
+        client = Client(base_url, timeout=5)
+        try:
+            if client.request('GET', '/api/routes')[0] == 200:
+                return process, base_url
+        except OSError:
+            pass
+        finally:
+            client.close()
+        time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"Server did not start within {timeout} s, see {log_path}")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay API sessions against a local server and report latencies")
+    parser.add_argument('--url', help="server to test, default: start one")
+    parser.add_argument('--server', choices=('gunicorn', 'flask'), default='gunicorn',
+                        help="server to start when --url is not given")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers of the started server")
+    parser.add_argument('--threads', type=int, default=4, help="gunicorn threads per worker")
+    parser.add_argument('--concurrency', type=int, default=8, help="virtual users")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    parser.add_argument('--sessions', type=int, default=200, help="sessions to synthesize")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--traffic', help="NDJSON traffic file to replay instead of synthesized sessions")
+    parser.add_argument('--save-traffic', help="write the replayed sessions to this NDJSON file")
+    parser.add_argument('--upload-every', type=float, help="upload a workbook every N seconds during the run")
+    parser.add_argument('--upload-file', default=DEFAULT_UPLOAD, help="workbook uploaded by --upload-every")
+    parser.add_argument('-o', '--output', help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        base_url = args.url
+        if base_url is None:
+            log_path = os.path.join(tmp, 'server.log')
+            print(f"starting {args.server}...", file=sys.stderr)
+            process, base_url = start_server(args.server, args.workers, args.threads,
+                                             os.path.join(tmp, 'uploads'), log_path)
+        try:
+            if args.traffic:
+                sessions = load_traffic(args.traffic)
+            else:
+                sessions = synthesize_sessions(base_url, args.sessions, args.seed)
+            if not sessions:
+                raise SystemExit("No sessions to replay")
+            if args.save_traffic:
+                save_traffic(args.save_traffic, sessions)
+
+            print(f"{len(sessions)} sessions, {args.concurrency} users, {args.duration:g} s against {base_url}",
+                  file=sys.stderr)
+            samples = Samples()
+            windows = []
+            stop = threading.Event()
+            uploader = None
+            if args.upload_every:
+                uploader = threading.Thread(target=run_uploads, daemon=True,
+                                            args=(base_url, args.upload_file, args.upload_every, samples, windows, stop))
+                uploader.start()
+            start = time.perf_counter()
+            try:
+                run_users(base_url, sessions, samples, args.concurrency, args.duration, stop)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                stop.set()
+            wall = time.perf_counter() - start
+            if uploader is not None:
+                uploader.join()
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    report = {
+        "url": args.url,
+        "server": None if args.url else args.server,
+        "concurrency": args.concurrency,
+        "duration_s": round(wall, 3),
+        "sessions": len(sessions),
+        "uploads": len(windows),
+        "endpoints": summarize(samples, windows, wall),
+    }
+    _print_report(report['endpoints'], wall)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(report, indent=2, ensure_ascii=False) + '\n')
+    # Exit status 1 when any request failed
+    return 1 if any(s['errors'] for s in report['endpoints'].values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
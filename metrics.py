@@ -0,0 +1,180 @@
+import bisect
+import os
+import threading
+from contextvars import ContextVar
+from time import perf_counter
+
+# Request latency buckets (seconds) and workbook load buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LOAD_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_timings = ContextVar('shp_timings', default=None)
+
+
+class Timings:
+    """Seconds spent per phase by the current request, in first-use order."""
+
+    __slots__ = ('phases',)
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+
+def start_timings():
+    """Collect phase timings in the current context; returns (Timings, token for stop_timings)."""
+    timings = Timings()
+    return timings, _timings.set(timings)
+
+
+def stop_timings(token):
+    _timings.reset(token)
+
+
+class _Phase:
+    __slots__ = ('name', 'timings', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _timings.get()
+        if self.timings is not None:
+            self.start = perf_counter()
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            self.timings.add(self.name, perf_counter() - self.start)
+
+
+def timed(name):
+    """
+    Context manager adding its duration to phase `name` of the current
+    request; a no-op outside a request that collects timings.
+    """
+    return _Phase(name)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in Prometheus text format."""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}   # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[i] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for values, counts in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = _labels(self.labels, values, f'le="{_number(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(counts[-1])}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """A value per label set that goes up and down (inc/dec) or is set at scrape time."""
+
+    def __init__(self, name, documentation, labels=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, *label_values):
+        self.inc(*label_values, amount=-1)
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('shp_http_request_duration_seconds', 'Request latency by endpoint.',
+                            ('endpoint', 'method', 'status'))
+PHASE_SECONDS = Histogram('shp_request_phase_duration_seconds',
+                          'Time per request spent in each phase (match, formula, breakdown, json).', ('phase',))
+IN_FLIGHT = Gauge('shp_http_requests_in_flight', 'Requests being served.')
+LOAD_SECONDS = Histogram('shp_workbook_load_duration_seconds',
+                         'Workbook load time by phase (read, headers, index, compile, snapshot).',
+                         ('phase',), LOAD_BUCKETS)
+
+
+def cache_metrics(stats):
+    """Result cache metrics from ResultCache.stats(), built at scrape time."""
+    hits = Gauge('shp_result_cache_hits_total', 'Result cache hits by kind.', ('kind',), kind='counter')
+    misses = Gauge('shp_result_cache_misses_total', 'Result cache misses by kind.', ('kind',), kind='counter')
+    ratio = Gauge('shp_result_cache_hit_ratio', 'Result cache hits / lookups by kind.', ('kind',))
+    size = Gauge('shp_result_cache_entries', 'Entries held by the result cache.')
+    for kind in stats['hits']:
+        hit, miss = stats['hits'][kind], stats['misses'][kind]
+        hits.set(hit, kind)
+        misses.set(miss, kind)
+        ratio.set(hit / (hit + miss) if hit + miss else 0.0, kind)
+    size.set(stats['size'])
+    return [hits, misses, ratio, size]
+
+
+def render(extra=()):
+    """
+    Every metric in Prometheus text exposition format. Metrics are kept per
+    process, so each gunicorn worker reports its own; `extra` adds metrics
+    computed at scrape time.
+    """
+    lines = []
+    for metric in (REQUEST_SECONDS, PHASE_SECONDS, IN_FLIGHT, LOAD_SECONDS) + tuple(extra):
+        lines.extend(metric.render())
+    lines.append('# HELP shp_process_id Process serving this scrape.')
+    lines.append('# TYPE shp_process_id gauge')
+    lines.append(f'shp_process_id {os.getpid()}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,135 @@
+import csv
+import io
+import json
+import os
+
+from openpyxl import Workbook
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+SECTION_COLUMNS = ['scenario', 'section', 'node', 'location', 'inputs', 'cost', 'lt', 'error',
+                   'scenario_total_cost', 'scenario_total_lt']
+CHUNK_SIZE = 1 << 16
+
+
+def read_ndjson(stream):
+    """
+    (scenario, error) pairs from an NDJSON request body, one scenario (a list
+    of selections) per non-blank line, read lazily so the body is never held
+    in memory. A line that is not valid JSON yields (None, error).
+    """
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as e:
+            yield None, f"line {line_no}: {e}"
+
+
+def quote_records(handler, items):
+    """
+    One export record per (scenario, error) item, priced as it is read:
+    {scenario, sections: [(selection, result)], total_cost, total_lt, error}.
+    """
+    ctx = handler.new_context()
+    for i, (selections, error) in enumerate(items, 1):
+        if error is None and not isinstance(selections, list):
+            error = "Expected a list of selections"
+        if error:
+            yield {"scenario": i, "sections": [], "total_cost": 0, "total_lt": "N/A", "error": error}
+            continue
+        yield dict(handler.quote_scenario(selections, ctx), scenario=i, error=None)
+
+
+def _section_fields(sel, result):
+    sel = sel if isinstance(sel, dict) else {}
+    result = result or {}
+    return {
+        "node": sel.get('node'),
+        "location": sel.get('location'),
+        "inputs": sel.get('inputs', {}),
+        "cost": result.get('cost'),
+        "lt": result.get('lt'),
+        "error": result.get('error') if result else "Skipped: missing node or location",
+    }
+
+
+def csv_chunks(records):
+    """CSV text, one row per section, flushed after every scenario."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM so Excel opens the UTF-8 (Chinese error texts) correctly
+    buf.write('﻿')
+    writer.writerow(SECTION_COLUMNS)
+    for record in records:
+        totals = [record['total_cost'], record['total_lt']]
+        if record['error']:
+            writer.writerow([record['scenario'], '', '', '', '', '', '', record['error']] + totals)
+        for n, (sel, result) in enumerate(record['sections'], 1):
+            f = _section_fields(sel, result)
+            writer.writerow([record['scenario'], n, f['node'], f['location'],
+                             json.dumps(f['inputs'], ensure_ascii=False, default=str),
+                             f['cost'], f['lt'], f['error'] or ''] + totals)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+
+
+def ndjson_chunks(records):
+    """One JSON line per scenario, sections with their breakdowns."""
+    for record in records:
+        sections = []
+        for sel, result in record['sections']:
+            f = _section_fields(sel, result)
+            f['breakdown'] = (result or {}).get('breakdown')
+            sections.append(f)
+        line = {
+            "scenario": record['scenario'],
+            "total_cost": record['total_cost'],
+            "total_lt": record['total_lt'],
+            "sections": sections,
+        }
+        if record['error']:
+            line['error'] = record['error']
+        yield json.dumps(line, ensure_ascii=False, default=str) + '\n'
+
+
+def write_xlsx(records, path):
+    """
+    Write the records to path with openpyxl's write-only mode, which spools
+    rows to disk: Scenarios (totals), Sections and Breakdown (the base and
+    variable items of each section, as _get_breakdown_merged returns them).
+    """
+    wb = Workbook(write_only=True)
+    scenarios = wb.create_sheet('Scenarios')
+    sections = wb.create_sheet('Sections')
+    breakdowns = wb.create_sheet('Breakdown')
+    scenarios.append(['scenario', 'total_cost', 'total_lt', 'error'])
+    sections.append(SECTION_COLUMNS[:8])
+    breakdowns.append(['scenario', 'section', 'node', 'location', 'type', 'name', 'rate', 'amount'])
+    for record in records:
+        scenarios.append([record['scenario'], record['total_cost'], record['total_lt'], record['error']])
+        for n, (sel, result) in enumerate(record['sections'], 1):
+            f = _section_fields(sel, result)
+            sections.append([record['scenario'], n, f['node'], f['location'],
+                             json.dumps(f['inputs'], ensure_ascii=False, default=str), f['cost'], f['lt'], f['error']])
+            breakdown = (result or {}).get('breakdown') or {}
+            for kind in ('base', 'variable'):
+                for item in breakdown.get(kind, []):
+                    breakdowns.append([record['scenario'], n, f['node'], f['location'], kind,
+                                       item['name'], item['row1'], item['row2']])
+    wb.save(path)
+
+
+def file_chunks(path):
+    """Stream a file in chunks, deleting it once sent (or abandoned)."""
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,141 @@
+from cost_model import is_date_format
+
+
+class RecordSpan:
+    """
+    Rows of one record. The first row holds its fields and rate texts; the
+    last row (the same row for a single-row record) holds the amounts.
+    `cost` and `lead_time` are the record's E2E Cost and Lead Time read
+    from the right rows.
+    """
+
+    __slots__ = ('first', 'last', 'kind', 'cost', 'lead_time')
+
+    def __init__(self, first, last, kind):
+        self.first = first
+        self.last = last
+        self.kind = kind            # 'merged', 'single' or 'unmerged' (two rows by position only)
+        self.cost = 0
+        self.lead_time = ""
+
+    def __getstate__(self):
+        # A plain tuple: snapshots hold one span per record
+        return self.first, self.last, self.kind, self.cost, self.lead_time
+
+    def __setstate__(self, state):
+        self.first, self.last, self.kind, self.cost, self.lead_time = state
+
+    @property
+    def value_row(self):
+        return self.last
+
+    @property
+    def is_single_row(self):
+        return self.first == self.last
+
+
+class RecordSpans:
+    """
+    The record spans of one sheet, resolved once at load from its merged
+    ranges and record boundaries.
+
+    A record starts at each row with a MAP node. A record whose MAP cell
+    (or failing that, another field or E2E Cost cell) is merged down
+    spans the merged rows. An unmerged record is a single row when the
+    next row starts another record or is blank. A record that neither
+    rule classifies is listed in `unclassified` with the reading used
+    for it. Examples: an unmerged record followed by a row that has
+    values but no MAP node, or merges that disagree or run into the next
+    record.
+    """
+
+    def __init__(self, ws, schema):
+        self.spans = {}             # first row -> RecordSpan
+        self.unclassified = []      # {"row", "rows", "reason"}
+        if not schema.map_col:
+            return
+        header_row, map_col = schema.header_row, schema.map_col
+        key_cols = {c for c in (schema.from_col, schema.to_col, schema.e2e_cost_col) if c}
+        key_cols.update(c for c, _ in schema.field_cols)
+
+        map_merges = {}             # first row -> last row of the merged MAP cell
+        other_merges = {}           # first row -> {last rows of merged field / E2E Cost cells}
+        for min_row, min_col, max_row, max_col in ws.merged_ranges:
+            if max_row == min_row or min_row <= header_row:
+                continue
+            if min_col <= map_col <= max_col:
+                map_merges[min_row] = max_row
+            elif any(c in key_cols for c in range(min_col, max_col + 1)):
+                other_merges.setdefault(min_row, set()).add(max_row)
+
+        starts = [r for r in range(header_row + 1, ws.max_row + 1)
+                  if ws.value(r, map_col) and str(ws.value(r, map_col)).strip()]
+        for i, r in enumerate(starts):
+            next_start = starts[i + 1] if i + 1 < len(starts) else ws.max_row + 1
+            if r in map_merges:
+                last, kind = map_merges[r], 'merged'
+                if other_merges.get(r, {last}) != {last}:
+                    self._report(r, last, "merged cells of the record end on different rows; the MAP cell's rows are used")
+            elif r in other_merges:
+                last, kind = max(other_merges[r]), 'merged'
+                if len(other_merges[r]) > 1:
+                    self._report(r, last, "merged cells of the record end on different rows; the longest is used")
+            elif next_start == r + 1 or not any(ws.row_values(r + 1)):
+                last, kind = r, 'single'
+            else:
+                last, kind = r + 1, 'unmerged'
+                self._report(r, last, f"not merged, and row {r + 1} has values but no MAP node; read as a two-row record")
+            if last >= next_start:
+                last = max(next_start - 1, r)
+                kind = 'single' if last == r else kind
+                self._report(r, last, f"merged cells run into the record at row {next_start}; cut at row {last}")
+            elif last > r + 1:
+                self._report(r, last, f"spans {last - r + 1} rows; amounts are read from row {last}")
+            span = RecordSpan(r, last, kind)
+            if schema.e2e_cost_col:
+                span.cost = self._cost(ws, schema.e2e_cost_col, span)
+            if schema.e2e_lt_col:
+                span.lead_time = self._lead_time(ws, schema.e2e_lt_col, span)
+            self.spans[r] = span
+
+    def _report(self, row, last, reason):
+        self.unclassified.append({"row": row, "rows": [row, last], "reason": reason})
+
+    @staticmethod
+    def _cost(ws, col, span):
+        cost = ws.value(span.first, col) or 0
+        if not cost and not span.is_single_row:
+            cost = ws.value(span.value_row, col) or 0
+        return cost
+
+    @staticmethod
+    def _lead_time(ws, col, span):
+        """The days text of the record: of a two-row record, whichever row looks like days, else the lower one."""
+        lt_row1 = ws.value(span.first, col)
+        if span.is_single_row:
+            lt = lt_row1
+        else:
+            lt_row2 = ws.value(span.value_row, col)
+            if is_date_format(lt_row2):
+                lt = lt_row2
+            elif is_date_format(lt_row1):
+                lt = lt_row1
+            else:
+                lt = lt_row2 if lt_row2 and str(lt_row2).strip() else lt_row1
+        return str(lt).strip() if lt else ""
+
+    def get(self, row):
+        """Span of the record starting at row; rows that start no record read as single rows."""
+        span = self.spans.get(row)
+        if span is None:
+            span = RecordSpan(row, row, 'single')
+        return span
+
+    def field_value(self, ws, row, col):
+        """A record's value of a column: its first row's, else (two-row records) its value row's."""
+        val = ws.value(row, col)
+        if val is None:
+            span = self.spans.get(row)
+            if span is not None and not span.is_single_row:
+                val = ws.value(span.value_row, col)
+        return val
@@ -0,0 +1,70 @@
+import os
+import threading
+from collections import Counter, OrderedDict
+
+MISSING = object()
+
+
+class ResultCache:
+    """
+    Bounded LRU of computed results, shared by every loaded workbook.
+
+    Keys are (workbook content hash, kind, key), so a result can only be
+    served for the exact workbook content it was computed from; retain()
+    drops the entries of workbooks that are no longer loaded. Cached values
+    are shared between requests and must not be mutated.
+    """
+
+    def __init__(self, maxsize=None):
+        if maxsize is None:
+            maxsize = int(os.environ.get('SHP_RESULT_CACHE_SIZE', 4096))
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def get(self, kind, version, key):
+        """Cached value, or MISSING."""
+        if version is None or self.maxsize <= 0:
+            return MISSING
+        with self._lock:
+            value = self._entries.get((version, kind, key), MISSING)
+            if value is MISSING:
+                self.misses[kind] += 1
+            else:
+                self._entries.move_to_end((version, kind, key))
+                self.hits[kind] += 1
+            return value
+
+    def put(self, kind, version, key, value):
+        if version is None or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[(version, kind, key)] = value
+            self._entries.move_to_end((version, kind, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def retain(self, versions):
+        """Drop the entries of every workbook version not in versions."""
+        with self._lock:
+            for full_key in [k for k in self._entries if k[0] not in versions]:
+                del self._entries[full_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            kinds = sorted(set(self.hits) | set(self.misses))
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": {kind: self.hits[kind] for kind in kinds},
+                "misses": {kind: self.misses[kind] for kind in kinds},
+            }
+
+
+RESULT_CACHE = ResultCache()
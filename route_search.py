@@ -0,0 +1,104 @@
+import heapq
+import itertools
+
+
+class RouteGraph:
+    """
+    The lanes of every priced sheet as a directed graph of locations.
+
+    Each lane (MAP node, From, To) is one leg from its From location to its
+    To location; `legs[location]` lists the legs leaving a location as
+    (sheet, node, frm, to, [record rows]) in sheet order.
+    """
+
+    def __init__(self, lane_index):
+        self.legs = {}
+        self.locations = set()
+        for sheet_name, lanes in lane_index.items():
+            for (node, frm, to), rows in lanes.match_rows.items():
+                self.legs.setdefault(frm, []).append((sheet_name, node, frm, to, rows))
+                self.locations.update((frm, to))
+
+
+class Label:
+    """A partial route: its totals, its legs and the locations it has visited."""
+
+    __slots__ = ('cost', 'lt_min', 'lt_max', 'legs', 'visited', 'location')
+
+    def __init__(self, cost, lt_min, lt_max, legs, visited, location):
+        self.cost = cost
+        self.lt_min = lt_min
+        self.lt_max = lt_max
+        self.legs = legs
+        self.visited = visited
+        self.location = location
+
+    def dominates(self, other):
+        """No worse on cost and lead time, with no more legs and no extra visited locations."""
+        return (self.cost <= other.cost and self.lt_max <= other.lt_max and self.lt_min <= other.lt_min
+                and len(self.legs) <= len(other.legs) and self.visited <= other.visited)
+
+    def beats(self, other):
+        """No worse on cost and lead time: `other` cannot lead to a better route."""
+        return self.cost <= other.cost and self.lt_max <= other.lt_max and self.lt_min <= other.lt_min
+
+
+def _pareto(options):
+    """Options (cost, lt_min, lt_max, payload) not beaten by another option, cheapest first."""
+    front = []
+    for opt in sorted(options, key=lambda o: (o[0], o[2], o[1])):
+        if not any(f[0] <= opt[0] and f[2] <= opt[2] and f[1] <= opt[1] for f in front):
+            front.append(opt)
+    return front
+
+
+def search_routes(graph, origin, destination, leg_options, max_legs=6):
+    """
+    Pareto-optimal routes from origin to destination.
+
+    leg_options(leg) returns the priced alternatives of a leg as
+    (cost, lt_min, lt_max, payload) tuples. Routes never revisit a location
+    and have at most max_legs legs. Labels are expanded cheapest first;
+    a label is pruned when another label at the same location dominates it
+    or a route already found beats it, since costs and lead times only grow.
+    Returns (routes as Labels ordered by cost, number of labels expanded).
+    """
+    counter = itertools.count()
+    start = Label(0, 0, 0, (), frozenset([origin]), origin)
+    heap = [(0, 0, 0, next(counter), start)]
+    at_location = {origin: [start]}
+    priced = {}
+    found = []
+    expanded = 0
+
+    while heap:
+        _, _, _, _, label = heapq.heappop(heap)
+        if label is not start and label not in at_location[label.location]:
+            continue    # dominated after it was queued
+        if any(route.beats(label) for route in found):
+            continue
+        if label.location == destination:
+            found.append(label)
+            continue
+        if len(label.legs) >= max_legs:
+            continue
+        expanded += 1
+        for leg in graph.legs.get(label.location, ()):
+            to = leg[3]
+            if to in label.visited:
+                continue
+            key = leg[:4]
+            if key not in priced:
+                priced[key] = _pareto(leg_options(leg))
+            for cost, lt_min, lt_max, payload in priced[key]:
+                nxt = Label(label.cost + cost, label.lt_min + lt_min, label.lt_max + lt_max,
+                            label.legs + (payload,), label.visited | {to}, to)
+                labels = at_location.setdefault(to, [])
+                if any(other.dominates(nxt) for other in labels):
+                    continue
+                labels[:] = [other for other in labels if not nxt.dominates(other)]
+                labels.append(nxt)
+                heapq.heappush(heap, (nxt.cost, nxt.lt_max, nxt.lt_min, next(counter), nxt))
+
+    found.sort(key=lambda r: (r.cost, r.lt_max, r.lt_min))
+    return found, expanded
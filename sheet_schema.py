@@ -0,0 +1,83 @@
+GREEN_RGB = ['FF92D050', '92D050']
+
+
+class SheetSchema:
+    """
+    Column layout of one priced sheet, resolved once when the workbook loads.
+
+    Holds the header row, the MAP/From/To columns, a header name -> column
+    map, the field columns shown to the user (To+1 .. SUMMARY), the E2E
+    Cost / Lead Time columns and the numbered breakdown columns with their
+    green (variable) / base classification.
+    """
+
+    def __init__(self, ws):
+        self.sheet_name = ws.title
+        self.max_column = ws.max_column
+        self.header_row, self.map_col, self.from_col, self.to_col = self._find_header_info(ws)
+
+        self.columns = {}
+        self.titles = {}
+        for c in range(1, ws.max_column + 1):
+            title = ws.value(self.header_row, c)
+            self.titles[c] = title
+            if title is not None and title not in self.columns:
+                self.columns[title] = c
+
+        self.summary_col = self.columns.get('SUMMARY')
+        self.e2e_cost_col = self.columns.get('E2E Cost')
+        self.e2e_lt_col = self.columns.get('E2E Lead Time')
+        self.pallet_col = self.columns.get('PALLET QTY')
+        self.cbm_col = self.columns.get('CBM')
+        self.gw_col = self.columns.get('G/W')
+
+        # Field columns listed by get_node_fields (header-info To column)
+        self.field_cols = []
+        if self.summary_col and self.to_col:
+            for c in range(self.to_col + 1, self.summary_col + 1):
+                if self.titles.get(c):
+                    self.field_cols.append((c, self.titles[c]))
+
+        # Field columns compared by partial matching (first 'To' header)
+        self.match_cols = None
+        to_col_idx = self.columns.get('To')
+        if self.summary_col and to_col_idx:
+            self.match_cols = [(c, self.titles[c]) for c in range(to_col_idx + 1, self.summary_col + 1) if self.titles.get(c)]
+
+        self.breakdown_cols = []
+        for c in range(1, ws.max_column + 1):
+            idx_val = ws.value(1, c)
+            if idx_val is None or not self._is_index(idx_val):
+                continue
+            title = self.titles.get(c)
+            if not title:
+                continue
+            is_green = str(ws.fill_rgb(1, c)) in GREEN_RGB
+            self.breakdown_cols.append((c, str(title).strip(), is_green))
+
+    @staticmethod
+    def _is_index(val):
+        try:
+            int(val)
+            return True
+        except (ValueError, TypeError):
+            return str(val).isdigit()
+
+    @staticmethod
+    def _find_header_info(ws):
+        for r in range(1, 6):
+            row_values = []
+            for c in range(1, min(ws.max_column + 1, 30)):
+                row_values.append(ws.value(r, c))
+
+            if 'MAP' in row_values:
+                map_col = from_col = to_col = None
+                for idx, val in enumerate(row_values):
+                    if val == 'MAP': map_col = idx + 1
+                    elif val == 'From': from_col = idx + 1
+                    elif val == 'To': to_col = idx + 1
+                return r, map_col, from_col, to_col
+        return 2, None, None, None
+
+    def col(self, header_name):
+        return self.columns.get(header_name)
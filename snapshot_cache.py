@@ -0,0 +1,61 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Bump whenever SheetData, SheetSchema, RecordSpans, LaneIndex, LaneTable or the cost model change
+# shape, so snapshots written by older code are ignored and rebuilt.
+FORMAT_VERSION = 7
+MAGIC = 'SHP-SNAPSHOT'
+SNAPSHOT_DIR = '.snapshots'
+
+
+def file_digest(file_path):
+    """SHA-256 hex digest of the file content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_path(file_path, digest):
+    """
+    Where the compiled snapshot of a workbook lives: a .snapshots folder next
+    to the source file, named by content hash and format version. Uploads
+    cannot write into that folder (secure_filename strips path separators),
+    so only snapshots written by the server itself are ever unpickled.
+    """
+    folder = os.path.join(os.path.dirname(os.path.abspath(file_path)), SNAPSHOT_DIR)
+    return os.path.join(folder, f"{digest}.v{FORMAT_VERSION}.pickle")
+
+
+def load_snapshot(file_path, digest):
+    """Compiled state saved for this exact file content, or None to parse the xlsx."""
+    try:
+        with open(snapshot_path(file_path, digest), 'rb') as f:
+            if pickle.load(f) != (MAGIC, FORMAT_VERSION, digest):
+                return None
+            return pickle.load(f)
+    except Exception:
+        # Missing, truncated or written by incompatible code: rebuild it
+        return None
+
+
+def save_snapshot(file_path, digest, state):
+    """Write the compiled state atomically; returns False when the folder is not writable."""
+    path = snapshot_path(file_path, digest)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    except OSError:
+        return False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((MAGIC, FORMAT_VERSION, digest), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        return True
+    except Exception:
+        os.remove(tmp_path)
+        return False
@@ -0,0 +1,115 @@
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+from flask import send_file
+from werkzeug.exceptions import NotFound
+
+from http_cache import MIN_COMPRESS_SIZE, brotli, choose_encoding, compress
+
+# Vite names bundle files <name>-<content hash>.<ext> under assets/
+HASHED_ASSET_RE = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.\w+$')
+PRECOMPRESS_EXTENSIONS = ('.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.map', '.ico')
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class StaticAssets:
+    """
+    The frontend build (frontend/dist) served from a manifest of its files.
+
+    The manifest is listed once and again only when index.html changes (a
+    new build), so a request costs one stat instead of a lookup per path.
+    Hashed bundle files never change under their name and are cached by
+    browsers for a year; everything else is revalidated. When the client
+    accepts it, the .br/.gz variant written by precompress() is sent.
+    Paths not in the build fall back to index.html (client-side routes).
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._stamp = None
+        self._files = {}        # relative path -> {encoding: variant path}
+        self._lock = threading.Lock()
+
+    def _manifest(self):
+        try:
+            st = os.stat(os.path.join(self.folder, 'index.html'))
+            stamp = (st.st_ino, st.st_mtime_ns)
+        except OSError:
+            stamp = None
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    self._files = self._scan()
+                    self._stamp = stamp
+        return self._files
+
+    def _scan(self):
+        files = {}
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                rel = os.path.relpath(os.path.join(root, name), self.folder).replace(os.sep, '/')
+                files[rel] = {}
+        for rel in list(files):
+            for encoding, suffix in ENCODING_SUFFIXES.items():
+                if rel.endswith(suffix) and rel[:-len(suffix)] in files:
+                    files[rel[:-len(suffix)]][encoding] = rel
+                    del files[rel]
+        return files
+
+    def send(self, path, accept_encodings):
+        files = self._manifest()
+        if path not in files:
+            if 'index.html' not in files:
+                raise NotFound()
+            path = 'index.html'
+        variants = files.get(path, {})
+        encoding = choose_encoding(accept_encodings)
+        source = variants.get(encoding, path) if encoding else path
+        response = send_file(os.path.join(self.folder, source), mimetype=_mimetype(path), conditional=True)
+        if source != path:
+            response.headers['Content-Encoding'] = encoding
+        if variants:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE if HASHED_ASSET_RE.match(path) else 'no-cache'
+        return response
+
+
+def _mimetype(path):
+    return mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+
+def precompress(folder):
+    """
+    Write .gz (and, with brotli installed, .br) variants of the build's text
+    files next to them, skipping small files and variants that are not
+    smaller. Run after `npm run build`; returns the variant paths written.
+    """
+    written = []
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+            for encoding in encodings:
+                packed = compress(data, encoding)
+                if len(packed) >= len(data):
+                    continue
+                target = path + ENCODING_SUFFIXES[encoding]
+                with open(target, 'wb') as f:
+                    f.write(packed)
+                written.append(target)
+    return written
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join('frontend', 'dist')
+    print(f"Precompressed {len(precompress(folder))} files in {folder}")
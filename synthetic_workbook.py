@@ -0,0 +1,279 @@
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl.utils import get_column_letter
+
+GREEN_STYLE = 1     # cellXfs index of the FF92D050 fill in STYLES_XML
+SUMMARY_CODES = ('A', 'B', 'C')
+TRUCK_SIZES = ('20GP', '40GP', '45HQ')
+LEAD_TIMES = ('1-2Days', '4-5Days', '18-21Days', '42-49Days')
+BREAKDOWN_TITLES = (
+    'TRUCK FEE', 'HK Custom clearance fee', 'DOC/SET', 'HANDING/SET', 'THC', 'Seal fee/SET',
+    'Security fee/SET', 'VGM/SET', 'Electronic fee', 'ISPS', 'OCEAN FEE', 'Destination THC',
+    'port charge/SET', 'CFS/CBM', 'THC/KG', 'Other fee/SET', 'Destination truck fee',
+)
+
+# Field columns between To and SUMMARY, as in the real sheets
+SHEET_FIELDS = {
+    'WAHL-Customer': ('INCOTERMS', 'Truck size', 'CBM', 'PALLET QTY', 'G/W', 'Method', 'SUMMARY'),
+    'VENDOR-WAHL': ('INCOTERMS', 'Truck size', 'CBM', 'G/W', '测试', 'Method', 'SUMMARY'),
+}
+
+CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '{sheets}</Types>'
+)
+SHEET_CONTENT_TYPE = ('<Override PartName="/xl/worksheets/sheet{n}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}<Relationship Id="rIdStyles" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rIdStrings" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+    '</Relationships>'
+)
+STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="3"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FF92D050"/><bgColor indexed="64"/></patternFill></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/></cellXfs>'
+    '</styleSheet>'
+)
+
+
+def node_code(i):
+    """MAP node code of the i-th node: A..Z, then AA, AB, ... like column letters."""
+    return get_column_letter(i + 1)
+
+
+class _Sheet:
+    """Cells of one generated worksheet: (row, col) -> (value, formula, style)."""
+
+    def __init__(self, title):
+        self.title = title
+        self.cells = {}
+        self.merges = []
+
+    def set(self, row, col, value, formula=None, style=0):
+        self.cells[(row, col)] = (value, formula, style)
+
+    def to_xml(self, strings):
+        """Worksheet XML; text cells are indexes into `strings` ({text: index}), extended as needed."""
+        rows = {}
+        for (r, c), cell in self.cells.items():
+            rows.setdefault(r, []).append((c, cell))
+        parts = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                 '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>']
+        for r in sorted(rows):
+            parts.append(f'<row r="{r}">')
+            for c, (value, formula, style) in sorted(rows[r], key=lambda item: item[0]):
+                ref = f'{get_column_letter(c)}{r}'
+                s = f' s="{style}"' if style else ''
+                if formula is not None:
+                    # Cached value next to the formula, as Excel saves it
+                    parts.append(f'<c r="{ref}"{s}><f>{escape(formula[1:])}</f><v>{value}</v></c>')
+                elif isinstance(value, str):
+                    index = strings.setdefault(value, len(strings))
+                    parts.append(f'<c r="{ref}"{s} t="s"><v>{index}</v></c>')
+                elif value is None:
+                    parts.append(f'<c r="{ref}"{s}/>')
+                else:
+                    parts.append(f'<c r="{ref}"{s}><v>{value}</v></c>')
+            parts.append('</row>')
+        parts.append('</sheetData>')
+        if self.merges:
+            parts.append(f'<mergeCells count="{len(self.merges)}">')
+            parts.extend(f'<mergeCell ref="{ref}"/>' for ref in self.merges)
+            parts.append('</mergeCells>')
+        parts.append('</worksheet>')
+        return ''.join(parts)
+
+
+def _breakdown_columns(first_col, count):
+    """(col, index, title, is_green) of the numbered breakdown columns; every 4th is variable (green)."""
+    cols = []
+    for i in range(count):
+        title = BREAKDOWN_TITLES[i % len(BREAKDOWN_TITLES)]
+        if i >= len(BREAKDOWN_TITLES):
+            title = f"{title} {i // len(BREAKDOWN_TITLES) + 1}"
+        cols.append((first_col + i, i + 1, title, i % 4 == 0))
+    return cols
+
+
+def _write_record(sheet, col, breakdown, row, record, rng):
+    """
+    One two-row merged record: fields, MAP and E2E Cost in merged cells,
+    rate text in the first row and amounts (values or formulas on the
+    record's own CBM/PALLET QTY/G/W cells) in the second.
+    """
+    for title, value in record.items():
+        c = col[title]
+        sheet.set(row, c, value)
+        sheet.merges.append(f'{get_column_letter(c)}{row}:{get_column_letter(c)}{row + 1}')
+    lt_col = col['E2E Lead Time']
+    sheet.set(row, lt_col, 'Standard')
+    sheet.set(row + 1, lt_col, rng.choice(LEAD_TIMES))
+
+    total = 0
+    lcl = record['Method'] == 'LCL'
+    used = [b for b in breakdown if rng.random() < 0.6] or breakdown[:1]
+    for n, (c, _, _, is_green) in enumerate(used):
+        style = GREEN_STYLE if is_green else 0
+        rate = rng.randrange(10, 2000)
+        if lcl and n == 0:
+            # MIN rule on the record's quantity basis, amount cached in the second row
+            if sheet.title == 'VENDOR-WAHL':
+                text, amount = f"0.5HKD/KG,Min {rate}HKD", max(0.5 * record['G/W'], rate)
+            else:
+                text, amount = f"80HKD/PALLET,MIN {rate}", max(80 * record['PALLET QTY'], rate)
+            sheet.set(row, c, text, style=style)
+            sheet.set(row + 1, c, amount, style=style)
+        elif lcl and n == 1:
+            # Rate per unit of a quantity cell of the record
+            unit_rate = rng.randrange(5, 50)
+            basis = 'CBM' if sheet.title == 'VENDOR-WAHL' else 'PALLET QTY'
+            ref = f"{get_column_letter(col[basis])}{row}"
+            if basis == 'CBM':
+                formula, amount = f"={unit_rate}*7.8*{ref}", unit_rate * 7.8 * record['CBM']
+            else:
+                formula, amount = f"={unit_rate}*{ref}", unit_rate * record['PALLET QTY']
+            sheet.set(row, c, f"{unit_rate}HKD/{basis}", style=style)
+            sheet.set(row + 1, c, amount, formula=formula, style=style)
+        else:
+            sheet.set(row, c, f"{rate}HKD/SET", style=style)
+            amount = rate
+            sheet.set(row + 1, c, amount, style=style)
+        total += amount
+
+    cost_col = col['E2E Cost']
+    first, last = get_column_letter(breakdown[0][0]), get_column_letter(breakdown[-1][0])
+    sheet.set(row, cost_col, round(total, 6), formula=f"=SUM({first}{row + 1}:{last}{row + 1})")
+    sheet.merges.append(f'{get_column_letter(cost_col)}{row}:{get_column_letter(cost_col)}{row + 1}')
+
+
+def _record(sheet_name, node, frm, to, i, rng):
+    """Field values of the i-th record of a lane: FCL by truck size, then LCL by quantities."""
+    lcl = i % 2 == 1
+    values = {
+        'INCOTERMS': f"DAP {to}",
+        'Truck size': 'N/A' if lcl else TRUCK_SIZES[(i // 2) % len(TRUCK_SIZES)],
+        'CBM': round(rng.uniform(1, 20), 1) if lcl else 'N/A',
+        'PALLET QTY': rng.randrange(1, 10) if lcl else 'N/A',
+        'G/W': rng.randrange(100, 5000) if lcl else 'N/A',
+        '测试': f"内容{i + 1}",
+        'Method': 'LCL' if lcl else 'FCL',
+        'SUMMARY': SUMMARY_CODES[(i // 2) % len(SUMMARY_CODES)],
+    }
+    record = {'Own': 'WAHL', 'From': frm, 'To': to}
+    record.update((title, values[title]) for title in SHEET_FIELDS[sheet_name])
+    record['MAP'] = node
+    return record
+
+
+def _selection(sheet_name, record, partial, rng):
+    """calculate() selection for a record; partial selections change its quantities."""
+    inputs = {}
+    for title in SHEET_FIELDS[sheet_name]:
+        val = record[title]
+        if val == 'N/A':
+            continue
+        if title == 'SUMMARY':
+            val = {'A': 'Ocean', 'B': 'Air'}.get(val, 'Land')
+        inputs[title] = val
+    if partial:
+        for title in ('CBM', 'PALLET QTY', 'G/W'):
+            if title in inputs:
+                inputs[title] = round(inputs[title] * rng.uniform(0.5, 2), 1) + 0.1
+    return {"node": record['MAP'], "location": f"{record['From']} -> {record['To']}", "inputs": inputs}
+
+
+def generate_workbook(path, nodes=6, lanes=3, records=4, columns=21, seed=0):
+    """
+    Write a synthetic rate card to path in the layout ExcelHandler reads.
+
+    Nodes alternate between the WAHL-Customer and VENDOR-WAHL sheets; each
+    node has `lanes` From -> To lanes of `records` two-row records (FCL
+    records by truck size alternating with LCL records priced by MIN rules
+    and per-unit formulas) over `columns` numbered breakdown columns.
+
+    Returns a manifest: the sheet sizes and calculate() selections that hit
+    an exact match ("exact") or only a partial match ("partial").
+    """
+    rng = random.Random(seed)
+    sheets = {name: _Sheet(name) for name in SHEET_FIELDS}
+    next_row = {name: 3 for name in SHEET_FIELDS}
+    layouts = {}
+    for name, field_titles in SHEET_FIELDS.items():
+        titles = ('Own', 'From', 'To') + field_titles + ('MAP', 'E2E Cost', 'E2E Lead Time')
+        breakdown = _breakdown_columns(len(titles) + 1, columns)
+        sheet = sheets[name]
+        for c, title in enumerate(titles, start=1):
+            sheet.set(2, c, title)
+        for c, index, title, is_green in breakdown:
+            style = GREEN_STYLE if is_green else 0
+            sheet.set(1, c, index, style=style)
+            sheet.set(2, c, title, style=style)
+        layouts[name] = ({title: c for c, title in enumerate(titles, start=1)}, breakdown)
+
+    manifest = {"exact": [], "partial": [], "sheets": {}}
+    for n in range(nodes):
+        node = node_code(n)
+        name = list(SHEET_FIELDS)[n % len(SHEET_FIELDS)]
+        col, breakdown = layouts[name]
+        for lane in range(lanes):
+            frm = ('WAHL', 'WADG')[lane % 2]
+            to = f"Customer {node}{lane + 1}"
+            for i in range(records):
+                record = _record(name, node, frm, to, i, rng)
+                row = next_row[name]
+                _write_record(sheets[name], col, breakdown, row, record, rng)
+                next_row[name] = row + 2
+                kind = 'partial' if record['Method'] == 'LCL' else 'exact'
+                manifest[kind].append(_selection(name, record, kind == 'partial', rng))
+
+    for name, sheet in sheets.items():
+        manifest['sheets'][name] = {"rows": next_row[name] - 1, "cells": len(sheet.cells), "merges": len(sheet.merges)}
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        names = list(sheets)
+        zf.writestr('[Content_Types].xml', CONTENT_TYPES_XML.format(
+            sheets=''.join(SHEET_CONTENT_TYPE.format(n=i + 1) for i in range(len(names)))))
+        zf.writestr('_rels/.rels', ROOT_RELS_XML)
+        zf.writestr('xl/workbook.xml', WORKBOOK_XML.format(sheets=''.join(
+            f'<sheet name="{escape(name)}" sheetId="{i + 1}" r:id="rId{i + 1}"/>' for i, name in enumerate(names))))
+        zf.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS_XML.format(sheets=''.join(
+            f'<Relationship Id="rId{i + 1}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{i + 1}.xml"/>' for i in range(len(names)))))
+        zf.writestr('xl/styles.xml', STYLES_XML)
+        strings = {}
+        for i, name in enumerate(names):
+            zf.writestr(f'xl/worksheets/sheet{i + 1}.xml', sheets[name].to_xml(strings))
+        zf.writestr('xl/sharedStrings.xml', ''.join(
+            ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+             f'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="{len(strings)}">']
+            + [f'<si><t>{escape(text)}</t></si>' for text in strings] + ['</sst>']))
+    return manifest
@@ -0,0 +1,95 @@
+import pytest
+
+import app as app_module
+from excel_handler import ERROR, INFO, TRACE, CalcContext, ExcelHandler
+from result_cache import RESULT_CACHE
+
+
+class Formatted:
+    """Log argument that counts how often it is formatted."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return 'formatted'
+
+
+def _messages(lines):
+    # Lines are "[<timestamp>] <message>"; some messages start with a blank line
+    return [line.split('] ', 1)[1] for line in lines if line.startswith('[')]
+
+
+def test_levels_below_log_level_are_not_printed(capsys):
+    ctx = CalcContext(log_level=INFO, log_stdout=True)
+    ctx.log("trace %s", 1, level=TRACE)
+    ctx.log("info %s", 2)
+    ctx.log("error %s", 3, level=ERROR)
+
+    assert _messages(capsys.readouterr().out.splitlines()) == ['info 2', 'error 3']
+    assert ctx.logs == []
+    assert not ctx.enabled(TRACE) and ctx.enabled(INFO)
+
+
+def test_collecting_keeps_every_level_and_prints_by_level(capsys):
+    ctx = CalcContext(log_level=ERROR, log_stdout=True, collect=True)
+    ctx.log("trace", level=TRACE)
+    ctx.log("info")
+    ctx.log("error", level=ERROR)
+
+    assert _messages(ctx.logs) == ['trace', 'info', 'error']
+    assert _messages(capsys.readouterr().out.splitlines()) == ['error']
+    assert ctx.enabled(TRACE)
+
+
+def test_messages_are_formatted_only_when_wanted(capsys):
+    arg = Formatted()
+    quiet = CalcContext(log_level=TRACE, log_stdout=False)
+    for level in (TRACE, INFO, ERROR):
+        quiet.log("value: %s", arg, level=level)
+    CalcContext(log_level=INFO, log_stdout=True).log("value: %s", arg, level=TRACE)
+    assert arg.count == 0
+
+    CalcContext(log_level=TRACE, log_stdout=True).log("value: %s", arg, level=TRACE)
+    assert arg.count == 1
+    assert _messages(capsys.readouterr().out.splitlines()) == ['value: formatted']
+
+
+@pytest.fixture
+def fresh_results():
+    # Cached sections skip the matching steps whose logging is under test
+    RESULT_CACHE.clear()
+    yield
+    RESULT_CACHE.clear()
+
+
+def test_handler_prints_at_its_log_level(builtin_xlsx, selections, fresh_results, capsys):
+    unknown = {"node": 'ZZ', "location": 'X -> Y', "inputs": {}}
+    ExcelHandler(builtin_xlsx, log_level='ERROR', log_stdout=True, use_snapshot=False).calculate(selections + [unknown])
+    printed = _messages(capsys.readouterr().out.splitlines())
+    assert printed[-1] == 'ERROR: No sheet found for node ZZ'
+    assert all(line.startswith('ERROR: ') for line in printed)
+
+    RESULT_CACHE.clear()
+    ExcelHandler(builtin_xlsx, log_level='TRACE', log_stdout=True, use_snapshot=False).calculate(selections[:1])
+    printed = _messages(capsys.readouterr().out.splitlines())
+    assert any(line.startswith('Looking for:') for line in printed)
+
+
+def test_log_settings_default_from_the_environment(builtin_xlsx, monkeypatch):
+    monkeypatch.setenv('SHP_LOG_LEVEL', 'trace')
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+    handler = ExcelHandler(builtin_xlsx, use_snapshot=False)
+    assert (handler.log_level, handler.log_stdout) == (TRACE, False)
+
+
+def test_logs_are_returned_only_for_debug(handler, selections, fresh_results, capsys):
+    assert 'logs' not in handler.calculate(selections)
+    traced = _messages(handler.calculate(selections, debug=True)["logs"])
+    assert any(line.startswith('Looking for:') for line in traced)
+    assert capsys.readouterr().out == ''
+
+    client = app_module.app.test_client()
+    assert 'logs' not in client.post('/api/calculate', json=selections).get_json()
+    assert client.post('/api/calculate?debug=1', json=selections).get_json()["logs"]
@@ -0,0 +1,75 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def scenarios(selections):
+    """Scenarios repeating the same sections in different combinations, plus a node no sheet prices."""
+    unknown = {"node": 'ZZ', "location": 'X -> Y', "inputs": {}}
+    return [
+        selections,
+        selections[:2],
+        [selections[1], selections[0], selections[1]],
+        [selections[-1], unknown],
+        [],
+    ]
+
+
+@pytest.fixture
+def priced(handler, monkeypatch):
+    """Section keys priced by the handler, in order."""
+    keys = []
+    price = handler._price_batch_section
+
+    def counting_price(ctx, sel):
+        keys.append(handler._section_key(sel))
+        return price(ctx, sel)
+
+    monkeypatch.setattr(handler, '_price_batch_section', counting_price)
+    return keys
+
+
+def test_identical_sections_are_priced_once(handler, scenarios, selections, priced):
+    result = handler.calculate_batch(scenarios)
+
+    assert len(priced) == len(set(priced)) == len(selections) + 1
+    assert result["unique_sections"] == len(priced)
+    # The unknown node is priced (to None) once but listed nowhere
+    ids = [section["id"] for section in result["sections"]]
+    assert ids == list(range(len(selections)))
+    assert result["scenarios"][2]["sections"] == [1, 0, 1]
+    assert result["scenarios"][3]["sections"] == [len(selections) - 1]
+
+
+def test_scenarios_total_like_calculate(handler, scenarios):
+    result = handler.calculate_batch(scenarios)
+    sections = {section["id"]: section for section in result["sections"]}
+
+    assert len(result["scenarios"]) == len(scenarios)
+    for scenario, batch in zip(scenarios, result["scenarios"]):
+        single = handler.calculate(scenario)
+        assert batch["total_cost"] == single["total_cost"]
+        if single["node_results"]:
+            assert batch["total_lt"] == single["total_lt"]
+        # Shared sections carry what calculate returns for each of them
+        assert [{k: v for k, v in sections[sid].items() if k != 'id'} for sid in batch["sections"]] == single["node_results"]
+
+
+def test_bad_sections_fail_alone(handler, selections):
+    result = handler.calculate_batch([[selections[0], 'not a selection'], [selections[0]]])
+    first, second = result["scenarios"]
+    assert len(first["sections"]) == 2 and second["sections"] == first["sections"][:1]
+    assert result["sections"][1]["error"] == "Expected a selection object"
+    assert first["total_cost"] == second["total_cost"]
+
+
+def test_batch_endpoint(handler, scenarios):
+    client = app_module.app.test_client()
+    expected = handler.calculate_batch(scenarios)
+    assert client.post('/api/calculate-batch', json=scenarios).get_json() == expected
+    assert client.post('/api/calculate-batch', json={"scenarios": scenarios}).get_json() == expected
+
+    for body in ({"scenarios": 'x'}, [{"node": 'A'}], 'x'):
+        resp = client.post('/api/calculate-batch', json=body)
+        assert resp.status_code == 400 and resp.get_json() == {"error": "Expected a list of selection lists"}
@@ -0,0 +1,96 @@
+import io
+import json
+import os
+import threading
+import time
+
+import app as app_module
+from excel_handler import ExcelHandler
+from ingest_jobs import IngestJobs
+from workbook_registry import WorkbookRegistry
+
+UPLOADED = os.path.join(app_module.BASE_DIR, 'uploads', '5.shipping_cost_based_on_summary.xlsx')
+
+THREADS = 8
+REQUESTS_PER_THREAD = 40
+UPLOADS = 10
+
+
+def _wait_for_job(client, status_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        resp = client.get(status_url)
+        if resp.get_json()['status'] in ('done', 'failed'):
+            return resp
+        time.sleep(0.05)
+    raise AssertionError(f"{status_url} did not finish")
+
+
+def _expected(path, selections):
+    handler = ExcelHandler(path, log_stdout=False)
+    return json.loads(json.dumps(handler.calculate(selections)))
+
+
+def test_calculate_during_uploads(tmp_path, monkeypatch, builtin_xlsx, selections):
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    registry = WorkbookRegistry(shared_dir=str(tmp_path / '.workbooks'))
+    registry.load(builtin_xlsx, activate=True)
+    monkeypatch.setattr(app_module, 'registry', registry)
+    monkeypatch.setattr(app_module, 'ingest_jobs', IngestJobs(registry, str(tmp_path / '.jobs')))
+    app_module.app.testing = True
+
+    expected = [_expected(builtin_xlsx, selections), _expected(UPLOADED, selections)]
+    with open(UPLOADED, 'rb') as f:
+        upload_bytes = f.read()
+
+    errors = []
+    done = threading.Event()
+
+    def hammer():
+        client = app_module.app.test_client()
+        try:
+            for _ in range(REQUESTS_PER_THREAD):
+                resp = client.post('/api/calculate?debug=1', json=selections)
+                assert resp.status_code == 200, resp.data
+                result = resp.get_json()
+                logs = result.pop('logs')
+                # A response is priced entirely against one snapshot...
+                assert result in expected
+                # ...and its logs belong to this request only
+                assert sum('CALCULATION START' in line for line in logs) == 1
+                assert sum('--- SECTION' in line for line in logs) == len(selections)
+        except Exception as e:
+            errors.append(e)
+
+    def upload():
+        client = app_module.app.test_client()
+        try:
+            for i in range(UPLOADS):
+                if done.is_set():
+                    break
+                if i % 2:
+                    resp = client.post('/api/load-builtin')
+                else:
+                    resp = client.post('/api/upload', data={'file': (io.BytesIO(upload_bytes), 'rates.xlsx')},
+                                       content_type='multipart/form-data')
+                    assert resp.status_code == 202, resp.data
+                    resp = _wait_for_job(client, resp.get_json()['status_url'])
+                    assert resp.get_json()['status'] == 'done', resp.data
+                assert resp.status_code == 200, resp.data
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=hammer) for _ in range(THREADS)]
+    uploader = threading.Thread(target=upload)
+    for t in workers:
+        t.start()
+    uploader.start()
+    for t in workers:
+        t.join()
+    done.set()
+    uploader.join()
+
+    assert not errors, errors[0]
+    # No temp files left behind: only the upload and the shared workbook/job folders
+    assert sorted(os.listdir(tmp_path)) == ['.jobs', '.workbooks', 'rates.xlsx']
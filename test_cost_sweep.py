@@ -0,0 +1,81 @@
+import itertools
+
+import pytest
+
+import app as app_module
+import cost_sweep
+from cost_sweep import axis_values, build_grid
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ([3, 1, 2], [3, 1, 2]),
+    ({"start": 1, "stop": 2, "step": 0.5}, [1, 1.5, 2]),
+    ({"start": 1, "stop": 2.2, "step": 0.5}, [1, 1.5, 2]),
+    ({"start": 0, "stop": 10, "num": 3}, [0, 5, 10]),
+    ({"start": 0.1, "stop": 0.3, "step": 0.1}, [0.1, 0.2, 0.3]),
+])
+def test_axis_values(spec, expected):
+    assert axis_values(spec).tolist() == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('spec', [
+    ["a", 1],
+    [],
+    {"start": 1},
+    {"start": 1, "stop": 2, "step": 0},
+    {"start": 1, "stop": 2, "step": -1},
+    "1-5",
+])
+def test_invalid_axes_are_rejected(spec):
+    with pytest.raises(ValueError):
+        axis_values(spec)
+
+
+def test_grid_is_c_ordered_and_keeps_fixed_quantities():
+    axes, (pallet, cbm, gw) = build_grid({"G/W": [100, 200], "PALLET QTY": [1, 2, 3]}, (9, 4.5, 0))
+
+    assert list(axes) == ["PALLET QTY", "G/W"]
+    assert pallet.tolist() == [1, 1, 2, 2, 3, 3]
+    assert gw.tolist() == [100, 200] * 3
+    assert cbm.tolist() == [4.5] * 6
+
+
+def test_grid_rejects_other_quantities_and_oversized_sweeps(monkeypatch):
+    with pytest.raises(ValueError, match="can be swept"):
+        build_grid({"Truck size": [1]}, (0, 0, 0))
+    monkeypatch.setattr(cost_sweep, 'MAX_SWEEP_POINTS', 100)
+    with pytest.raises(ValueError, match="limited to 100 points"):
+        build_grid({"CBM": {"start": 0, "stop": 9, "num": 10}, "G/W": {"start": 0, "stop": 10, "num": 11}}, (0, 0, 0))
+    with pytest.raises(ValueError, match="limited to 100 points"):
+        build_grid({"CBM": {"start": 0, "stop": 1000, "step": 1}}, (0, 0, 0))
+
+
+def test_sweep_matches_calculate(handler):
+    location = 'Turkey -> WAHL'
+    inputs = {f["name"]: f["options"][0] for f in handler.get_node_fields('F', location)}
+    # Both axes cross a MIN rule breakpoint of the record (0.35 CBM, 1800 KG)
+    ranges = {"CBM": [0.2, 2, 5.4], "G/W": {"start": 100, "stop": 3100, "num": 3}}
+    result = handler.sweep({"node": 'F', "location": location, "inputs": inputs}, ranges)
+
+    points = list(itertools.product(*result["axes"].values()))
+    assert len(points) == len(result["cost"])
+    scalar = []
+    for point in points:
+        priced = handler.calculate([{"node": 'F', "location": location, "inputs": dict(inputs, **dict(zip(result["axes"], point)))}])
+        assert not priced["node_results"][0].get("error"), point
+        scalar.append(priced["total_cost"])
+    assert result["cost"] == pytest.approx(scalar)
+    assert all(bp["in_range"] for bp in result["breakpoints"])
+
+
+@pytest.mark.parametrize('body', [
+    {"node": 'F', "location": 'Turkey -> WAHL', "ranges": {"CBM": [1, 2]}, "inputs": [1]},
+    {"node": 'F', "location": 'Turkey -> WAHL', "ranges": {"CBM": [1, 2]}, "inputs": 'CBM=2'},
+    {"node": 'F', "location": 'Turkey -> WAHL', "ranges": [1, 2]},
+    {"node": 'F', "location": 'Turkey -> WAHL', "ranges": {"Truck size": [1, 2]}},
+    [{"node": 'F'}],
+])
+def test_invalid_sweeps_are_rejected_with_400(body):
+    resp = app_module.app.test_client().post('/api/sweep', json=body)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]
@@ -0,0 +1,150 @@
+import pickle
+
+import numpy as np
+import pytest
+from openpyxl.utils.cell import coordinate_to_tuple
+
+from cost_model import compile_formula
+from formula_engine import FormulaError, FormulaGraph, parse
+from workbook_loader import SheetData
+
+# Column F (6) stands in for the PALLET QTY column: quantity index 0
+INPUT_COLS = {6: 0}
+
+
+def _sheet(formulas, values=None):
+    """SheetData holding formulas {'A1': '=...'} and cached values {'A1': v}."""
+    ws = SheetData('Rates')
+    for cells, target in ((formulas, ws.formulas), (values or {}, ws.values)):
+        for ref, val in cells.items():
+            key = coordinate_to_tuple(ref)
+            target[key] = val
+            ws.max_row = max(ws.max_row, key[0])
+            ws.max_column = max(ws.max_column, key[1])
+    return ws
+
+
+def _compile(ws, ref):
+    return compile_formula(FormulaGraph(ws, INPUT_COLS), coordinate_to_tuple(ref))
+
+
+def _value(formula, values=None, quantities=(0, 0, 0)):
+    compiled = _compile(_sheet({'A1': formula}, values), 'A1')
+    assert compiled.error is None
+    return compiled(list(quantities))
+
+
+@pytest.mark.parametrize('formula, expected', [
+    ('=1+2*3^2', 19),
+    ('=-2^2', 4),
+    ('=(1+2)*3', 9),
+    ('=50%*4', 2),
+    ('=SUM(1,2,3)', 6),
+    ('=AVERAGE(2,4)', 3),
+    ('=MIN(4,2,8)+MAX(4,2,8)', 10),
+    ('=ROUND(2.5,0)', 3),
+    ('=ROUND(-2.5,0)', -3),
+    ('=ROUND(0.1*3,1)', 0.3),
+    ('=ROUNDUP(1.01,1)', 1.1),
+    ('=ROUNDDOWN(1.99,0)', 1),
+    ('=CEILING(7,5)', 10),
+    ('=FLOOR(7,5)', 5),
+    ('=INT(-1.5)', -2),
+    ('=MOD(7,3)', 1),
+    ('=ABS(-3)', 3),
+    ('=IF(1>2,1,2)', 2),
+    ('=IF(AND(TRUE,NOT(FALSE)),5,6)', 5),
+    ('=IF(OR(1=2,"a"="A"),7,8)', 7),
+])
+def test_functions_and_precedence(formula, expected):
+    assert _value(formula) == pytest.approx(expected)
+
+
+def test_unsupported_syntax_raises():
+    with pytest.raises(FormulaError):
+        parse('=VLOOKUP(1,A1:B2,2)')
+    with pytest.raises(FormulaError):
+        parse('=1+')
+
+
+def test_input_column_references_are_quantities():
+    ws = _sheet({'B2': '=F2*10+A1'}, {'A1': 5, 'F2': 1})
+    compiled = _compile(ws, 'B2')
+    assert compiled.inputs == (0,)
+    assert compiled([3, 0, 0]) == 35
+
+
+def test_ranges_skip_blanks_and_text():
+    assert _value('=SUM(B1:B4)', {'B1': 1, 'B2': 2, 'B3': 'x'}) == 3
+    assert _value('=MIN(B1:B4)', {'B1': 4, 'B2': 2, 'B4': 'n/a'}) == 2
+
+
+def test_constant_formulas_fold_into_downstream_cells():
+    ws = _sheet({'A1': '=3', 'B1': '=A1*2', 'C1': '=B1+F1'}, {'A1': 0, 'B1': 0})
+    graph = FormulaGraph(ws, INPUT_COLS)
+    assert not graph.is_dynamic((1, 2))
+    assert graph.value((1, 2)) == 6
+    compiled = compile_formula(graph, (1, 3))
+    assert compiled([1, 0, 0]) == 7
+
+
+def test_unsupported_formula_is_an_error_of_its_cell_only():
+    ws = _sheet({'A1': '=VLOOKUP(1,C1:D2,2)', 'B1': '=A1+1'}, {'A1': 10})
+    graph = FormulaGraph(ws, INPUT_COLS)
+    broken = compile_formula(graph, (1, 1))
+    assert '不支持的公式' in broken.error
+    assert broken([1, 0, 0]) == 0
+    # Cells reading it use its cached value
+    assert compile_formula(graph, (1, 2))([1, 0, 0]) == 11
+
+
+def test_circular_references_do_not_compile():
+    ws = _sheet({'A1': '=B1+F1', 'B1': '=A1', 'C1': '=D1', 'D1': '=C1', 'E1': '=C1+1', 'G1': '=2'},
+                {'C1': 4})
+    graph = FormulaGraph(ws, INPUT_COLS)
+    for ref in ('A1', 'B1', 'C1', 'D1', 'E1'):
+        compiled = compile_formula(graph, coordinate_to_tuple(ref))
+        assert 'circular reference' in compiled.error
+    # A constant on a cycle reads its cached value; other cells are unaffected
+    assert graph.value((1, 3)) == 4
+    assert compile_formula(graph, (1, 7)).error is None
+
+
+def test_division_by_zero_is_an_arithmetic_error():
+    compiled = _compile(_sheet({'A1': '=F1/0'}), 'A1')
+    with pytest.raises(ArithmeticError):
+        compiled([1, 0, 0])
+
+
+def test_quantity_arrays_evaluate_elementwise():
+    # As the cost sweep runs them: fn takes arrays, __call__ is the scalar path
+    compiled = _compile(_sheet({'A1': '=IF(F1>2,F1*10,5)+MAX(F1,2)'}), 'A1')
+    assert compiled.fn([np.array([1.0, 3.0]), 0, 0]).tolist() == [7, 33]
+
+
+def test_shared_upstream_cell_runs_once_per_call():
+    ws = _sheet({'A1': '=F1*2', 'B1': '=A1+1', 'C1': '=A1+2', 'D1': '=B1+C1'})
+    graph = FormulaGraph(ws, INPUT_COLS)
+    compiled = compile_formula(graph, (1, 4))
+    assert compiled([5, 0, 0]) == 23
+    assert [step.key for step in graph.programs.order((1, 4))] == [(1, 1), (1, 2), (1, 3), (1, 4)]
+
+
+def test_deep_dependency_chain():
+    # Deeper than the recursion limit: compiling walks the graph iteratively
+    rows = 3000
+    formulas = {'A1': '=F1'}
+    formulas.update({f'A{r}': f'=A{r - 1}+F{r}' for r in range(2, rows + 1)})
+    formulas.update({'B1': '=1'})
+    formulas.update({f'B{r}': f'=B{r - 1}+1' for r in range(2, rows + 1)})
+    ws = _sheet(formulas, {f'F{r}': 1 for r in range(1, rows + 1)})
+    graph = FormulaGraph(ws, INPUT_COLS)
+    compiled = {key: compile_formula(graph, key) for key in ws.formulas}
+
+    assert all(c.error is None for c in compiled.values())
+    assert compiled[(rows, 1)]([2, 0, 0]) == 2 * rows
+    assert compiled[(rows, 2)]([2, 0, 0]) == rows
+    # One shared step per input dependent cell, not one program per cell
+    assert len(graph.programs.steps) == 2 * rows
+    restored = pickle.loads(pickle.dumps(compiled[(rows, 1)]))
+    assert restored([3, 0, 0]) == 3 * rows
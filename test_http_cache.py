@@ -0,0 +1,151 @@
+import gzip
+import json
+import os
+
+import pytest
+from werkzeug.datastructures import Accept
+
+import app as app_module
+import http_cache
+from http_cache import MIN_COMPRESS_SIZE, choose_encoding, compress_response
+from static_assets import IMMUTABLE, StaticAssets, precompress
+
+UPLOADED = os.path.join(os.path.dirname(__file__), 'uploads', '5.shipping_cost_based_on_summary.xlsx')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+    return app_module.app.test_client()
+
+
+def _fields_url(handler, node):
+    location = handler.get_route_options()[node]['locations'][0]
+    return f'/api/fields?node={node}&location={location}'
+
+
+def test_etag_is_stable_per_workbook(client):
+    first, second = client.get('/api/routes'), client.get('/api/routes')
+    assert first.headers['ETag'] == second.headers['ETag']
+    assert first.headers['ETag'].startswith('W/"')
+
+    other_id, _ = app_module.registry.load(UPLOADED)
+    other = client.get(f'/api/routes?workbook={other_id}')
+    assert other.headers['X-Workbook-Id'] == other_id
+    assert other.headers['ETag'] != first.headers['ETag']
+    assert client.get(f'/api/routes?workbook={other_id}').headers['ETag'] == other.headers['ETag']
+
+
+def test_fields_etag_is_per_node(client):
+    handler = app_module.registry.get()
+    tags = {node: client.get(_fields_url(handler, node)).headers['ETag'] for node in handler.get_route_options()}
+    assert len(set(tags.values())) == len(tags)
+    assert all(client.get(_fields_url(handler, node)).headers['ETag'] == tag for node, tag in tags.items())
+
+
+def test_if_none_match_answers_304_with_an_empty_body(client):
+    handler = app_module.registry.get()
+    for url in ('/api/routes', _fields_url(handler, 'A')):
+        etag = client.get(url).headers['ETag']
+        resp = client.get(url, headers={'If-None-Match': etag})
+        assert resp.status_code == 304, url
+        assert resp.get_data() == b''
+        assert resp.headers['ETag'] == etag
+        # Any other tag gets the full body again
+        assert client.get(url, headers={'If-None-Match': 'W/"stale"'}).status_code == 200
+
+
+def test_encoding_is_chosen_from_accept_encoding():
+    assert choose_encoding(Accept([('gzip', 1)])) == 'gzip'
+    assert choose_encoding(Accept([('identity', 1)])) is None
+    assert choose_encoding(Accept([('gzip', 0), ('deflate', 1)])) is None
+    assert choose_encoding(Accept([('br', 1), ('gzip', 0.5)])) == ('br' if http_cache.brotli else 'gzip')
+    assert choose_encoding(Accept([('br', 1)])) == ('br' if http_cache.brotli else None)
+
+
+def test_json_is_compressed_for_the_client(client):
+    plain = client.get('/api/routes')
+    assert len(plain.get_data()) >= MIN_COMPRESS_SIZE and 'Content-Encoding' not in plain.headers
+    packed = client.get('/api/routes', headers={'Accept-Encoding': 'gzip'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert json.loads(gzip.decompress(packed.get_data())) == plain.get_json()
+    # The cached body is per encoding: an identity client is not sent gzip
+    assert client.get('/api/routes').get_data() == plain.get_data()
+
+
+@pytest.mark.skipif(http_cache.brotli is None, reason="brotli is not installed")
+def test_brotli_is_preferred_when_accepted(client):
+    plain = client.get('/api/routes')
+    packed = client.get('/api/routes', headers={'Accept-Encoding': 'gzip, br'})
+    assert packed.headers['Content-Encoding'] == 'br'
+    assert json.loads(http_cache.brotli.decompress(packed.get_data())) == plain.get_json()
+
+
+def test_small_and_binary_bodies_are_not_compressed():
+    gzip_client = Accept([('gzip', 1)])
+    with app_module.app.test_request_context():
+        small = compress_response(app_module.app.json.response({"ok": True}), gzip_client)
+        assert 'Content-Encoding' not in small.headers and small.get_json() == {"ok": True}
+        large = {"rows": ['x' * 10] * MIN_COMPRESS_SIZE}
+        assert compress_response(app_module.app.json.response(large), gzip_client).headers['Content-Encoding'] == 'gzip'
+        binary = app_module.app.response_class(b'\0' * (4 * MIN_COMPRESS_SIZE), mimetype='application/octet-stream')
+        assert 'Content-Encoding' not in compress_response(binary, gzip_client).headers
+        failed = app_module.app.json.response(large)
+        failed.status_code = 500
+        assert 'Content-Encoding' not in compress_response(failed, gzip_client).headers
+
+
+HASHED = 'assets/index-AbCdEf12.js'
+
+
+@pytest.fixture
+def dist(tmp_path):
+    """A frontend build: index.html, a hashed bundle and a small unhashed file."""
+    (tmp_path / 'assets').mkdir()
+    (tmp_path / 'index.html').write_text('<!doctype html><div id="root"></div>' * 64)
+    (tmp_path / HASHED).write_text('console.log("bundle");\n' * 256)
+    (tmp_path / 'favicon.svg').write_text('<svg/>')
+    return tmp_path
+
+
+def _send(assets, path, accept_encoding=None):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    with app_module.app.test_request_context(headers=headers):
+        response = assets.send(path, app_module.request.accept_encodings)
+        response.direct_passthrough = False
+        return response
+
+
+def test_precompress_skips_small_files(dist):
+    written = precompress(str(dist))
+    assert str(dist / HASHED) + '.gz' in written
+    assert str(dist / 'index.html') + '.gz' in written
+    assert not (dist / 'favicon.svg.gz').exists()
+
+
+def test_hashed_assets_are_immutable_and_index_is_revalidated(dist):
+    assets = StaticAssets(str(dist))
+    bundle = _send(assets, HASHED)
+    assert bundle.headers['Cache-Control'] == IMMUTABLE
+    index = _send(assets, 'index.html')
+    assert index.headers['Cache-Control'] == 'no-cache'
+    assert 'immutable' not in index.headers['Cache-Control']
+    # Client-side routes are answered with index.html, revalidated like it
+    route = _send(assets, 'lanes/search')
+    assert route.get_data() == index.get_data() and route.headers['Cache-Control'] == 'no-cache'
+
+
+def test_precompressed_variant_is_sent_when_accepted(dist):
+    precompress(str(dist))
+    assets = StaticAssets(str(dist))
+    packed = _send(assets, HASHED, 'gzip')
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert packed.mimetype in ('application/javascript', 'text/javascript')
+    assert 'Accept-Encoding' in packed.headers['Vary']
+    assert gzip.decompress(packed.get_data()) == (dist / HASHED).read_bytes()
+    assert packed.headers['Cache-Control'] == IMMUTABLE
+
+    plain = _send(assets, HASHED)
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.get_data() == (dist / HASHED).read_bytes()
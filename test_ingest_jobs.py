@@ -0,0 +1,86 @@
+import io
+import os
+import shutil
+import time
+
+import openpyxl
+import pytest
+
+import app as app_module
+from ingest_jobs import IngestJobs
+from workbook_registry import WorkbookRegistry, workbook_id
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch, builtin_xlsx):
+    """An upload folder with its own registry and ingest jobs, the built-in workbook active."""
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+    monkeypatch.setattr(app_module, 'UPLOAD_FOLDER', str(tmp_path))
+    registry = WorkbookRegistry(shared_dir=str(tmp_path / '.workbooks'))
+    registry.load(builtin_xlsx, activate=True)
+    monkeypatch.setattr(app_module, 'registry', registry)
+    monkeypatch.setattr(app_module, 'ingest_jobs', IngestJobs(registry, str(tmp_path / '.jobs')))
+    return tmp_path
+
+
+def _upload(data, name):
+    client = app_module.app.test_client()
+    resp = client.post('/api/upload', data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data')
+    assert resp.status_code == 202, resp.data
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        job = client.get(resp.get_json()['status_url']).get_json()
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"{name} was not ingested")
+
+
+def _files(folder):
+    return sorted(os.path.relpath(os.path.join(root, name), folder)
+                  for root, _, names in os.walk(folder) for name in names if not root.endswith('.jobs'))
+
+
+def test_rejected_upload_leaves_no_files(uploads):
+    active = app_module.registry.active()
+    before = _files(uploads)
+    job = _upload(b'not a workbook', 'bad.xlsx')
+
+    assert job['status'] == 'failed' and job['errors']
+    assert _files(uploads) == before
+    assert app_module.registry.active() == active
+
+
+def test_workbook_with_nothing_to_price_is_removed_with_its_snapshot(uploads, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('src') / 'empty.xlsx')
+    wb = openpyxl.Workbook()
+    wb.active.title = 'WAHL-Customer'
+    wb.active['A1'] = 'no MAP header'
+    wb.save(path)
+    before = _files(uploads)
+    with open(path, 'rb') as f:
+        job = _upload(f.read(), 'empty.xlsx')
+
+    assert job['status'] == 'failed'
+    assert _files(uploads) == before
+    assert job['workbook_id'] not in app_module.registry
+
+
+def test_accepted_upload_is_kept(uploads, builtin_xlsx):
+    with open(app_module.os.path.join(app_module.BASE_DIR, 'uploads', '5.shipping_cost_based_on_summary.xlsx'), 'rb') as f:
+        job = _upload(f.read(), 'rates.xlsx')
+
+    assert job['status'] == 'done'
+    published = os.path.join('.workbooks', job['workbook_id'] + '.xlsx')
+    assert published in _files(uploads) and 'rates.xlsx' in _files(uploads)
+
+
+def test_only_the_rejected_content_is_removed(tmp_path, builtin_xlsx):
+    path = str(tmp_path / 'rates.xlsx')
+    with open(path, 'wb') as f:
+        f.write(b'not a workbook')
+    rejected = workbook_id(path)
+    # Replaced by a later upload of the same name before the job finished
+    shutil.copyfile(builtin_xlsx, path)
+    IngestJobs._remove(rejected, [path, str(tmp_path / 'missing.xlsx')])
+    assert os.path.exists(path)
@@ -0,0 +1,132 @@
+import app as app_module
+from lane_index import PARTIAL_SKIP_FIELDS
+
+
+def _lanes(handler):
+    """(sheet, node, "From -> To", record field values per row) of every lane."""
+    lanes = []
+    for sheet_name, index in handler.lane_index.items():
+        ws, schema = handler.sheets[sheet_name], handler.schemas[sheet_name]
+        for (node, frm, to), rows in index.match_rows.items():
+            records = [handler._record_inputs(ws, schema, r, {}) for r in rows]
+            lanes.append((sheet_name, node, f"{frm} -> {to}", records))
+    return lanes
+
+
+def _options(fields):
+    return {f["name"]: {str(v) for v in f["options"]} for f in fields}
+
+
+def _offered(records, title, chosen):
+    """Values of a field over the records agreeing with every chosen (field, value)."""
+    return {str(rec[title]) for rec in records if title in rec
+            and all(str(rec.get(k)) == str(v) for k, v in chosen.items())}
+
+
+def test_facets_narrow_options_for_a_chosen_input(handler):
+    narrowed_any = False
+    for _, node, location, records in _lanes(handler):
+        unfiltered = _options(handler.get_node_fields(node, location))
+        for title, values in unfiltered.items():
+            if title in PARTIAL_SKIP_FIELDS:
+                continue
+            for value in values:
+                narrowed = _options(handler.get_node_fields(node, location, {title: value}))
+                for other in narrowed:
+                    if other == title or other in PARTIAL_SKIP_FIELDS:
+                        continue
+                    assert narrowed[other] == _offered(records, other, {title: value}), (node, location, title, value)
+                    narrowed_any |= narrowed[other] != unfiltered[other]
+    assert narrowed_any
+
+
+def _choices(records, title):
+    return {str(rec[title]) for rec in records if title in rec}
+
+
+def test_combined_choices_narrow_every_other_field(handler):
+    for _, node, location, records in _lanes(handler):
+        titles = [t for t in _options(handler.get_node_fields(node, location)) if t not in PARTIAL_SKIP_FIELDS]
+        for rec in records:
+            # Two of the record's own values: at least that record stays offered
+            chosen = {t: rec[t] for t in titles[-2:] if t in rec}
+            narrowed = _options(handler.get_node_fields(node, location, chosen))
+            for title in titles:
+                others = {k: v for k, v in chosen.items() if k != title}
+                assert narrowed[title] == _offered(records, title, others), (node, location, chosen, title)
+
+
+def test_own_choice_and_quantities_do_not_narrow(handler):
+    for _, node, location, records in _lanes(handler):
+        unfiltered = _options(handler.get_node_fields(node, location))
+        for title in unfiltered:
+            value = 0.001 if title in PARTIAL_SKIP_FIELDS else sorted(unfiltered[title])[0]
+            narrowed = _options(handler.get_node_fields(node, location, {title: value}))
+            assert narrowed[title] == unfiltered[title]
+            if title in PARTIAL_SKIP_FIELDS:
+                assert narrowed == unfiltered
+
+
+def test_summary_narrows_by_display_name_or_code(handler):
+    fields = _options(handler.get_node_fields('E', 'WAHL -> WADG'))
+    assert fields['SUMMARY'] == {'Land'}
+    by_name = handler.get_node_fields('E', 'WAHL -> WADG', {'SUMMARY': 'Land', 'Trip': 'Round'})
+    by_code = handler.get_node_fields('E', 'WAHL -> WADG', {'SUMMARY': 'C', 'Trip': 'Round'})
+    assert by_name == by_code
+
+
+def test_picking_offered_options_always_prices(handler):
+    for _, node, location, records in _lanes(handler):
+        for rec in records:
+            inputs = {}
+            # Pick the record's value field by field, refreshing the options after each choice
+            for field in handler.get_node_fields(node, location):
+                options = _options(handler.get_node_fields(node, location, inputs))[field["name"]]
+                if field["name"] in rec:
+                    assert str(rec[field["name"]]) in options
+                    inputs[field["name"]] = rec[field["name"]]
+            result = handler.calculate([{"node": node, "location": location, "inputs": inputs}])
+            assert not result["node_results"][0].get("error"), (node, location, inputs)
+
+
+def test_fields_endpoint_takes_the_choices_made_so_far(handler):
+    client = app_module.app.test_client()
+    body = {"node": 'E', "location": 'WAHL -> WADG', "inputs": {"Trip": 'Round'}}
+    resp = client.post('/api/fields', json=body)
+    assert resp.status_code == 200
+    assert resp.get_json() == handler.get_node_fields('E', 'WAHL -> WADG', {"Trip": 'Round'})
+    resp = client.post('/api/fields', json=dict(body, inputs=['Trip', 'Round']))
+    assert resp.status_code == 400
+
+
+def test_no_match_suggests_the_nearest_records(handler):
+    inputs = {"Truck times": 10, "Method": 'Truck', "Capacity": '8T', "Trip": 'Oneway', "SUMMARY": 'Land', "CBM": 2}
+    result = handler.calculate([{"node": 'E', "location": 'WAHL -> WADG', "inputs": inputs}])["node_results"][0]
+
+    assert result["error"]
+    suggestions = result["suggestions"]
+    assert 0 < len(suggestions) <= 3
+    ranks = [(len(s["mismatches"]), s["row"]) for s in suggestions]
+    assert ranks == sorted(ranks)
+    # Only the trip differs for the 8T records, so they rank first
+    assert suggestions[0]["mismatches"] == [{"field": 'Trip', "input": 'Oneway', "record": suggestions[0]["inputs"]["Trip"],
+                                             "kind": 'different'}]
+    assert suggestions[0]["inputs"]["Capacity"] == '8T'
+    for suggestion in suggestions:
+        # Resubmitting a suggestion prices its record, keeping the requested quantities
+        assert suggestion["inputs"]["CBM"] == 2
+        priced = handler.calculate([{"node": 'E', "location": 'WAHL -> WADG', "inputs": suggestion["inputs"]}])
+        assert not priced["node_results"][0].get("error")
+
+
+def test_suggestion_mismatch_kinds(handler):
+    index = handler.lane_index['WAHL-DGWA']
+    suggestions = index.nearest('E', 'WAHL', 'WADG', {"Capacity": '99T', "Trip": 'Round'}, limit=1)
+    kinds = {m["field"]: m["kind"] for m in suggestions[0]["mismatches"]}
+    assert kinds["Capacity"] == 'different'
+    assert kinds["Truck times"] == 'missing_input'
+    # Turkey -> WAHL has no truck size
+    suggestions = handler.lane_index['VENDOR-WAHL'].nearest('F', 'Turkey', 'WAHL', {"Truck size": '20GP'}, limit=1)
+    assert {"field": 'Truck size', "input": '20GP', "record": None, "kind": 'not_in_record'} in suggestions[0]["mismatches"]
+    assert 'Truck size' not in suggestions[0]["inputs"]
+    assert index.nearest('E', 'Nowhere', 'WADG', {"Trip": 'Round'}) == []
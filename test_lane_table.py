@@ -0,0 +1,119 @@
+import copy
+import math
+
+import numpy as np
+import pytest
+
+import app as app_module
+from lane_table import DEFAULT_LIMIT, MAX_LIMIT
+
+
+def _all(table):
+    """Every record in sheet order, with its index as the tie breaker."""
+    return [dict(table._record(i), index=i) for i in range(table.size)]
+
+
+def _nan_last(val, sign=1):
+    return (True, 0) if val is None or math.isnan(val) else (False, sign * val)
+
+
+def _days(rec, i):
+    return rec["lt_days"][i] if rec["lt_days"] else None
+
+
+def _sorted(records, sort):
+    sign = -1 if sort.startswith('-') else 1
+    if sort.lstrip('-') == 'cost':
+        key = lambda rec: (_nan_last(rec["cost"], sign), _nan_last(_days(rec, 1)), rec["index"])
+    else:
+        key = lambda rec: (_nan_last(_days(rec, 0), sign), _nan_last(_days(rec, 1), sign),
+                           _nan_last(rec["cost"]), rec["index"])
+    return [(rec["sheet"], rec["row"]) for rec in sorted(records, key=key)]
+
+
+def _keys(result):
+    return [(lane["sheet"], lane["row"]) for lane in result["lanes"]]
+
+
+@pytest.mark.parametrize('params, keep', [
+    ({"node": 'E'}, lambda rec: rec["node"] == 'E'),
+    ({"node": ['A', 'C']}, lambda rec: rec["node"] in ('A', 'C')),
+    ({"sheet": 'VENDOR-WAHL', "from": 'Turkey'}, lambda rec: rec["location"] == 'Turkey -> WAHL'),
+    ({"to": 'WADG'}, lambda rec: rec["location"].endswith('-> WADG')),
+    ({"location": ' WAHL ->WADG'}, lambda rec: rec["location"] == 'WAHL -> WADG'),
+    ({"fields": {"Capacity": ['8T', '20GP'], "Trip": 'Round'}},
+     lambda rec: rec["inputs"].get("Capacity") in ('8T', '20GP') and rec["inputs"].get("Trip") == 'Round'),
+    ({"fields": {"SUMMARY": 'C'}}, lambda rec: rec["inputs"].get("SUMMARY") == 'Land'),
+    ({"cost_min": 1000, "cost_max": '5000'}, lambda rec: 1000 <= rec["cost"] <= 5000),
+    ({"lt_min": 2, "lt_max": 5}, lambda rec: rec["lt_days"][0] >= 2 and rec["lt_days"][1] <= 5),
+    ({"node": 'Z'}, lambda rec: False),
+])
+def test_filters_keep_the_matching_records(handler, params, keep):
+    table = handler.lane_table
+    expected = _sorted([rec for rec in _all(table) if keep(rec)], 'cost')
+    result = handler.query_lanes(dict(params, limit=MAX_LIMIT))
+
+    assert result["total"] == len(expected)
+    assert _keys(result) == expected
+
+
+@pytest.mark.parametrize('sort', ['cost', '-cost', 'lt', '-lt'])
+def test_sorting_breaks_ties_and_puts_missing_values_last(handler, sort):
+    table = copy.copy(handler.lane_table)
+    table.cost, table.lt_min, table.lt_max = table.cost.copy(), table.lt_min.copy(), table.lt_max.copy()
+    table.cost[[0, 5]] = np.nan
+    table.lt_min[3] = table.lt_max[3] = np.nan
+    records = _all(table)
+
+    result = table.query({"sort": sort, "limit": MAX_LIMIT})
+    assert _keys(result) == _sorted(records, sort)
+    missing = [0, 5] if sort.endswith('cost') else [3]
+    assert _keys(result)[-len(missing):] == [(records[i]["sheet"], records[i]["row"]) for i in missing]
+
+
+def test_pagination_bounds(handler):
+    everything = _keys(handler.query_lanes({"limit": MAX_LIMIT}))
+    total = len(everything)
+
+    default = handler.query_lanes({})
+    assert (default["offset"], default["limit"]) == (0, DEFAULT_LIMIT)
+    assert _keys(default) == everything[:DEFAULT_LIMIT]
+    page = handler.query_lanes({"offset": '10', "limit": '7'})
+    assert (page["total"], page["offset"], page["limit"]) == (total, 10, 7)
+    assert _keys(page) == everything[10:17]
+    assert handler.query_lanes({"limit": 0})["limit"] == 1
+    assert handler.query_lanes({"limit": MAX_LIMIT * 5})["limit"] == MAX_LIMIT
+    assert handler.query_lanes({"offset": -3, "limit": 2})["offset"] == 0
+    past = handler.query_lanes({"offset": total + 5})
+    assert past["total"] == total and past["lanes"] == []
+
+
+def test_query_records_price_in_calculate(handler):
+    for lane in handler.query_lanes({"node": ['A', 'E', 'F'], "limit": MAX_LIMIT})["lanes"]:
+        result = handler.calculate([{"node": lane["node"], "location": lane["location"], "inputs": lane["inputs"]}])
+        assert not result["node_results"][0].get("error"), lane
+
+
+@pytest.mark.parametrize('body', [
+    {"sort": 5},
+    {"sort": ['cost']},
+    {"sort": 'x'},
+    {"location": 'WAHL WADG'},
+    {"fields": {"No such field": 'x'}},
+    {"fields": ['Capacity', '8T']},
+    {"cost_min": 'cheap'},
+    {"lt_max": [5]},
+    {"limit": '1.5'},
+    {"offset": 'next'},
+    ['node', 'E'],
+])
+def test_invalid_parameters_are_rejected_with_400(body):
+    resp = app_module.app.test_client().post('/api/lanes', json=body)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]
+
+
+def test_lanes_endpoint(handler):
+    resp = app_module.app.test_client().post('/api/lanes', json={"node": 'F', "sort": '-lt', "limit": 3})
+    assert resp.status_code == 200
+    assert resp.get_json() == handler.query_lanes({"node": 'F', "sort": '-lt', "limit": 3})
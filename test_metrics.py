@@ -0,0 +1,149 @@
+import re
+import threading
+
+import pytest
+
+import app as app_module
+import metrics
+from result_cache import RESULT_CACHE
+
+METRIC_NAME = r'[a-zA-Z_:][a-zA-Z0-9_:]*'
+LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"'
+SAMPLE_RE = re.compile(rf'({METRIC_NAME})(\{{(?:{LABEL}(?:,{LABEL})*)?\}})? (\S+)')
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)"')
+TYPES = ('counter', 'gauge', 'histogram', 'summary', 'untyped')
+
+
+def parse_exposition(text):
+    """
+    Parse Prometheus text exposition format strictly enough to catch what a
+    scraper rejects; returns {family: {"type", "samples": [(name, labels, value)]}}.
+    """
+    assert text.endswith('\n')
+    families = {}
+    current = None
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            name = line.split(' ', 3)[2]
+            assert re.fullmatch(METRIC_NAME, name), line
+            assert name not in families, f"duplicate family {name}"
+            current = families[name] = {"type": None, "samples": []}
+        elif line.startswith('# TYPE '):
+            _, _, name, kind = line.split(' ')
+            assert kind in TYPES and name in families and not families[name]["samples"], line
+            families[name]["type"] = kind
+        else:
+            match = SAMPLE_RE.fullmatch(line)
+            assert match, f"bad sample line: {line!r}"
+            name, labels, value = match.groups()
+            assert current is not None and name.startswith(next(reversed(families))), line
+            current["samples"].append((name, dict(LABEL_RE.findall(labels or '')), float(value.replace('+Inf', 'inf'))))
+    return families
+
+
+def _histograms_are_consistent(family, name):
+    series = {}
+    for sample, labels, value in family["samples"]:
+        key = tuple(sorted((k, v) for k, v in labels.items() if k != 'le'))
+        series.setdefault(key, {"buckets": []})
+        if sample == f'{name}_bucket':
+            series[key]["buckets"].append((float(labels['le'].replace('+Inf', 'inf')), value))
+        else:
+            series[key][sample[len(name) + 1:]] = value
+    for values in series.values():
+        bounds = [b for b, _ in values["buckets"]]
+        counts = [c for _, c in values["buckets"]]
+        assert bounds == sorted(bounds) and bounds[-1] == float('inf')
+        assert counts == sorted(counts)
+        assert values["count"] == counts[-1] and values["sum"] >= 0
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def _server_timing(resp):
+    entries = {}
+    for entry in resp.headers['Server-Timing'].split(', '):
+        name, dur = entry.split(';dur=')
+        entries[name] = float(dur)
+    return entries
+
+
+def test_metrics_endpoint_is_prometheus_text(client, selections):
+    client.post('/api/calculate?debug=1', json=selections)
+    resp = client.get('/api/metrics')
+
+    assert resp.status_code == 200
+    assert resp.mimetype == 'text/plain' and 'version=0.0.4' in resp.headers['Content-Type']
+    families = parse_exposition(resp.get_data(as_text=True))
+    for name in ('shp_http_request_duration_seconds', 'shp_request_phase_duration_seconds',
+                 'shp_workbook_load_duration_seconds'):
+        assert families[name]["type"] == 'histogram'
+        _histograms_are_consistent(families[name], name)
+    assert families['shp_result_cache_hits_total']["type"] == 'counter'
+    assert families['shp_workbooks_loaded']["samples"][0][2] >= 1
+    requests = {(labels['endpoint'], labels['method'], labels['status'])
+                for _, labels, _ in families['shp_http_request_duration_seconds']["samples"]}
+    assert ('/api/calculate', 'POST', '200') in requests
+    # The request being served counts itself
+    assert families['shp_http_requests_in_flight']["samples"] == [('shp_http_requests_in_flight', {}, 1.0)]
+
+
+def test_label_values_are_escaped():
+    gauge = metrics.Gauge('shp_test_escape', 'Escaping.', ('path',))
+    gauge.set(1, 'a "quoted"\\path\nline')
+    families = parse_exposition(metrics.render([gauge]))
+    assert families['shp_test_escape']["samples"][0][1] == {"path": 'a \\"quoted\\"\\\\path\\nline'}
+
+
+def test_server_timing_lists_the_calculate_phases(client, selections):
+    RESULT_CACHE.clear()
+    phases = ('match', 'formula', 'breakdown', 'suggest', 'json')
+    before = {phase: _phase_count(phase) for phase in phases}
+    resp = client.post('/api/calculate', json=selections)
+    timing = _server_timing(resp)
+
+    assert {'match', 'breakdown', 'json'} <= set(timing) <= set(phases) | {'total'}
+    assert list(timing)[-1] == 'total'
+    assert all(dur >= 0 for dur in timing.values())
+    assert sum(dur for phase, dur in timing.items() if phase != 'total') <= timing['total']
+    # Each phase the request ran is observed once in the phase histogram
+    for phase, count in before.items():
+        assert _phase_count(phase) == count + (phase in timing)
+
+
+def _phase_count(phase):
+    series = metrics.PHASE_SECONDS._series.get((phase,))
+    return sum(series[:-1]) if series else 0
+
+
+def test_timings_do_not_leak_between_requests(client, selections):
+    RESULT_CACHE.clear()
+    client.post('/api/calculate', json=selections)
+    # A request that runs no phase (the metrics text is not JSON) reports only its total
+    assert list(_server_timing(client.get('/api/metrics'))) == ['total']
+    # ...and the request context is reset once it is done
+    assert metrics._timings.get() is None
+
+
+def test_timings_are_per_context():
+    timings = {}
+    started = threading.Barrier(2)
+
+    def run(name):
+        collected, token = metrics.start_timings()
+        started.wait()
+        with metrics.timed(name):
+            pass
+        metrics.stop_timings(token)
+        timings[name] = collected.phases
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in ('match', 'breakdown')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert {name: list(phases) for name, phases in timings.items()} == {'match': ['match'], 'breakdown': ['breakdown']}
+    assert metrics._timings.get() is None
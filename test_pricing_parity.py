@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+from excel_handler import ExcelHandler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Routes, fields and prices of both bundled workbooks as the row-scanning
+# ExcelHandler of the baseline commit returned them. Breakdowns are stored
+# once in "breakdowns" and referred to by index; "quantities" and
+# "scenarios" refer to their lanes by index into "sections", with the
+# inputs they change (null: the field is left out).
+with open(os.path.join(HERE, 'test_pricing_parity.json'), encoding='utf-8') as f:
+    RECORDED = json.load(f)
+
+
+@pytest.fixture(scope='module', params=sorted(RECORDED))
+def recorded(request):
+    handler = ExcelHandler(os.path.join(HERE, request.param), log_stdout=False, use_snapshot=False)
+    return handler, RECORDED[request.param]
+
+
+def _expected(expected, breakdowns):
+    if expected is None or expected["breakdown"] is None:
+        return expected
+    return dict(expected, breakdown=breakdowns[expected["breakdown"]])
+
+
+def _selection(book, index, quantities=None):
+    section = book["sections"][index]
+    return {"node": section["node"], "location": section["location"],
+            "inputs": {k: v for k, v in dict(section["inputs"], **(quantities or {})).items() if v is not None}}
+
+
+def _priced(handler, selection):
+    """The section result of calculate, without what the row scan did not return."""
+    results = handler.calculate([selection])["node_results"]
+    if not results:
+        return None
+    result, = results
+    return {k: v for k, v in result.items() if k not in ('node', 'suggestions')}
+
+
+def test_routes_and_fields_match_the_row_scan(recorded):
+    handler, book = recorded
+    assert handler.get_route_options() == book["routes"]
+    for key, fields in book["fields"].items():
+        node, location = key.split(' | ')
+        assert handler.get_node_fields(node, location) == fields, key
+
+
+def test_sections_price_like_the_row_scan(recorded):
+    """Every record's own inputs (exact matches), without SUMMARY, and lanes that do not exist."""
+    handler, book = recorded
+    mismatches = []
+    for case in book["sections"]:
+        selection = {k: case[k] for k in ('node', 'location', 'inputs')}
+        expected = _expected(case["expected"], book["breakdowns"])
+        if _priced(handler, selection) != expected:
+            mismatches.append(selection)
+    assert mismatches == []
+
+
+def test_other_quantities_price_like_the_row_scan(recorded):
+    """Records priced by their cost model (partial match) for PALLET QTY, CBM and G/W they were not written for."""
+    handler, book = recorded
+    mismatches = []
+    for case in book["quantities"]:
+        selection = _selection(book, case["section"], case["quantities"])
+        if _priced(handler, selection) != _expected(case["expected"], book["breakdowns"]):
+            mismatches.append(selection)
+    assert mismatches == []
+
+
+def test_scenario_totals_match_the_row_scan(recorded):
+    """Total cost and the lead time summed from the pre-parsed ranges of each section."""
+    handler, book = recorded
+    for case in book["scenarios"]:
+        result = handler.calculate([_selection(book, i, q) for i, q in case["selections"]])
+        assert (result["total_cost"], result["total_lt"]) == (case["total_cost"], case["total_lt"]), case["selections"]
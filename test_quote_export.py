@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+
+import pytest
+from openpyxl import load_workbook
+
+import app as app_module
+import quote_export
+
+
+@pytest.fixture(scope='module')
+def scenarios(selections):
+    no_match = dict(selections[0], inputs={"SUMMARY": 'No such method'})
+    return [selections, selections[:2], [no_match, {"node": selections[1]["node"]}]]
+
+
+def _ndjson_body(scenarios, bad_line=True):
+    lines = [json.dumps(s) for s in scenarios]
+    if bad_line:
+        lines.insert(1, '{not json')
+    return '\n'.join(lines) + '\n'
+
+
+def test_records_keep_every_section_and_price_like_calculate(handler, scenarios):
+    items = [(s, None) for s in scenarios] + [(None, "line 9: bad"), ({"node": 'A'}, None)]
+    records = list(quote_export.quote_records(handler, items))
+
+    assert [r["scenario"] for r in records] == [1, 2, 3, 4, 5]
+    for record, selections in zip(records, scenarios):
+        expected = handler.calculate(selections)
+        assert record["error"] is None
+        assert len(record["sections"]) == len(selections)
+        assert record["total_cost"] == pytest.approx(expected["total_cost"])
+        assert record["total_lt"] == expected["total_lt"]
+    no_match, skipped = records[2]["sections"]
+    assert no_match[1]["error"] and skipped[1] is None
+    assert records[3]["error"] == "line 9: bad"
+    assert records[4]["error"] == "Expected a list of selections"
+
+
+def test_read_ndjson_reports_bad_lines_and_skips_blank_ones():
+    stream = io.StringIO('[1]\n\n{oops\n[2]\n')
+    items = list(quote_export.read_ndjson(stream))
+    assert items[0] == ([1], None) and items[2] == ([2], None)
+    assert items[1][0] is None and items[1][1].startswith('line 3:')
+
+
+def test_csv_has_one_row_per_section(handler, scenarios):
+    records = quote_export.quote_records(handler, [(s, None) for s in scenarios])
+    text = ''.join(quote_export.csv_chunks(records))
+    rows = list(csv.DictReader(io.StringIO(text.lstrip('﻿'))))
+
+    assert len(rows) == sum(len(s) for s in scenarios)
+    first = [row for row in rows if row["scenario"] == '1']
+    expected = handler.calculate(scenarios[0])
+    assert [float(row["cost"]) for row in first] == pytest.approx([nr["cost"] for nr in expected["node_results"]])
+    assert {row["scenario_total_lt"] for row in first} == {expected["total_lt"]}
+    assert rows[-1]["error"] == "Skipped: missing node or location"
+
+
+def test_xlsx_sheets(handler, scenarios, tmp_path):
+    records = list(quote_export.quote_records(handler, [(s, None) for s in scenarios]))
+    path = str(tmp_path / 'quotes.xlsx')
+    quote_export.write_xlsx(iter(records), path)
+    wb = load_workbook(path)
+
+    totals = list(wb['Scenarios'].iter_rows(min_row=2, values_only=True))
+    assert [(row[0], row[2]) for row in totals] == [(r["scenario"], r["total_lt"]) for r in records]
+    assert wb['Sections'].max_row - 1 == sum(len(s) for s in scenarios)
+    items = sum(len(((result or {}).get('breakdown') or {}).get(kind, []))
+                for r in records for _, result in r["sections"] for kind in ('base', 'variable'))
+    assert items and wb['Breakdown'].max_row - 1 == items
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'ndjson', 'xlsx'])
+def test_export_endpoint_streams_ndjson_bodies(scenarios, fmt):
+    client = app_module.app.test_client()
+    resp = client.post(f'/api/export?format={fmt}', data=_ndjson_body(scenarios),
+                       content_type='application/x-ndjson')
+    assert resp.status_code == 200
+    assert resp.mimetype == quote_export.FORMATS[fmt]
+    if fmt == 'ndjson':
+        lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        assert len(lines) == len(scenarios) + 1
+        assert lines[1]["error"].startswith('line 2:')
+
+
+def test_export_endpoint_rejects_bad_requests(scenarios):
+    client = app_module.app.test_client()
+    assert client.post('/api/export?format=pdf', json=scenarios).status_code == 400
+    assert client.post('/api/export?format=csv', json={"scenarios": 'all'}).status_code == 400
+    resp = client.post('/api/export?format=ndjson', json={"scenarios": scenarios})
+    assert resp.status_code == 200
+    assert len(resp.get_data(as_text=True).splitlines()) == len(scenarios)
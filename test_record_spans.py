@@ -0,0 +1,136 @@
+from record_spans import RecordSpans
+from sheet_schema import SheetSchema
+from workbook_loader import SheetData
+
+HEADERS = ['MAP', 'From', 'To', 'Truck', 'SUMMARY', 'E2E Cost', 'E2E Lead Time']
+MAP, TRUCK, COST, LT = 1, 4, 6, 7
+
+
+def _sheet(rows, merges=()):
+    """Sheet with HEADERS in row 2, `rows` {row: [values]} below and merged column spans (col, first, last)."""
+    ws = SheetData('Rates')
+    for c, title in enumerate(HEADERS, 1):
+        ws.values[(2, c)] = title
+    for r, values in rows.items():
+        for c, val in enumerate(values, 1):
+            if val is not None:
+                ws.values[(r, c)] = val
+    ws.merged_ranges = [(first, col, last, col) for col, first, last in merges]
+    ws.max_row = max(rows)
+    ws.max_column = len(HEADERS)
+    return ws
+
+
+def _spans(ws):
+    return RecordSpans(ws, SheetSchema(ws))
+
+
+def _merged_record(first, rows=2):
+    """Merges of a WAHL-Customer style record: identity and E2E Cost columns over `rows` rows."""
+    return [(c, first, first + rows - 1) for c in (MAP, 2, 3, TRUCK, 5, COST)]
+
+
+def test_merged_records_span_their_merged_rows():
+    ws = _sheet({
+        3: ['TR', 'Turkey', 'Hub', '13.6m', 'LCL', 120, 'Standard'],
+        4: [None, None, None, None, None, None, '18-21Days'],
+        5: ['TR', 'Turkey', 'Port', '9.6m', 'LCL', None, '5-7Days'],
+        6: [None, None, None, None, None, 80, 'Standard'],
+    }, _merged_record(3) + _merged_record(5))
+    spans = _spans(ws)
+
+    assert sorted(spans.spans) == [3, 5]
+    first, second = spans.get(3), spans.get(5)
+    assert (first.kind, first.value_row, first.is_single_row) == ('merged', 4, False)
+    assert (first.cost, first.lead_time) == (120, '18-21Days')
+    # E2E Cost falls back to the value row; the days text wins over 'Standard' in either row
+    assert (second.cost, second.lead_time) == (80, '5-7Days')
+    assert spans.unclassified == []
+
+
+def test_unmerged_single_row_records():
+    ws = _sheet({
+        3: [None, 'Note: rates in USD'],
+        5: ['DG', 'Hub', 'Port', '13.6m', 'DG', 50, '3-4Days'],
+        6: ['DG', 'Hub', 'Port', '9.6m', 'DG', 40, None],
+        7: ['DG', 'Port', 'Site', '9.6m', 'DG', 30, '1-2Days'],
+    })
+    spans = _spans(ws)
+
+    # Note rows have no MAP node and start no record
+    assert sorted(spans.spans) == [5, 6, 7]
+    assert all(span.kind == 'single' and span.is_single_row for span in spans.spans.values())
+    # A single row never reads the next record's lead time or fields
+    assert (spans.get(6).cost, spans.get(6).lead_time) == (40, '')
+    assert spans.field_value(ws, 6, LT) is None
+    assert spans.unclassified == []
+
+
+def test_merged_field_cell_marks_a_record_without_a_merged_map_cell():
+    ws = _sheet({
+        3: ['TR', 'Turkey', 'Hub', None, 'LCL', None, 'Standard'],
+        4: [None, None, None, '13.6m', None, 95, '10-12Days'],
+    }, [(5, 3, 4)])
+    span = _spans(ws).get(3)
+
+    assert (span.kind, span.value_row) == ('merged', 4)
+    assert (span.cost, span.lead_time) == (95, '10-12Days')
+    assert _spans(ws).field_value(ws, 3, TRUCK) == '13.6m'
+
+
+def test_unmerged_record_with_a_value_row_is_reported():
+    ws = _sheet({
+        3: ['TR', 'Turkey', 'Hub', '13.6m', 'LCL', None, 'Standard'],
+        4: [None, None, None, None, None, 70, '8-9Days'],
+    })
+    spans = _spans(ws)
+    span = spans.get(3)
+
+    assert (span.kind, span.value_row) == ('unmerged', 4)
+    assert (span.cost, span.lead_time) == (70, '8-9Days')
+    assert [(r['row'], r['rows']) for r in spans.unclassified] == [(3, [3, 4])]
+
+
+def test_merges_running_into_the_next_record_are_cut_and_reported():
+    ws = _sheet({
+        3: ['TR', 'Turkey', 'Hub', '13.6m', 'LCL', 60, '2-3Days'],
+        4: ['TR', 'Turkey', 'Port', '9.6m', 'LCL', 50, '4-5Days'],
+        5: [None, None, None, None, None, None, None],
+    }, [(COST, 3, 5)])
+    spans = _spans(ws)
+
+    assert spans.get(3).is_single_row
+    assert spans.get(3).cost == 60
+    assert spans.get(4).lead_time == '4-5Days'
+    assert [r['row'] for r in spans.unclassified] == [3]
+    assert 'row 4' in spans.unclassified[0]['reason']
+
+
+def test_longer_merges_read_amounts_from_their_last_row():
+    ws = _sheet({
+        3: ['TR', 'Turkey', 'Hub', '13.6m', 'LCL', None, 'Standard'],
+        4: [None, None, None, None, None, None, 'Express'],
+        5: [None, None, None, None, None, 110, '6-8Days'],
+    }, [(MAP, 3, 5), (COST, 3, 5)])
+    spans = _spans(ws)
+    span = spans.get(3)
+
+    assert (span.kind, span.first, span.value_row) == ('merged', 3, 5)
+    assert (span.cost, span.lead_time) == (110, '6-8Days')
+    assert [r['rows'] for r in spans.unclassified] == [[3, 5]]
+
+
+def test_rows_that_start_no_record_read_as_single_rows():
+    spans = _spans(_sheet({3: ['TR', 'Turkey', 'Hub', '13.6m', 'LCL', 10, '1Days']}))
+    span = spans.get(9)
+    assert (span.first, span.value_row, span.kind) == (9, 9, 'single')
+
+
+def test_builtin_workbook_records_are_classified(handler):
+    kinds = {name: {(span.kind, span.last - span.first) for span in spans.spans.values()}
+             for name, spans in handler.record_spans.items()}
+
+    assert kinds['WAHL-Customer'] == {('merged', 1)}
+    assert kinds['VENDOR-WAHL'] == {('merged', 1)}
+    assert kinds['WAHL-DGWA'] == {('single', 0)}
+    assert handler.unclassified_records() == []
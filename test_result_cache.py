@@ -0,0 +1,100 @@
+import pytest
+
+import app as app_module
+from excel_handler import ExcelHandler
+from result_cache import MISSING, RESULT_CACHE, ResultCache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+    RESULT_CACHE.clear()
+    return app_module.app.test_client()
+
+
+def _counts(kind='section'):
+    stats = RESULT_CACHE.stats()
+    return stats['hits'].get(kind, 0), stats['misses'].get(kind, 0)
+
+
+def _calculate(client, selections, debug=False):
+    resp = client.post('/api/calculate?debug=1' if debug else '/api/calculate', json=selections)
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def test_lru_bound_and_disabled_cache():
+    cache = ResultCache(maxsize=2)
+    for key in 'abc':
+        cache.put('section', 'v1', key, key.upper())
+    assert cache.get('section', 'v1', 'a') is MISSING
+    assert cache.get('section', 'v1', 'b') == 'B'
+    cache.put('section', 'v1', 'd', 'D')   # 'c' is now the least recently used
+    assert cache.get('section', 'v1', 'c') is MISSING
+    assert cache.get('section', 'v1', 'b') == 'B'
+    assert cache.get('section', 'v2', 'b') is MISSING
+    assert cache.stats()['hits'] == {'section': 2}
+
+    cache.put('section', None, 'x', 1)
+    assert cache.get('section', None, 'x') is MISSING
+    disabled = ResultCache(maxsize=0)
+    disabled.put('section', 'v1', 'x', 1)
+    assert disabled.get('section', 'v1', 'x') is MISSING
+
+
+def test_retain_keeps_only_the_given_versions():
+    cache = ResultCache()
+    for version in ('v1', 'v2', 'v3'):
+        cache.put('fields', version, 'k', version)
+    cache.retain({'v1', 'v3'})
+    assert [cache.get('fields', v, 'k') for v in ('v1', 'v2', 'v3')] == ['v1', MISSING, 'v3']
+
+
+def test_repeat_calculate_is_served_from_the_cache(client, selections):
+    first = _calculate(client, selections)
+    hits, misses = _counts()
+    assert misses >= len(selections)
+
+    assert _calculate(client, selections) == first
+    assert _counts() == (hits + len(selections), misses)
+
+
+def test_debug_bypasses_the_cache_without_poisoning_it(client, selections, handler, monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(RESULT_CACHE, 'maxsize', 0)
+        uncached = handler.calculate(selections)
+    _calculate(client, selections)
+    before = _counts()
+    debug = _calculate(client, selections, debug=True)
+
+    # Every section was matched again and traced in full, with no lookup
+    assert _counts() == before
+    assert not any('Cached result' in line for line in debug['logs'])
+    assert sum('--- SECTION' in line for line in debug['logs']) == len(selections)
+    # The plain response after it is a hit, without the debug logs
+    plain = _calculate(client, selections)
+    assert 'logs' not in plain
+    assert plain == {k: v for k, v in debug.items() if k != 'logs'}
+    assert _counts()[0] == before[0] + len(selections)
+    assert plain == uncached
+
+
+def test_retain_drops_only_the_sheets_whose_digest_changed(builtin_xlsx, edited_copy, monkeypatch):
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+    RESULT_CACHE.clear()
+    old = ExcelHandler(builtin_xlsx, use_snapshot=False)
+    new = ExcelHandler(edited_copy(builtin_xlsx, 'WAHL-DGWA', '<c r="D25" s="9"><v>10</v>', '<c r="D25" s="9"><v>12</v>'),
+                       use_snapshot=False, previous=old)
+    changed = old.sheets['WAHL-DGWA'].digest
+    assert new.sheets['WAHL-DGWA'].digest != changed
+    for node, opts in old.get_route_options().items():
+        old.get_node_fields(node, opts['locations'][0])
+
+    RESULT_CACHE.retain(new.cache_versions())
+    versions = {key[0] for key in RESULT_CACHE._entries}
+    assert changed not in versions and old.content_hash not in versions
+    assert versions == {old.sheets[name].digest for name in ('WAHL-Customer', 'VENDOR-WAHL')}
+    # Fields of the unchanged sheets are still served from the cache
+    hits, _ = _counts('fields')
+    new.get_node_fields('A', old.get_route_options()['A']['locations'][0])
+    assert _counts('fields')[0] == hits + 1
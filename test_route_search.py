@@ -0,0 +1,67 @@
+import pytest
+
+import app as app_module
+
+QUANTITIES = {"PALLET QTY": 3, "CBM": 2, "G/W": 500}
+
+
+def _price(handler, selections):
+    result = handler.calculate(selections)
+    assert all(not nr.get("error") for nr in result["node_results"]), result
+    return result
+
+
+def test_routes_price_like_calculate(handler):
+    result = handler.find_routes('Turkey', 'Dyson PH Manila', QUANTITIES)
+
+    assert result["pareto"] and result["cheapest"] == result["pareto"][0]
+    for route in result["pareto"]:
+        legs = [{"node": leg["node"], "location": leg["location"], "inputs": leg["inputs"]} for leg in route["legs"]]
+        priced = _price(handler, legs)
+        assert priced["total_cost"] == pytest.approx(route["total_cost"])
+        assert priced["total_lt"] == route["total_lt"]
+        assert [nr["cost"] for nr in priced["node_results"]] == pytest.approx([leg["cost"] for leg in route["legs"]])
+    costs = [route["total_cost"] for route in result["pareto"]]
+    assert costs == sorted(costs)
+
+
+def test_unknown_location_is_rejected(handler):
+    with pytest.raises(ValueError):
+        handler.find_routes('Turkey', 'Atlantis', QUANTITIES)
+
+
+def test_record_inputs_select_the_record_with_the_input_quantities(handler):
+    sheet_name = handler._get_sheet_for_node('A')
+    ws, schema = handler.sheets[sheet_name], handler.schemas[sheet_name]
+    row = handler.lane_index[sheet_name].match_rows[('A', 'WADG', 'Dyson PH Manila')][0]
+
+    sel_inputs = handler._record_inputs(ws, schema, row, QUANTITIES)
+    assert sel_inputs is not None
+    assert _price(handler, [{"node": "A", "location": "WADG -> Dyson PH Manila", "inputs": sel_inputs}])
+    # A non-quantity input the record does not have rules the record out
+    assert handler._record_inputs(ws, schema, row, dict(QUANTITIES, SUMMARY='No such method')) is None
+
+
+@pytest.mark.parametrize('body', [
+    {"origin": 'Turkey', "destination": 'WAHL', "inputs": ["CBM", 2]},
+    {"origin": 'Turkey', "destination": 'WAHL', "inputs": "CBM=2"},
+    ['Turkey', 'WAHL'],
+    {"origin": ['Turkey'], "destination": 'WAHL'},
+    {"origin": 'Turkey', "destination": {"name": 'WAHL'}},
+    {"origin": 'Turkey', "destination": ''},
+    {"origin": 'Turkey', "destination": 'WAHL', "max_legs": 'two'},
+    {"origin": 'Turkey', "destination": 'WAHL', "max_legs": 0},
+    {"origin": 'Turkey', "destination": 'WAHL', "max_legs": [3]},
+])
+def test_invalid_requests_are_rejected_with_400(body):
+    app_module.app.testing = True
+    resp = app_module.app.test_client().post('/api/route-search', json=body)
+    assert resp.status_code == 400
+    assert resp.get_json()["error"]
+
+
+def test_route_search_endpoint(handler):
+    body = {"origin": 'Turkey', "destination": 'Dyson PH Manila', "inputs": QUANTITIES, "max_legs": '4'}
+    resp = app_module.app.test_client().post('/api/route-search', json=body)
+    assert resp.status_code == 200
+    assert resp.get_json()["pareto"] == handler.find_routes('Turkey', 'Dyson PH Manila', QUANTITIES, 4)["pareto"]
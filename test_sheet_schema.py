@@ -0,0 +1,65 @@
+import openpyxl
+
+from sheet_schema import GREEN_RGB, SheetSchema
+from workbook_loader import SheetData
+
+
+def _sheet(rows, fills=None):
+    """SheetData of rows (lists of values from column 1) and {(row, col): rgb} fills."""
+    data = SheetData('Rates', default_fill_rgb='00000000')
+    for r, row in enumerate(rows, 1):
+        for c, value in enumerate(row, 1):
+            if value is not None:
+                data.values[(r, c)] = value
+    data.fills.update(fills or {})
+    data.max_row = len(rows)
+    data.max_column = max(len(row) for row in rows)
+    return data
+
+
+def test_layout_of_a_sheet():
+    schema = SheetSchema(_sheet([
+        [None, None, None, None, None, None, 1, '2', 'x', 4, 5],
+        ['Rate card'],
+        ['MAP', 'From', 'To', 'CBM', 'Truck size', 'SUMMARY', 'E2E Cost', 'E2E Lead Time', 'Note', 'CBM', None],
+        ['A', 'WAHL', 'WADG', 1, '20GP', 'A', 100, '1Day', 'x', 2, None],
+    ], fills={(1, 7): 'FF92D050', (1, 8): '00FFFF00', (1, 10): '92D050'}))
+
+    assert (schema.header_row, schema.map_col, schema.from_col, schema.to_col) == (3, 1, 2, 3)
+    # A repeated title resolves to its first column
+    assert schema.col('CBM') == schema.cbm_col == 4
+    assert (schema.summary_col, schema.e2e_cost_col, schema.e2e_lt_col) == (6, 7, 8)
+    assert schema.field_cols == schema.match_cols == [(4, 'CBM'), (5, 'Truck size'), (6, 'SUMMARY')]
+    # Numbered columns with a title; green ones are the variable costs
+    assert schema.breakdown_cols == [(7, 'E2E Cost', True), (8, 'E2E Lead Time', False), (10, 'CBM', True)]
+
+
+def test_sheet_without_a_map_header():
+    schema = SheetSchema(_sheet([['Rates'], ['From', 'To', 'SUMMARY']]))
+    assert (schema.header_row, schema.map_col, schema.from_col, schema.to_col) == (2, None, None, None)
+    assert schema.field_cols == [] and schema.breakdown_cols == []
+
+
+def test_bundled_sheets_match_a_direct_scan(handler, builtin_xlsx):
+    wb = openpyxl.load_workbook(builtin_xlsx, data_only=True)
+    classified = set()
+    for name, schema in handler.schemas.items():
+        ws = wb[name]
+        header_row = next(r for r in range(1, 6) if 'MAP' in [ws.cell(r, c).value for c in range(1, 30)])
+        titles = {c: ws.cell(header_row, c).value for c in range(1, ws.max_column + 1)}
+        first = {}
+        for c, title in titles.items():
+            if title is not None:
+                first.setdefault(title, c)
+
+        assert schema.header_row == header_row, name
+        assert schema.columns == first, name
+        assert (schema.map_col, schema.from_col, schema.to_col) == (first['MAP'], first['From'], first['To'])
+        assert schema.field_cols == [(c, titles[c]) for c in range(first['To'] + 1, first['SUMMARY'] + 1) if titles[c]]
+        breakdown = [(c, str(titles[c]).strip(), str(ws.cell(1, c).fill.start_color.rgb) in GREEN_RGB)
+                     for c in range(1, ws.max_column + 1)
+                     if str(ws.cell(1, c).value or '').isdigit() or isinstance(ws.cell(1, c).value, int)
+                     if titles[c]]
+        assert schema.breakdown_cols == breakdown, name
+        classified.update(green for _, _, green in breakdown)
+    assert classified == {True, False}
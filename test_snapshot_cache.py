@@ -0,0 +1,119 @@
+import os
+import pickle
+import shutil
+
+import pytest
+
+import snapshot_cache
+from excel_handler import ExcelHandler
+from lane_table import MAX_LIMIT
+from snapshot_cache import MAGIC, file_digest, load_snapshot, snapshot_path
+
+
+@pytest.fixture
+def workbook(tmp_path, builtin_xlsx):
+    path = str(tmp_path / 'rates.xlsx')
+    shutil.copyfile(builtin_xlsx, path)
+    return path
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Paths ExcelHandler parsed from the xlsx rather than a snapshot."""
+    parsed = []
+    build = ExcelHandler._build
+
+    def counting_build(self, ctx, previous=None):
+        parsed.append(self.file_path)
+        return build(self, ctx, previous)
+
+    monkeypatch.setattr(ExcelHandler, '_build', counting_build)
+    return parsed
+
+
+def _handler(path):
+    return ExcelHandler(path, log_stdout=False, use_snapshot=True)
+
+
+def _rewrite(path, header, state):
+    with open(path, 'wb') as f:
+        pickle.dump(header, f)
+        pickle.dump(state, f)
+
+
+def _lanes(handler):
+    # Read from the compiled lane table: results cached by content hash would hide a bad load
+    return handler.query_lanes({"limit": MAX_LIMIT})["lanes"]
+
+
+def test_snapshot_is_written_and_loaded_instead_of_parsing(workbook, builds):
+    first = _handler(workbook)
+    assert os.path.exists(snapshot_path(workbook, first.content_hash))
+    second = _handler(workbook)
+
+    assert builds == [workbook]
+    assert _lanes(second) == _lanes(first)
+
+
+def _state(path):
+    with open(path, 'rb') as f:
+        pickle.load(f)
+        return pickle.load(f)
+
+
+def _stale_version(path, digest):
+    _rewrite(path, (MAGIC, snapshot_cache.FORMAT_VERSION - 1, digest), _state(path))
+
+
+def _other_content(path, digest):
+    _rewrite(path, (MAGIC, snapshot_cache.FORMAT_VERSION, 'f' * 64), _state(path))
+
+
+def _truncated(path, digest):
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+
+def _not_a_pickle(path, digest):
+    with open(path, 'wb') as f:
+        f.write(b'PK\x03\x04 not a snapshot')
+
+
+@pytest.mark.parametrize('damage', [_stale_version, _other_content, _truncated, _not_a_pickle])
+def test_unusable_snapshots_are_ignored_and_rebuilt(workbook, builds, damage):
+    expected = _lanes(_handler(workbook))
+    digest = file_digest(workbook)
+    path = snapshot_path(workbook, digest)
+    damage(path, digest)
+    assert load_snapshot(workbook, digest) is None
+
+    handler = _handler(workbook)
+    assert builds == [workbook, workbook]
+    assert not handler.load_error
+    assert _lanes(handler) == expected
+    # The rebuilt snapshot replaces the unusable one
+    assert load_snapshot(workbook, digest) is not None
+    _handler(workbook)
+    assert len(builds) == 2
+
+
+def test_snapshots_of_an_older_format_are_not_read(workbook, builds, monkeypatch):
+    current = snapshot_cache.FORMAT_VERSION
+    monkeypatch.setattr(snapshot_cache, 'FORMAT_VERSION', current - 1)
+    _handler(workbook)
+    monkeypatch.setattr(snapshot_cache, 'FORMAT_VERSION', current)
+
+    _handler(workbook)
+    assert builds == [workbook, workbook]
+
+
+def test_edited_workbook_does_not_load_the_old_snapshot(workbook, builds, handler):
+    _handler(workbook)
+    with open(workbook, 'ab') as f:
+        f.write(b'\0')   # new content hash, the zip still reads
+    edited = _handler(workbook)
+
+    assert builds == [workbook, workbook]
+    assert _lanes(edited) == _lanes(handler)
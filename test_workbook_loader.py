@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+import workbook_loader
+from excel_handler import ExcelHandler
+from lane_table import MAX_LIMIT
+from workbook_loader import load_sheets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORKBOOKS = ['5.shipping cost based on summary.xlsx', os.path.join('uploads', '5.shipping_cost_based_on_summary.xlsx')]
+
+
+@pytest.fixture
+def read_only(monkeypatch):
+    """Load as with an openpyxl whose private worksheet parser could not be imported."""
+    monkeypatch.setattr(workbook_loader, '_SheetParser', None)
+
+
+def _content(data):
+    return (data.values, data.formulas, data.fills, data.merged_ranges,
+            data.max_row, data.max_column, data.default_fill_rgb, data.digest)
+
+
+@pytest.mark.parametrize('name', WORKBOOKS)
+def test_read_only_fallback_reads_the_same_sheets(name, monkeypatch):
+    path = os.path.join(HERE, name)
+    streamed = load_sheets(path, ExcelHandler.SHEETS)
+    monkeypatch.setattr(workbook_loader, '_SheetParser', None)
+    fallback = load_sheets(path, ExcelHandler.SHEETS)
+
+    assert sorted(fallback) == sorted(streamed) == sorted(ExcelHandler.SHEETS)
+    for sheet, data in streamed.items():
+        assert _content(fallback[sheet]) == _content(data), sheet
+    # Unchanged sheets keep their identity there too
+    again = load_sheets(path, ExcelHandler.SHEETS, previous=fallback)
+    assert all(again[sheet] is fallback[sheet] for sheet in fallback)
+
+
+def test_handler_loads_through_the_fallback(handler, builtin_xlsx, read_only):
+    fallback = ExcelHandler(builtin_xlsx, log_stdout=False, use_snapshot=False)
+    assert not fallback.load_error
+    assert fallback.get_route_options() == handler.get_route_options()
+    assert fallback.query_lanes({"limit": MAX_LIMIT}) == handler.query_lanes({"limit": MAX_LIMIT})
@@ -0,0 +1,111 @@
+import os
+import shutil
+
+import pytest
+
+from excel_handler import ExcelHandler
+from result_cache import RESULT_CACHE
+from synthetic_workbook import generate_workbook
+from workbook_registry import WorkbookRegistry, estimate_bytes, workbook_id
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+
+
+@pytest.fixture(scope='module')
+def workbooks(tmp_path_factory):
+    """Three small synthetic rate cards with different content."""
+    folder = tmp_path_factory.mktemp('workbooks')
+    paths = []
+    for seed in (1, 2, 3):
+        path = str(folder / f'rates{seed}.xlsx')
+        generate_workbook(path, nodes=2, lanes=1, records=2, columns=4, seed=seed)
+        paths.append(path)
+    return paths
+
+
+def _registry(tmp_path, max_workbooks=8, max_bytes=2 ** 40):
+    return WorkbookRegistry(max_workbooks, max_bytes, shared_dir=str(tmp_path / '.workbooks'))
+
+
+def test_same_content_gets_one_id_path_and_handler(tmp_path, builtin_xlsx):
+    copies = [str(tmp_path / name) for name in ('a.xlsx', 'b.xlsx')]
+    for path in copies:
+        shutil.copyfile(builtin_xlsx, path)
+    registry = _registry(tmp_path)
+
+    (id_a, path_a), (id_b, path_b) = registry.publish(copies[0]), registry.publish(copies[1])
+    assert id_a == id_b == workbook_id(builtin_xlsx)
+    assert path_a == path_b == os.path.join(registry.shared_dir, id_a + '.xlsx')
+    first, second = registry.load(copies[0]), registry.load(copies[1])
+    assert first[0] == second[0] == id_a
+    assert first[1] is second[1]
+    assert [wb["id"] for wb in registry.list()] == [id_a]
+    assert registry.latest('a.xlsx') == registry.latest('b.xlsx') == id_a
+    # Without a shared folder the file is loaded where it is
+    assert WorkbookRegistry().publish(copies[1]) == (id_a, copies[1])
+
+
+def test_published_copy_keeps_its_content_when_the_source_is_overwritten(tmp_path, workbooks):
+    source = str(tmp_path / 'rates.xlsx')
+    shutil.copyfile(workbooks[0], source)
+    wb_id, published = _registry(tmp_path).publish(source)
+
+    shutil.copyfile(workbooks[1], source)   # in place, same inode
+    assert workbook_id(published) == wb_id
+
+
+def test_least_recently_used_workbooks_are_evicted_past_max_workbooks(tmp_path, builtin_xlsx, workbooks):
+    registry = _registry(tmp_path, max_workbooks=3)
+    active, _ = registry.load(builtin_xlsx, activate=True)
+    ids = [registry.load(path)[0] for path in workbooks[:2]]
+
+    registry.get(ids[0])   # now more recently used than ids[1]
+    newest, _ = registry.load(workbooks[2])
+    assert ids[1] not in registry
+    assert {wb["id"] for wb in registry.list()} == {active, ids[0], newest}
+    assert registry.latest(os.path.basename(workbooks[1])) is None
+
+
+def test_workbooks_are_evicted_past_max_bytes(tmp_path, workbooks):
+    sizes = [estimate_bytes(ExcelHandler(path, log_stdout=False)) for path in workbooks]
+    budget = sizes[1] + sizes[2]
+    assert budget < sum(sizes)
+    registry = _registry(tmp_path, max_bytes=budget)
+
+    ids = [registry.load(path)[0] for path in workbooks]
+    # Not the count but the size is over: the oldest goes first
+    assert [wb["id"] for wb in registry.list()] == [ids[2], ids[1]]
+    assert sum(wb["size"] for wb in registry.list()) <= budget
+
+
+def test_active_workbook_is_never_evicted(tmp_path, workbooks):
+    registry = _registry(tmp_path, max_workbooks=1, max_bytes=1)
+    active, handler = registry.load(workbooks[0], activate=True)
+    assert active in registry
+
+    other, _ = registry.load(workbooks[1])
+    assert active in registry and other not in registry
+    assert registry.get() is handler
+    # Activating the other workbook makes the first one evictable
+    registry.load(workbooks[1], activate=True)
+    assert active not in registry and registry.active() == other
+
+
+def test_eviction_drops_the_cached_results_of_evicted_workbooks(tmp_path, workbooks):
+    registry = _registry(tmp_path, max_workbooks=2)
+    _, kept = registry.load(workbooks[0], activate=True)
+    _, evicted = registry.load(workbooks[1])
+    for handler in (kept, evicted):
+        for node, opts in handler.get_route_options().items():
+            handler.get_node_fields(node, opts['locations'][0])
+
+    def cached(handler):
+        return [key for key in RESULT_CACHE._entries if key[0] in handler.cache_versions()]
+
+    assert cached(kept) and cached(evicted)
+    registry.load(workbooks[2])
+    assert cached(kept)
+    assert not cached(evicted)
@@ -0,0 +1,108 @@
+import os
+import shutil
+import time
+
+import pytest
+
+from excel_handler import ExcelHandler
+from ingest_jobs import IngestJobs
+from workbook_registry import WorkbookRegistry, workbook_id
+from workbook_watcher import WorkbookWatcher
+
+# Truck times of one WAHL-DGWA record: 10 -> 12
+EDIT = ('WAHL-DGWA', '<c r="D25" s="9"><v>10</v>', '<c r="D25" s="9"><v>12</v>')
+COMPILED = ('sheets', 'schemas', 'record_spans', 'lane_index', 'cost_models')
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    monkeypatch.setenv('SHP_LOG_STDOUT', '0')
+
+
+def test_only_the_edited_sheet_is_recompiled(handler, builtin_xlsx, edited_copy):
+    edited = ExcelHandler(edited_copy(builtin_xlsx, *EDIT), use_snapshot=False, previous=handler)
+
+    assert edited.recompiled == ['WAHL-DGWA']
+    for name in ('WAHL-Customer', 'VENDOR-WAHL'):
+        for attr in COMPILED:
+            assert getattr(edited, attr)[name] is getattr(handler, attr)[name], (name, attr)
+    for attr in COMPILED:
+        assert getattr(edited, attr)['WAHL-DGWA'] is not getattr(handler, attr)['WAHL-DGWA'], attr
+    lanes = edited.query_lanes({"sheet": 'WAHL-DGWA', "limit": 100})["lanes"]
+    assert {lane["row"]: lane["inputs"]["Truck times"] for lane in lanes}[25] == 12
+    # Priced like a fresh load of the edited file
+    fresh = ExcelHandler(edited.file_path, use_snapshot=False)
+    assert edited.query_lanes({"limit": 100}) == fresh.query_lanes({"limit": 100})
+
+
+def test_unchanged_workbook_recompiles_nothing(handler, builtin_xlsx, tmp_path):
+    copy = str(tmp_path / 'copy.xlsx')
+    shutil.copyfile(builtin_xlsx, copy)
+    reloaded = ExcelHandler(copy, use_snapshot=False, previous=handler)
+    assert reloaded.recompiled == []
+    assert all(reloaded.lane_index[name] is handler.lane_index[name] for name in handler.lane_index)
+
+
+@pytest.fixture
+def watched(tmp_path, builtin_xlsx):
+    """A workbook file loaded as the active workbook, with the ingest jobs a watcher submits to."""
+    path = str(tmp_path / 'rates.xlsx')
+    shutil.copyfile(builtin_xlsx, path)
+    registry = WorkbookRegistry(shared_dir=str(tmp_path / '.workbooks'))
+    registry.load(path, activate=True)
+    return path, registry, IngestJobs(registry, str(tmp_path / '.jobs'))
+
+
+def _watchers(watched, tmp_path, count=2):
+    """Watchers of one file sharing a lock, as in separate gunicorn workers."""
+    path, registry, jobs = watched
+    lock_path = str(tmp_path / '.workbooks' / 'watch.lock')
+    return [WorkbookWatcher(registry, jobs, files=[path], interval=60, lock_path=lock_path) for _ in range(count)]
+
+
+def _poll(watchers):
+    """One poll round as WorkbookWatcher._run does it: only the lock holder scans."""
+    return [job for watcher in watchers if watcher._acquire() for job in watcher.poll()]
+
+
+def _wait(jobs, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] in ('done', 'failed'):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_changed_file_is_reloaded_once_by_the_lock_holder(watched, tmp_path, builtin_xlsx, edited_copy):
+    path, registry, jobs = watched
+    watchers = _watchers(watched, tmp_path)
+    assert _poll(watchers) == []
+
+    shutil.copyfile(edited_copy(builtin_xlsx, *EDIT), path)
+    # Acted on once the file has stopped changing for one poll
+    assert _poll(watchers) == []
+    submitted = _poll(watchers)
+    assert len(submitted) == 1
+    assert _poll(watchers) == [] and _poll(watchers) == []
+    assert watchers[0]._acquire() and not watchers[1]._acquire()
+
+    job = _wait(jobs, submitted[0]['id'])
+    assert job['status'] == 'done', job
+    assert job['recompiled'] == ['WAHL-DGWA']
+    assert job['activated']
+    assert registry.active() == workbook_id(path)
+    assert [wb["id"] for wb in registry.list()] == [workbook_id(path), workbook_id(builtin_xlsx)]
+
+
+def test_new_mtime_with_the_same_content_reloads_nothing(watched, tmp_path):
+    path, registry, jobs = watched
+    active = registry.active()
+    watcher, = _watchers(watched, tmp_path, count=1)
+    _poll([watcher])
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5 * 10 ** 9))
+    assert _poll([watcher]) == [] and _poll([watcher]) == []
+    assert registry.active() == active and len(registry.list()) == 1
@@ -0,0 +1,274 @@
+import hashlib
+import io
+from xml.etree.ElementTree import iterparse
+
+from openpyxl import load_workbook
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.reader.excel import ExcelReader
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.xml.constants import ARC_STYLE, SHARED_STRINGS, SHEET_MAIN_NS
+from openpyxl.xml.functions import fromstring
+
+try:
+    # Private openpyxl API (tested with 3.1): values and formulas in one pass
+    from openpyxl.worksheet._reader import WorkSheetParser, FORMULA_TAG
+except ImportError:     # moved: sheets are read through load_workbook(read_only=True)
+    WorkSheetParser = None
+
+MERGE_CELL_TAG = f'{{{SHEET_MAIN_NS}}}mergeCell'
+
+
+class SheetData:
+    """
+    Compact, read-only copy of one worksheet.
+
+    Keeps only what the calculator needs: the cached value of every cell,
+    the formula text of formula cells, cell fill colours and the merged
+    ranges. Cells are addressed with 1-based (row, column) like openpyxl.
+    """
+
+    def __init__(self, title, default_fill_rgb=None):
+        self.title = title
+        self.values = {}          # (row, col) -> cached value
+        self.formulas = {}        # (row, col) -> formula text, e.g. '=SUM(N4:AH4)'
+        self.fills = {}           # (row, col) -> fill start colour rgb, for filled cells only
+        self.merged_ranges = []   # (min_row, min_col, max_row, max_col)
+        self.max_row = 1
+        self.max_column = 1
+        self.default_fill_rgb = default_fill_rgb
+        self.source_digest = None  # SHA-256 of the sheet XML with the shared strings and styles it was read from
+        self.digest = None         # SHA-256 of the content above, see content_digest
+
+    def value(self, row, col):
+        """Cached value of the cell, as openpyxl returns it with data_only=True."""
+        return self.values.get((row, col))
+
+    def formula(self, row, col):
+        """Cell content as written: the formula text for formula cells, else the value."""
+        formula = self.formulas.get((row, col))
+        if formula is not None:
+            return formula
+        return self.values.get((row, col))
+
+    def fill_rgb(self, row, col):
+        return self.fills.get((row, col), self.default_fill_rgb)
+
+    def row_values(self, row):
+        values = self.values
+        return tuple(values.get((row, c)) for c in range(1, self.max_column + 1))
+
+
+if WorkSheetParser is not None:
+    class _SheetParser(WorkSheetParser):
+        """WorkSheetParser that reads the cached value and the formula of a cell in one pass."""
+
+        def parse_cell(self, element):
+            cell = super().parse_cell(element)
+            if element.find(FORMULA_TAG) is not None:
+                cell['formula'] = self.parse_formula(element)
+            return cell
+else:
+    _SheetParser = None
+
+
+def content_digest(data):
+    """
+    Fingerprint of everything the calculator reads from a sheet. Equal
+    digests mean equal compiled state, whatever the XML around it looked like.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((data.title, data.default_fill_rgb, data.max_row, data.max_column)).encode())
+    for part in (data.values, data.formulas, data.fills):
+        # Cells are stored in sheet order, so equal content gives equal reprs
+        digest.update(repr(list(part.items())).encode())
+    digest.update(repr(data.merged_ranges).encode())
+    return digest.hexdigest()
+
+
+def _shared_digest(reader):
+    """Digest of the parts every worksheet depends on: the shared strings and the styles."""
+    digest = hashlib.sha256()
+    ct = reader.package.find(SHARED_STRINGS)
+    for part in (ct.PartName[1:] if ct is not None else None, ARC_STYLE):
+        if part in reader.valid_files:
+            digest.update(reader.archive.read(part))
+    return digest
+
+
+def _load_stylesheet(archive):
+    try:
+        src = archive.read(ARC_STYLE)
+    except KeyError:
+        return None
+    return Stylesheet.from_tree(fromstring(src))
+
+
+def _fill_rgb(stylesheet, style_id):
+    if stylesheet is None or not stylesheet.cell_styles:
+        return None
+    return _rgb(stylesheet.fills[stylesheet.cell_styles[style_id].fillId])
+
+
+def _rgb(fill):
+    if fill is None or not hasattr(fill.start_color, 'rgb'):
+        return None
+    return str(fill.start_color.rgb)
+
+
+def _add_merged_ranges(data, refs):
+    for ref in refs:
+        min_col, min_row, max_col, max_row = range_boundaries(ref)
+        data.merged_ranges.append((min_row, min_col, max_row, max_col))
+        data.max_row = max(data.max_row, max_row)
+        data.max_column = max(data.max_column, max_col)
+        # Like openpyxl, only the top-left cell of a merged range keeps content
+        for r in range(min_row, max_row + 1):
+            for c in range(min_col, max_col + 1):
+                if (r, c) != (min_row, min_col):
+                    data.values.pop((r, c), None)
+                    data.formulas.pop((r, c), None)
+
+
+def load_sheets(file_path, sheet_names, previous=None):
+    """
+    Read the requested worksheets of an xlsx file in a single streaming pass.
+
+    Each worksheet XML is parsed once, keeping both the cached values and
+    the formulas, so callers no longer need a data_only and a formula copy
+    of the workbook. Returns {sheet name: SheetData} for the sheets found.
+
+    previous ({sheet name: SheetData} read from an earlier version of the
+    file) makes the read incremental: a sheet whose XML, shared strings and
+    styles are unchanged is not parsed again, and a re-parsed sheet whose
+    content_digest is unchanged is returned as the previous object, so
+    callers can tell unchanged sheets apart by identity.
+
+    Without openpyxl's private worksheet parser (a version other than 3.1)
+    the sheets are read through _load_sheets_read_only instead.
+    """
+    previous = previous or {}
+    if _SheetParser is None:
+        return _load_sheets_read_only(file_path, sheet_names, previous)
+    reader = ExcelReader(file_path, read_only=True, data_only=True)
+    try:
+        reader.read_manifest()
+        reader.read_strings()
+        reader.read_workbook()
+        stylesheet = _load_stylesheet(reader.archive)
+        date_formats = stylesheet.date_formats if stylesheet else set()
+        timedelta_formats = stylesheet.timedelta_formats if stylesheet else set()
+        default_rgb = _fill_rgb(stylesheet, 0)
+        shared_digest = _shared_digest(reader)
+
+        sheets = {}
+        for sheet, rel in reader.parser.find_sheets():
+            if sheet.name not in sheet_names or rel.target not in reader.valid_files:
+                continue
+            if "chartsheet" in rel.Type:
+                continue
+            xml = reader.archive.read(rel.target)
+            source_digest = shared_digest.copy()
+            source_digest.update(xml)
+            source_digest = source_digest.hexdigest()
+            before = previous.get(sheet.name)
+            if before is not None and before.source_digest == source_digest:
+                sheets[sheet.name] = before
+                continue
+
+            data = SheetData(sheet.name, default_rgb)
+            data.source_digest = source_digest
+            with io.BytesIO(xml) as src:
+                parser = _SheetParser(src, reader.shared_strings, data_only=True,
+                                      epoch=reader.wb.epoch, date_formats=date_formats,
+                                      timedelta_formats=timedelta_formats)
+                fill_cache = {}
+                for _, cells in parser.parse():
+                    for cell in cells:
+                        key = (cell['row'], cell['column'])
+                        if cell['value'] is not None:
+                            data.values[key] = cell['value']
+                        if 'formula' in cell:
+                            data.formulas[key] = cell['formula']
+                        style_id = cell['style_id']
+                        if style_id:
+                            if style_id not in fill_cache:
+                                fill_cache[style_id] = _fill_rgb(stylesheet, style_id)
+                            if fill_cache[style_id] != default_rgb:
+                                data.fills[key] = fill_cache[style_id]
+                        data.max_row = max(data.max_row, key[0])
+                        data.max_column = max(data.max_column, key[1])
+
+            if parser.merged_cells:
+                _add_merged_ranges(data, [cr.ref for cr in parser.merged_cells.mergeCell])
+            data.digest = content_digest(data)
+            if before is not None and before.digest == data.digest:
+                data = before
+            sheets[sheet.name] = data
+        return sheets
+    finally:
+        reader.archive.close()
+
+
+def _load_sheets_read_only(file_path, sheet_names, previous):
+    """
+    load_sheets through openpyxl's public read-only mode, for an openpyxl
+    without the private worksheet parser: one read for the cached values
+    and fills, one for the formulas and the merged ranges from the sheet
+    XML. Slower, but gives the same SheetData. Sheets are always parsed;
+    previous only keeps the identity of sheets whose content is unchanged.
+    """
+    reader = ExcelReader(file_path, read_only=True)
+    values_wb = load_workbook(file_path, read_only=True, data_only=True)
+    formulas_wb = load_workbook(file_path, read_only=True, data_only=False)
+    try:
+        reader.read_manifest()
+        reader.read_workbook()
+        default_rgb = _fill_rgb(_load_stylesheet(reader.archive), 0)
+
+        sheets = {}
+        for sheet, rel in reader.parser.find_sheets():
+            if sheet.name not in sheet_names or rel.target not in reader.valid_files:
+                continue
+            if "chartsheet" in rel.Type:
+                continue
+            data = SheetData(sheet.name, default_rgb)
+            ws = values_wb[sheet.name]
+            ws.reset_dimensions()   # read every row, whatever the stored dimension says
+            for row in ws.iter_rows():
+                for cell in row:
+                    if cell is EMPTY_CELL:
+                        continue
+                    key = (cell.row, cell.column)
+                    if cell.value is not None:
+                        data.values[key] = cell.value
+                    if cell.has_style:
+                        rgb = _rgb(cell.fill)
+                        if rgb != default_rgb:
+                            data.fills[key] = rgb
+                    data.max_row = max(data.max_row, key[0])
+                    data.max_column = max(data.max_column, key[1])
+            ws = formulas_wb[sheet.name]
+            ws.reset_dimensions()
+            for row in ws.iter_rows():
+                for cell in row:
+                    if cell is not EMPTY_CELL and cell.data_type == 'f':
+                        data.formulas[(cell.row, cell.column)] = cell.value
+
+            refs = []
+            with reader.archive.open(rel.target) as src:
+                for _, element in iterparse(src):
+                    if element.tag == MERGE_CELL_TAG:
+                        refs.append(element.get('ref'))
+                    element.clear()
+            _add_merged_ranges(data, refs)
+            data.digest = content_digest(data)
+            before = previous.get(sheet.name)
+            if before is not None and before.digest == data.digest:
+                data = before
+            sheets[sheet.name] = data
+        return sheets
+    finally:
+        values_wb.close()
+        formulas_wb.close()
+        reader.archive.close()
@@ -0,0 +1,212 @@
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict
+
+from excel_handler import ExcelHandler
+from snapshot_cache import file_digest
+from result_cache import RESULT_CACHE
+
+# Retained memory of a parsed workbook (sheet cells, lane index, cost models)
+# measured at ~450 bytes per stored cell value/formula.
+BYTES_PER_CELL = 512
+WORKBOOK_ID_RE = re.compile(r'[0-9a-f]{16}')
+ACTIVE_FILE = 'ACTIVE'
+
+
+def workbook_id(file_path):
+    """Content-hash ID of a workbook file: the first 16 hex digits of its SHA-256."""
+    return file_digest(file_path)[:16]
+
+
+def estimate_bytes(handler):
+    cells = sum(len(ws.values) + len(ws.formulas) for ws in handler.sheets.values())
+    return cells * BYTES_PER_CELL
+
+
+class WorkbookRegistry:
+    """
+    Parsed workbooks (ExcelHandler snapshots) keyed by content-hash ID.
+
+    Loading a file whose content is already registered returns the existing
+    snapshot instead of parsing it again. Least recently used workbooks are
+    evicted once more than max_workbooks are held or their estimated size
+    exceeds max_bytes; the active workbook, served to requests that do not
+    name one, is never evicted.
+
+    With shared_dir set, several processes (gunicorn workers) serve the same
+    workbooks: every loaded file is published there as <id>.xlsx, the
+    active id is written to shared_dir/ACTIVE, and get() picks up workbooks
+    and activations made by other processes. Their compiled snapshots are
+    cached next to the published files, so adopting one costs a snapshot
+    load rather than a parse.
+    """
+
+    def __init__(self, max_workbooks=None, max_bytes=None, shared_dir=None):
+        if max_workbooks is None:
+            max_workbooks = int(os.environ.get('SHP_MAX_WORKBOOKS', 8))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('SHP_MAX_WORKBOOK_MB', 256)) * 1024 * 1024)
+        self.max_workbooks = max_workbooks
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # id -> (handler, filename, size)
+        self._latest = {}               # filename -> id last loaded under that name
+        self._lock = threading.Lock()
+        self.active_id = None
+        self.shared_dir = shared_dir
+        self._active_stamp = None       # stat of shared_dir/ACTIVE when last read or written
+
+    def publish(self, file_path):
+        """
+        Workbook id of file_path and the path to load it from: its published
+        copy in shared_dir, or file_path itself when nothing is shared.
+        """
+        wb_id = workbook_id(file_path)
+        if self.shared_dir:
+            file_path = self._publish(file_path, wb_id)
+        return wb_id, file_path
+
+    def load(self, file_path, filename=None, activate=False, previous=None):
+        """
+        Register the workbook at file_path; returns (workbook id, handler).
+        previous: handler of an earlier version whose unchanged sheets are reused.
+        """
+        filename = filename or os.path.basename(file_path)
+        wb_id, file_path = self.publish(file_path)
+        with self._lock:
+            entry = self._entries.get(wb_id)
+            if entry is not None:
+                self._entries.move_to_end(wb_id)
+                self._latest[filename] = wb_id
+                if activate:
+                    self._activate(wb_id)
+                return wb_id, entry[0]
+
+        # Parse outside the lock so other workbooks stay available meanwhile
+        handler = ExcelHandler(file_path, previous=previous)
+        with self._lock:
+            entry = self._entries.get(wb_id)
+            if entry is None:
+                entry = (handler, filename, estimate_bytes(handler))
+                self._entries[wb_id] = entry
+            self._entries.move_to_end(wb_id)
+            self._latest[filename] = wb_id
+            if activate:
+                self._activate(wb_id)
+            self._evict()
+            return wb_id, entry[0]
+
+    def get(self, wb_id=None):
+        """Handler for wb_id (the active workbook when None); None if not registered."""
+        if self.shared_dir:
+            self._sync_active()
+        with self._lock:
+            if wb_id is None:
+                wb_id = self.active_id
+            entry = self._entries.get(wb_id)
+            if entry is not None:
+                self._entries.move_to_end(wb_id)
+                return entry[0]
+        shared_path = self._shared_path(wb_id)
+        if shared_path and os.path.exists(shared_path):
+            loaded_id, handler = self.load(shared_path)
+            if loaded_id == wb_id:
+                return handler
+        return None
+
+    def active(self):
+        """Id of the active workbook, the one get() serves when no id is given."""
+        if self.shared_dir:
+            self._sync_active()
+        with self._lock:
+            return self.active_id
+
+    def __contains__(self, wb_id):
+        with self._lock:
+            return wb_id in self._entries
+
+    def latest(self, filename):
+        """Id of the workbook last loaded under filename, None if it is not (or no longer) held."""
+        with self._lock:
+            wb_id = self._latest.get(filename)
+            return wb_id if wb_id in self._entries else None
+
+    def list(self):
+        with self._lock:
+            return [
+                {"id": wb_id, "filename": filename, "size": size, "active": wb_id == self.active_id}
+                for wb_id, (_, filename, size) in reversed(self._entries.items())
+            ]
+
+    def _shared_path(self, wb_id):
+        if not self.shared_dir or not wb_id or not WORKBOOK_ID_RE.fullmatch(wb_id):
+            return None
+        return os.path.join(self.shared_dir, wb_id + '.xlsx')
+
+    def _publish(self, file_path, wb_id):
+        """
+        Place a copy of the file in shared_dir as <id>.xlsx. Not a hard link:
+        a source overwritten in place (a watched file) would change it too.
+        """
+        target = self._shared_path(wb_id)
+        if os.path.exists(target):
+            return target
+        os.makedirs(self.shared_dir, exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(file_path, tmp_path)
+        os.replace(tmp_path, target)
+        return target
+
+    def _activate(self, wb_id):
+        """Make wb_id the active workbook, for all processes when shared. Call with the lock held."""
+        self.active_id = wb_id
+        if not self.shared_dir:
+            return
+        active_path = os.path.join(self.shared_dir, ACTIVE_FILE)
+        tmp_path = f"{active_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(wb_id)
+        os.replace(tmp_path, active_path)
+        self._active_stamp = self._stat_active()
+
+    def _stat_active(self):
+        try:
+            st = os.stat(os.path.join(self.shared_dir, ACTIVE_FILE))
+        except FileNotFoundError:
+            return None
+        # os.replace gives every write a new inode, so this changes on each activation
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _sync_active(self):
+        """Adopt an activation written by another process, if any."""
+        stamp = self._stat_active()
+        if stamp is None or stamp == self._active_stamp:
+            return
+        try:
+            with open(os.path.join(self.shared_dir, ACTIVE_FILE)) as f:
+                wb_id = f.read().strip()
+        except FileNotFoundError:
+            return
+        shared_path = self._shared_path(wb_id)
+        if not shared_path or not os.path.exists(shared_path):
+            return
+        with self._lock:
+            known = wb_id in self._entries
+        if not known:
+            wb_id, _ = self.load(shared_path)
+        with self._lock:
+            if wb_id in self._entries:
+                self.active_id = wb_id
+            self._active_stamp = stamp
+
+    def _evict(self):
+        total = sum(size for _, _, size in self._entries.values())
+        for wb_id in list(self._entries):
+            if len(self._entries) <= self.max_workbooks and total <= self.max_bytes:
+                break
+            if wb_id == self.active_id:
+                continue
+            total -= self._entries.pop(wb_id)[2]
+        # Memoized results are only reachable through a loaded workbook
+        RESULT_CACHE.retain(set().union(*(handler.cache_versions() for handler, _, _ in self._entries.values())))
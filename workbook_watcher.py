@@ -0,0 +1,140 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:     # Windows: a single process serves, so there is no one to share the watch with
+    fcntl = None
+
+from workbook_registry import workbook_id
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class WorkbookWatcher:
+    """
+    Re-ingests workbook files changed on disk: the given files and the
+    .xlsx files of the given folders, polled every `interval` seconds.
+
+    A change is acted on once the file has stopped changing for one poll,
+    so a file being copied in is never read half-written. A changed file
+    goes through IngestJobs like an upload, replacing the workbook last
+    loaded under its name: only its changed sheets are recompiled, and it
+    becomes active only if the version it replaces was active, so in-flight
+    requests finish on the old snapshot. Files whose content is already
+    registered or being ingested (an upload through the API) are skipped;
+    new files are registered without being activated.
+
+    With lock_path set, one process at a time watches (gunicorn workers
+    share the result through the registry's shared folder).
+    """
+
+    def __init__(self, registry, ingest_jobs, files=(), folders=(), interval=None, lock_path=None):
+        if interval is None:
+            interval = float(os.environ.get('SHP_WATCH_INTERVAL', 2))
+        self.registry = registry
+        self.ingest_jobs = ingest_jobs
+        self.files = [os.path.abspath(p) for p in files]
+        self.folders = [os.path.abspath(p) for p in folders]
+        self.interval = interval
+        self.lock_path = lock_path
+        self._seen = {}        # path -> stamp at the last poll
+        self._handled = {}     # path -> stamp last acted on
+        self._primed = False
+        self._pid = None
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start polling in a daemon thread, once per process (threads do not survive a fork)."""
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._lock_file = None
+            self._seen, self._handled, self._primed = {}, {}, False
+            threading.Thread(target=self._run, name='workbook-watcher', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self._acquire():
+                    self.poll()
+            except Exception as e:
+                print(f"Workbook watcher: {e}")
+
+    def _acquire(self):
+        """Whether this process is the watching one, taking the watch when it is free."""
+        if self._lock_file is not None or not self.lock_path or fcntl is None:
+            return True
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        f = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _candidates(self):
+        paths = list(self.files)
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except OSError:
+                continue
+            for name in names:
+                # Skip hidden files and Excel's ~$ lock files
+                if name.lower().endswith('.xlsx') and not name.startswith(('.', '~$')):
+                    paths.append(os.path.join(folder, name))
+        return paths
+
+    def poll(self):
+        """One scan; returns the jobs submitted for changed files."""
+        jobs = []
+        seen = {}
+        for path in self._candidates():
+            stamp = _stamp(path)
+            if stamp is None:
+                continue
+            seen[path] = stamp
+            if not self._primed:
+                self._handled[path] = stamp
+            elif stamp == self._seen.get(path) and stamp != self._handled.get(path):
+                self._handled[path] = stamp
+                job = self._reload(path)
+                if job is not None:
+                    jobs.append(job)
+        self._seen = seen
+        self._handled = {path: stamp for path, stamp in self._handled.items() if path in seen}
+        self._primed = True
+        return jobs
+
+    def _reload(self, path):
+        filename = os.path.basename(path)
+        try:
+            wb_id = workbook_id(path)
+        except OSError:
+            return None
+        previous_id = self.registry.latest(filename)
+        if wb_id == previous_id or self.ingest_jobs.pending(wb_id):
+            return None
+        if wb_id in self.registry:
+            # Back to content that is still loaded: just switch to it
+            if previous_id is not None and previous_id == self.registry.active_id:
+                self.registry.load(path, filename, activate=True)
+            return None
+        if previous_id is None:
+            return self.ingest_jobs.submit(path, filename, activate=False)
+        return self.ingest_jobs.submit(path, filename, replaces=previous_id)